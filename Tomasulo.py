@@ -1,17 +1,36 @@
 # @file:            Tomasulo.py
 # @authors:         Stephen, Yihao
 
+import json
+import os
+from contextlib import redirect_stdout
+
 # Subclasses
-from src.IntegerALU import IntegerALU
-from src.ReservationStation import ReservationStation
+from src.FUClass import buildFUClasses, uniqueStations
+from src.Operations import OPERATIONS, renameIdiom
+from src.SelectPolicy import SelectPolicy
 from src.InstructionQueue import InstructionQueue
+from src.FetchUnit import FetchUnit
+from src.LoopBuffer import LoopBuffer
 from src.ROB import ROB
 from src.BranchUnit import BranchUnit
 from src.MemoryUnit import MemoryUnit
+from src.MemoryBacking import createBacking, saveImage
 from src.RAT import RAT
 from src.ARF import ARF
+from src.PhysicalRegisterFile import PhysicalRegisterFile
 from src.LdStQ import LdStQ
-from src.FPALU import FPAdder, FPMultiplier
+from src.Epochs import Epochs
+from src.StoreSets import StoreSets
+from src.Cache import Cache
+from src.Occupancy import Occupancy
+from src.Profiler import Profiler
+from src.PipelineTrace import openTrace
+from src.InflightWindow import InflightWindow
+from src.RetireLog import RetireLog
+from src.TimingTrace import TraceDriver, recordTrace, readTrace
+from src.StallCounters import StallCounters, ISSUED, ROB_FULL, ROB_FULL_MEM, LDSTQ_FULL, \
+    BRANCH_LIMIT, PRF_FULL, RECOVERY, ICACHE, FETCH, DRAIN
 
 
 class Tomasulo:
@@ -21,13 +40,17 @@ class Tomasulo:
     Given a valid input, the object will be ready to run after instantiation.  Call the runSimulation() method to initiate the simulations.
 
     @input inputFileName A string representing the full path to the desired input file for simulation.
+    @input options An optional dictionary of hardware parameters (see DEFAULT_OPTIONS in src/helpers.py) which override those in the input file.
+    @input backing An optional memory backing shared with other cores, in place of the one described by the input file.
+    @input bus An optional CoherentBus joining this core's memory accesses to those of other cores.
+    @input coreID An optional integer identifying this core on the bus.
     @return A valid Tomasulo object with the characteristics described in the input file.  Returns None and throws exceptions if the initiation fails.
 
     Usage:
     myTomasuloObject = Tomasulo(myInputFileName)
     """
 
-    def __init__(self, inputFileName):
+    def __init__(self, inputFileName, options=None, backing=None, bus=None, coreID=0):
         print("Initialization")
         try:
             from src.helpers import getParameters
@@ -35,57 +58,164 @@ class Tomasulo:
             # Validate input and parse instance parameters
             self.Params = getParameters(inputFileName)
             self.Params["InputFile"] = inputFileName
+            if options is not None:
+                self.Params.update(options)
 
             print(self.Params)
 
-            # Track completion record for output
-            self.output = {}
+            # Track stage timings of in-flight instructions, every one of
+            # which holds a ROB entry, and stream committed ones to disk
+            self.window = InflightWindow(self.Params["ROBEntries"])
+            self.retireLog = RetireLog(self.Params["RetireLog"], self.Params["RetireLogFormat"])
 
             # Instantiate Instruction Queue
             self.IQ = InstructionQueue(self.Params["Instructions"])
 
+            # Optionally drive the timing from a recorded trace instead of
+            # computing values, recording it first if there is none yet
+            self.driver = None
+            if self.Params["TimingTrace"]:
+                if not os.path.exists(self.Params["TimingTrace"]):
+                    recordTrace(self.Params, self.Params["TimingTrace"])
+                self.driver = TraceDriver(readTrace(self.Params["TimingTrace"], self.Params))
+
+            # Track squashed instructions, shared by every pipeline structure
+            self.epochs = Epochs()
+            squashed = self.epochs.isSquashed
+
+            # Optional data cache, a CacheSize of 0 disables it.  Misses cost
+            # the memory latency unless a penalty is given.
+            self.cache = None
+            if self.Params["CacheSize"] > 0:
+                self.cache = Cache(self.Params["CacheSize"],
+                                   self.Params["CacheAssoc"],
+                                   self.Params["CacheLineSize"],
+                                   self.Params["CacheHitLatency"],
+                                   self.Params["CacheMissPenalty"] or self.Params["LoadStoreUnit"][2],
+                                   MSHRs=self.Params["CacheMSHRs"],
+                                   replacement=self.Params["CacheReplacement"])
+
+            # Memory contents, dense for small memories and paged for large
+            # sparse ones, optionally loaded in bulk from a binary image.  A
+            # MemorySize of 0 sizes the memory to the image.  Cores of a
+            # multi-core run share the first one's.
+            if backing is None:
+                backing = createBacking(self.Params["MemoryBacking"],
+                                        self.Params["MemorySize"] // 4,
+                                        self.Params["MemoryImage"])
+
             # Instantiate Memory
-            self.memory = MemoryUnit(self.Params["LoadStoreUnit"][2])
+            self.memory = MemoryUnit(self.Params["LoadStoreUnit"][2],
+                                     ports=self.Params["MemPorts"],
+                                     banks=self.Params["MemBanks"],
+                                     pipelined=bool(self.Params["MemPipelined"]),
+                                     bankBusy=self.Params["MemBankBusy"],
+                                     cache=self.cache,
+                                     backing=backing,
+                                     values=self.driver is None,
+                                     bus=bus,
+                                     coreID=coreID)
             for byteAddress, value in self.Params["MemInitData"]:
                 self.memory.mem_write(byteAddress, value)
 
-            #Instantiate Load and Store Queue
-            self.LDSTQ = LdStQ(self.Params["LoadStoreUnit"][0], self.Params["LoadStoreUnit"][1], self.memory)
+            # Memory dependence prediction for loads passing older stores
+            if self.Params["LoadSpeculation"] not in ("storeset", "always", "never"):
+                raise ValueError(f"Unknown load speculation mode [ {self.Params['LoadSpeculation']} ]")
+            self.storeSets = None
+            if self.Params["LoadSpeculation"] == "storeset":
+                self.storeSets = StoreSets(self.Params["StoreSetEntries"])
 
-            # Instantiate ROB, RAT, ARF
-            self.ROB = ROB(self.Params["ROBEntries"])
-            self.ARF = ARF(initVals = self.Params["RegFileInitData"] if len(self.Params["RegFileInitData"])>0 else None)
+            #Instantiate Load and Store Queue
+            self.LDSTQ = LdStQ(self.Params["LoadStoreUnit"][0], self.Params["LoadStoreUnit"][1], self.memory,
+                              squashed=squashed, predictor=self.storeSets,
+                              speculate=self.Params["LoadSpeculation"] != "never")
+
+            # Instantiate ROB, RAT, ARF.  When renaming to a physical
+            # register file, it holds every value and stands in for the ARF,
+            # with as many registers as the ROB can rename by default
+            if self.Params["RenameMode"] not in ("rob", "prf"):
+                raise ValueError(f"Unknown rename mode [ {self.Params['RenameMode']} ]")
+            initVals = self.Params["RegFileInitData"] if len(self.Params["RegFileInitData"])>0 else None
+            if self.driver is not None:
+                # Every value is 0 when driven by a trace
+                initVals = None
+            self.PRF = None
+            if self.Params["RenameMode"] == "prf":
+                self.PRF = PhysicalRegisterFile(self.Params["PhysRegs"] or 64 + self.Params["ROBEntries"],
+                                                initVals=initVals)
+            self.ROB = ROB(self.Params["ROBEntries"], physical=self.PRF is not None)
+            self.ARF = self.PRF if self.PRF is not None else ARF(initVals=initVals)
             self.RAT = RAT()
 
-            # Instantiate RS for each type of FU with the specific size
-            self.RS_ALUIs = ReservationStation(self.Params["ALUI"][0],'Integer ALU')
-            self.RS_ALUFPs = ReservationStation(self.Params["ALUFP"][0], 'FP ALU')
-            self.RS_MULTFPs = ReservationStation(self.Params["MULTFP"][0], 'FP Multiplier')
-
-            # Instantiate FUs
-            # Integer ALUs
-            self.ALUIs = [IntegerALU(self.Params["ALUI"][1],1) for i in range(self.Params["ALUI"][-1])]
-
-            # Get latency of FP Unit from file
-            latency = {}
-            latency["MULT.D"] = self.Params["MULTFP"][1]
-            latency["ADD.D"] = self.Params["ALUFP"][1]
-            latency["SUB.D"] = self.Params["ALUFP"][1]
+            # Zero idioms and moves can be resolved at rename, taking no RS,
+            # FU or CDB slot.  Moves wait on the tag of the value they copy,
+            # and without a PRF the values of eliminated instructions are
+            # kept by their ROB tag, since the ROB is only read at its head.
+            self.eliminate = bool(self.Params["MoveElimination"])
+            self.pendingMoves = {}
+            self.knownValues = {}
 
-            # FP Adder
-            self.ALUFPs = [FPAdder(latency,1,3) for i in range(self.Params["ALUFP"][-1])]
+            # Instantiate each class of FUs with its RS, from the file header
+            # and any further classes described in the FUConfig file
+            self.FUClasses = buildFUClasses(self.Params, squashed=squashed,
+                                            evaluate=self.driver.evaluate if self.driver is not None else None)
+            # The classes' RSs, one shared station when unified
+            self.stations = uniqueStations(self.FUClasses)
 
-            # FP Multipliers
-            self.MULTFPs = [FPMultiplier(latency,1,3) for i in range(self.Params["MULTFP"][-1])]
+            # Which ready instructions each class starts first
+            self.select = SelectPolicy(self.Params["SelectPolicy"], self.Params["SelectSeed"])
 
             # Instantiate Branch Unit
-            self.branch = BranchUnit()
-
-            # Track time as cycles
+            self.branch = BranchUnit(maxCopies=self.Params["MaxBranches"],
+                                     BTBEntries=self.Params["BTBEntries"],
+                                     RASEntries=self.Params["RASEntries"])
+
+            # Instantiate the front end, with an optional instruction cache
+            # whose misses cost the memory latency unless a penalty is given
+            self.icache = None
+            if self.Params["ICacheSize"] > 0:
+                self.icache = Cache(self.Params["ICacheSize"],
+                                    self.Params["ICacheAssoc"],
+                                    self.Params["ICacheLineSize"],
+                                    0,
+                                    self.Params["ICacheMissPenalty"] or self.Params["LoadStoreUnit"][2],
+                                    MSHRs=1,
+                                    name="Instruction cache")
+            self.fetchUnit = FetchUnit(self.IQ, self.branch,
+                                       width=self.Params["FetchWidth"],
+                                       bufferSize=self.Params["FetchBuffer"],
+                                       icache=self.icache,
+                                       redirectPenalty=self.Params["FetchRedirectPenalty"],
+                                       loopBuffer=LoopBuffer(self.Params["LoopBufferSize"])
+                                       if self.Params["LoopBufferSize"] > 0 else None)
+
+            # Recover the RAT from checkpoints, or by walking back the ROB
+            if self.Params["RecoveryMode"] not in ("checkpoint", "walk"):
+                raise ValueError(f"Unknown recovery mode [ {self.Params['RecoveryMode']} ]")
+            self.walkRecovery = self.Params["RecoveryMode"] == "walk"
+
+            # Track time as cycles, and what each stage spent them on
             self.cycle = 0
-
-            # Track PCnext offset to assist with branching
-            self.fetchOffset = 0
+            self.stalls = StallCounters()
+            self.occupancy = Occupancy()
+            # Look up every histogram once, so sampling builds no names.  Units
+            # without an output buffer or a pipeline never hold anything there.
+            self.ROBHistogram = self.occupancy.histogram("ROB")
+            self.RSHistograms = [(RS, self.occupancy.histogram(f"RS {RS.name}")) for RS in self.stations]
+            self.LdStQHistogram = self.occupancy.histogram("LdStQ")
+            self.fetchHistogram = self.occupancy.histogram("Fetch buffer")
+            self.PRFHistogram = (self.occupancy.histogram("Physical registers")
+                                 if self.PRF is not None else None)
+            self.FUHistograms = []
+            for fuClass in self.FUClasses:
+                for i, FU in enumerate(fuClass.units):
+                    name = f"{fuClass.key}{i}"
+                    self.occupancy.unit(name)
+                    bufferHistogram = (self.occupancy.histogram(f"{name} output buffer")
+                                       if FU.bufferLen > 0 else None)
+                    pipelineHistogram = (self.occupancy.histogram(f"{name} pipeline")
+                                         if fuClass.pipelined and FU.pipeline.maxlen > 0 else None)
+                    self.FUHistograms.append((FU, name, bufferHistogram, pipelineHistogram))
 
             # Dumb way to kick out when we are done
             self.done = False
@@ -94,6 +224,22 @@ class Tomasulo:
             self.saveRAT = False
             self.RATBID = 0
 
+            # Optionally stream every instruction's life to a pipeline viewer
+            self.trace = None
+            if self.Params["TraceFile"]:
+                self.trace = openTrace(self.Params["TraceFile"], self.Params["TraceFormat"])
+
+            # Optionally time each stage of the simulator itself
+            self.profiler = None
+            if self.Params["Profile"] or self.Params["ProfileOutput"]:
+                self.profiler = Profiler(useCProfile=bool(self.Params["ProfileOutput"]))
+                for name in ["issueStage", "executeStage", "checkBranchStage",
+                             "checkMemoryOrderStage", "memoryStage", "writebackStage",
+                             "commitStage", "advanceTime", "updateExitConditions",
+                             "sampleOccupancy", "dumpAll"]:
+                    setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+                self.fetchUnit.fetchStage = self.profiler.wrap("fetchStage", self.fetchUnit.fetchStage)
+
         except FileNotFoundError:
             print("ERROR: Invalid filename, please check the filename and path")
             return None
@@ -104,57 +250,121 @@ class Tomasulo:
         Begins the simulation defined by the input file provided at instantiation
         """
         print("Beginning Simulation")
+        if self.profiler is not None:
+            self.profiler.start()
+
+        if self.Params["Verbose"]:
+            self.simulate()
+        else:
+            # Keep the per-cycle trace out of long runs
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                self.simulate()
 
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.finish()
 
+
+    def finish(self):
+        """
+        Writes the outputs and statistics of a run which has finished
+        """
+        if self.trace is not None:
+            self.trace.close(self.cycle)
+
+        self.writeOutput()
+        self.retireLog.close()
+        if self.Params["MemoryDump"]:
+            saveImage(self.memory.backing, self.Params["MemoryDump"])
+        squashedIssued = self.squashedIssued()
+        self.stalls.dumpStats(squashedIssued)
+        self.occupancy.dumpStats()
+        self.fetchUnit.dumpStats()
+        if self.icache is not None:
+            self.icache.dumpStats()
+        self.LDSTQ.dumpStats()
+        if self.cache is not None:
+            self.cache.dumpStats()
+        if self.profiler is not None:
+            self.profiler.dumpStats(self.cycle, self.stalls.get("commit", "committed"))
+            if self.Params["ProfileOutput"]:
+                self.profiler.write(self.Params["ProfileOutput"])
+        if self.Params["StatsFile"]:
+            self.writeStats(self.Params["StatsFile"])
+        print("Simulation Complete")
+
+
+    def simulate(self):
+        """
+        Runs cycles until the program has finished
+        """
         while not self.done:
-            print(''.ljust(80,'='))
-            print(f" Cycle {self.cycle}".ljust(48, '=').rjust(80,'='))
-            print(''.rjust(80,'='))
+            self.step()
+
 
-            # Log state
+    def step(self):
+        """
+        Runs one cycle of every pipeline stage
+        """
+        print(''.ljust(80,'='))
+        print(f" Cycle {self.cycle}".ljust(48, '=').rjust(80,'='))
+        print(''.rjust(80,'='))
+
+        # Log state
+        if self.Params["Verbose"]:
             self.dumpAll()
 
-            # Allow MMU to do its work
-            self.LDSTQ.checkMMU()
+        # Allow MMU to do its work
+        self.LDSTQ.checkMMU()
 
-            # Try to issue new instructions
-            print("ISSUE")
-            self.issueStage()
+        # Fill the fetch buffer
+        print("FETCH")
+        self.fetchUnit.fetchStage(self.cycle)
 
-            # Try to execute ready instructions
-            print("EXECUTE")
-            self.executeStage()
+        # Try to issue new instructions
+        print("ISSUE")
+        self.issueStage()
 
-            # Gather and process any branch outcomes
-            print("BRANCHCHECK")
-            self.checkBranchStage()
+        # Try to execute ready instructions
+        print("EXECUTE")
+        self.executeStage()
 
-            # Try to write back load results
-            print("MEMORY")
-            self.memoryStage()
+        # Gather and process any branch outcomes
+        print("BRANCHCHECK")
+        self.checkBranchStage()
 
-            # Try to write back FU results
-            print("WRITEBACK")
-            self.writebackStage()
+        # Replay any load which read memory ahead of an aliasing store
+        print("MEMORYORDER")
+        self.checkMemoryOrderStage()
 
-            # Try to commit
-            print("COMMIT")
-            self.commitStage()
+        # Try to write back load results
+        print("MEMORY")
+        self.memoryStage()
 
-            # Advance time
-            self.advanceTime()
+        # Try to write back FU results
+        print("WRITEBACK")
+        self.writebackStage()
 
-            # Update termination conditions
-            self.updateExitConditions()
+        # Try to commit
+        print("COMMIT")
+        self.commitStage()
 
-            # copy RAT if needed
-            if self.saveRAT:
-                self.branch.saveRAT(self.RATBID, self.RAT.getState())
-                self.saveRAT = False
+        # Sample how full each structure ended the cycle
+        self.sampleOccupancy()
+        if self.trace is not None:
+            self.trace.issueStall(self.stalls.last["issue"], self.cycle)
 
+        # Advance time
+        self.advanceTime()
 
-        self.writeOutput()
-        print("Simulation Complete")
+        # Update termination conditions
+        self.updateExitConditions()
+
+        # copy RAT if needed
+        if self.saveRAT:
+            if not (self.walkRecovery or self.epochs.isSquashed(self.RATBID)):
+                self.branch.saveRAT(self.RATBID, self.RAT.getCheckpoint())
+            self.saveRAT = False
 
 
     def advanceTime(self):
@@ -162,16 +372,83 @@ class Tomasulo:
         Increment the wall time for the system clock and all helper classes
         """
         self.cycle += 1
-        for FU in self.ALUIs:
-            FU.advanceTime()
-        for FU in self.ALUFPs:
-            FU.advanceTime()
-        for FU in self.MULTFPs:
-            FU.advanceTime()
+        for fuClass in self.FUClasses:
+            fuClass.advanceTime()
         self.LDSTQ.advanceTime()
         self.memory.advanceTime()
 
 
+    def sampleOccupancy(self):
+        """
+        Records the occupancy of every queue and buffer, and which functional
+        units were busy, for the current cycle
+        """
+        occupancy = self.occupancy
+        occupancy.tick()
+        occupancy.add(self.ROBHistogram, self.ROB.count())
+        for RS, histogram in self.RSHistograms:
+            occupancy.add(histogram, len(RS.q))
+        occupancy.add(self.LdStQHistogram, len(self.LDSTQ.q))
+        occupancy.add(self.fetchHistogram, len(self.fetchUnit.buffer))
+        if self.PRFHistogram is not None:
+            occupancy.add(self.PRFHistogram, self.PRF.inUse())
+        busy = occupancy.busy
+        for FU, name, bufferHistogram, pipelineHistogram in self.FUHistograms:
+            inFlight = FU.inFlight()
+            if inFlight > 0:
+                busy[name] += 1
+            if bufferHistogram is not None:
+                occupancy.add(bufferHistogram, len(FU.buffer))
+            if pipelineHistogram is not None:
+                occupancy.add(pipelineHistogram, inFlight)
+
+
+    def squashedIssued(self):
+        """
+        Getter for how many issued instructions were later squashed, as every
+        issued instruction either committed or was squashed
+        """
+        return self.stalls.get("issue", ISSUED) - self.stalls.get("commit", "committed")
+
+
+    def getStats(self):
+        """
+        Getter for every statistic gathered during the run
+
+        @return A dictionary of the statistics of each structure
+        """
+        squashedIssued = self.squashedIssued()
+        stats = {"cycles": self.cycle,
+                 "committed": self.stalls.get("commit", "committed"),
+                 "stalls": self.stalls.counts,
+                 "topDown": self.stalls.topDown(squashedIssued),
+                 "occupancy": self.occupancy.getStats(),
+                 "fetch": self.fetchUnit.getStats(),
+                 "loadForwarding": self.LDSTQ.getStats(),
+                 "memoryUnit": {"bankConflicts": self.memory.bankConflicts}}
+        if self.icache is not None:
+            stats["icache"] = self.icache.getStats()
+        if self.cache is not None:
+            stats["dcache"] = self.cache.getStats()
+        if self.profiler is not None:
+            stats["profile"] = self.profiler.getStats(self.cycle, stats["committed"])
+        if self.eliminate:
+            stats["eliminated"] = {"zeroIdioms": self.stalls.get("rename", "zero idiom eliminated"),
+                                   "moves": self.stalls.get("rename", "move eliminated")}
+        return stats
+
+
+    def writeStats(self, fileName):
+        """
+        Writes every statistic gathered during the run to a JSON file
+
+        @param fileName A string representing the path to write
+        @return None
+        """
+        with open(fileName, 'w') as statsFile:
+            json.dump(self.getStats(), statsFile, indent=2)
+
+
     def updateOutput(self, ID, stage):
         """
         Fills in the current time for the given instruction ID in the given
@@ -183,29 +460,31 @@ class Tomasulo:
         @return None
         """
         # We store Issue, execute, memory, writeback, commit
-        if not ID in self.output:
-            self.output[ID] = [self.cycle, None, None, None, None]
-        else:
-            self.output[ID][stage] = self.cycle
+        if stage == 0:
+            self.window.issue(ID, self.cycle)
+        elif self.window.update(ID, stage, self.cycle):
+            if self.trace is not None:
+                self.trace.stage(ID, stage, self.cycle)
+            # Committed records only go to the retirement log
+            if stage == 4:
+                self.retireLog.append(ID, self.window.remove(ID))
+                if self.driver is not None:
+                    self.driver.retire(ID)
 
 
     def dumpAll(self):
-        for FU in self.ALUIs:
-            FU.dump()
-        for FU in self.ALUFPs:
-            FU.dump()
-        for FU in self.MULTFPs:
-            FU.dump()
-        self.RS_ALUIs.dump()
-        self.RS_ALUFPs.dump()
-        self.RS_MULTFPs.dump()
+        for fuClass in self.FUClasses:
+            fuClass.dump()
+        for RS in self.stations:
+            RS.dump()
         self.ROB.dump()
         self.ARF.dump()
         #self.RAT.dump()
         self.memory.dump()
         self.IQ.dump()
+        self.fetchUnit.dump()
         self.LDSTQ.dump()
-        print("\n".join([ f"{k}:{v}" for k,v in self.output.items()]))
+        self.window.dump()
 
 
     def writeOutput(self):
@@ -220,10 +499,14 @@ class Tomasulo:
             # Write the instruction stage tracking
             outFile.write("Instruction Completion Table".ljust(48,'=').rjust(80,'='))
             outFile.write("\nID\t| IS\t\t EX\t\t MEM\t\t WB\t\t COM\n")
-            for inst, stages in self.output.items():
+            for inst, stages in self.retireLog.read():
                 outFile.write(f"{inst}\t| {stages[0]}\t\t {stages[1]}\t\t {stages[2]}\t\t {stages[3]}\t\t {stages[4]}\n")
             outFile.write("\n")
 
+            if self.driver is not None:
+                outFile.write("Register and memory values are not computed when driven by a timing trace\n")
+                return
+
             # Write the register file
             outFile.write("Integer ARF".ljust(48, '=').rjust(80,'='))
             outFile.write('\n')
@@ -248,7 +531,7 @@ class Tomasulo:
             # write the nonzero sections of memory
             outFile.write("Memory Unit".ljust(48, '=').rjust(80,'='))
             outFile.write('\n')
-            entries = [(str(i),x) for i,x in enumerate(self.memory.memory) if ((x > 0.0) or (x < 0.0)) ]
+            entries = [(str(i),x) for i,x in self.memory.contents()]
             newLine = False
             for address, contents in entries:
                 outFile.write(f"Word {address.rjust(2,'0')}: {contents:.6f} ".ljust(40,' '))
@@ -263,18 +546,12 @@ class Tomasulo:
 
         @param ID An integer representing the instruction ID to check
         @return True if the instruction reached its last non-None stage in
-        this cycle, False otherwise.
+        this cycle, False otherwise, including once it has left the window.
 
         This is used to prevent an instruction from executing in the same stage
         in which it was issued.
         """
-        # find most recent stage
-        stage = None
-        for i in range(5):
-            stage = self.output[ID][4-i]
-            if stage is not None:
-                break
-        return stage == self.cycle
+        return self.window.lastCycle(ID) == self.cycle
 
 
     def updateExitConditions(self):
@@ -282,88 +559,124 @@ class Tomasulo:
         We are done if there are no new instructions and no in-flight
         instructions
         """
-        nothingToFetch = self.IQ.empty(offset=self.fetchOffset)
-        stillExecuting = sum([1 for x in self.output.values() if x[4] is None])
+        nothingToFetch = self.fetchUnit.empty()
+        # Committed stores may still be writing to memory
+        stillExecuting = self.ROB.count() or self.LDSTQ.pendingStores()
         if nothingToFetch and not stillExecuting:
             self.done = True
 
 
+    def findFUClass(self, op):
+        """
+        Finds the FU class to issue an operation to, the first performing it
+        whose RS has room
+
+        @param op A string representing the operation
+        @return A tuple of the class with room, or None if every RS is full,
+        and the first class performing the operation
+
+        Raises ValueError if no class performs the operation
+        """
+        candidates = [x for x in self.FUClasses if x.accepts(op)]
+        if not candidates:
+            raise ValueError(f"No functional unit performs [ {op} ]")
+        for fuClass in candidates:
+            if not fuClass.RS.isFull():
+                return fuClass, candidates[0]
+        return None, candidates[0]
+
+
     def issueStage(self):
         """
-        Attempts to issue the next instruction in the Instruction Queue
+        Attempts to issue the next instruction in the fetch buffer
         """
 
-        if self.IQ.empty(offset=self.fetchOffset):
+        # Peek at the head of the fetch buffer
+        nextName = self.fetchUnit.peek()
+        if nextName is None:
+            cause = self.fetchUnit.stalled(self.cycle)
+            if cause == "redirectStalls":
+                self.stalls.add("issue", RECOVERY)
+            elif cause == "icacheStalls":
+                self.stalls.add("issue", ICACHE)
+            elif self.IQ.empty():
+                self.stalls.add("issue", DRAIN)
+            else:
+                self.stalls.add("issue", FETCH)
             return
 
         if not self.ROB.isFull():
-            # Peek at PC
-            nextName = self.IQ.peek(offset=self.fetchOffset)[1]
 
             print(f"NEXT INST {nextName}")
 
+            # Branches and stores do not rename a destination, everything
+            # else needs a free physical register when there is a PRF
+            writesRegister = not (nextName.startswith('B') or nextName == 'SD')
+            eliminated = False
+            if writesRegister and self.PRF is not None and not self.PRF.canAllocate():
+                self.stalls.add("issue", PRF_FULL)
+                return
+
             # Check that the relevant RS is not full
             # Fetch actual instruction
             if (nextName == "LD" or nextName == "SD"):
                 if not self.LDSTQ.isFull():
-                    nextInst = self.IQ.fetch(offset=self.fetchOffset)
-                    self.fetchOffset = 0
+                    nextInst = self.fetchUnit.pop()
                 else:
+                    self.stalls.add("issue", LDSTQ_FULL)
                     return
 
-            elif (nextName == "ADD.D") or (nextName == "SUB.D"):
-                if not self.RS_ALUFPs.isFull():
-                    nextInst = self.IQ.fetch(offset=self.fetchOffset)
-                    self.fetchOffset = 0
-                else:
-                    return
+            elif self.eliminate and renameIdiom(self.fetchUnit.peekInstruction()) is not None:
+                # Resolved at rename, so no RS entry is needed
+                eliminated = True
+                nextInst = self.fetchUnit.pop()
 
-            elif (nextName == "MULT.D"):
-                if not self.RS_MULTFPs.isFull():
-                    nextInst = self.IQ.fetch(offset=self.fetchOffset)
-                    self.fetchOffset = 0
-                else:
+            else:
+                fuClass, firstClass = self.findFUClass(nextName)
+                if fuClass is None:
+                    self.stalls.add("issue", f"RS full ({firstClass.RS.name})")
                     return
-
-            elif (nextName == "BNE") or (nextName == "BEQ"):
-                if not self.RS_ALUIs.isFull():
+                if nextName.startswith('B'):
+                    if not self.branch.canSpeculate():
+                        self.stalls.add("issue", BRANCH_LIMIT)
+                        return
                     # Store a copy of the RAT
-                    #self.branch.saveRAT(self.IQ.peek(offset=self.fetchOffset)[0], self.RAT.getState())
-                    nextInst = self.IQ.fetch(offset=self.fetchOffset)
+                    nextInst = self.fetchUnit.pop()
                     self.saveRAT = True
                     self.RATBID = nextInst[0]
-                    predictTaken = self.branch.predict(nextInst[0])
+                    # The branch was predicted when it was fetched
+                    predictTaken, decodedTarget = nextInst[3], nextInst[4]
                     if predictTaken:
                         print("PREDICTING TAKEN, INSTRUCTION ",nextInst[0])
-                        # update global fetch offset to branch target
-                        self.fetchOffset = int(nextInst[1][3])
-                        print(f"BRANCH, updating offset to {self.fetchOffset}")
-                        # store PC in case of misprediction
-                        self.branch.setMispredictTarget(nextInst[0],self.IQ.next)
                     else:
                         print("PREDICTING NOT TAKEN, INSTRUCTION ",nextInst[0])
-                        self.fetchOffset = 0
-                        print(f"BRANCH, updating offset to {self.fetchOffset}")
-                        # store target in case of misprediction
-                        self.branch.setMispredictTarget(nextInst[0], self.IQ.next + int(nextInst[1][3]))
+                    # store the prediction in case of misprediction
+                    self.branch.track(nextInst[0], nextInst[2], predictTaken, decodedTarget)
                 else:
-                    return
-            else:
-                if not self.RS_ALUIs.isFull():
-                    nextInst = self.IQ.fetch(offset=self.fetchOffset)
-                    self.fetchOffset = 0
-                    print(f"Fetched ALU inst : {nextInst[1][0]}")
-                else:
-                    return
+                    nextInst = self.fetchUnit.pop()
+                    print(f"Fetched {fuClass.name} inst : {nextInst[1][0]}")
 
             print("Next inst: ", nextInst)
 
-            # Add the entry to the ROB
-            ROBId = self.ROB.add(nextInst[0],nextInst[1][1])
+            # Add the entry to the ROB, tagging results with their physical
+            # register if there is a PRF
+            tag = None
+            if writesRegister and self.PRF is not None:
+                tag = self.PRF.allocate()
+            ROBId = self.ROB.add(nextInst[0], nextInst[1][1], writesRegister, tag=tag)
+            if tag is not None:
+                ROBId = tag
+            elif self.knownValues:
+                self.knownValues.pop(ROBId, None)
 
             # Prepare an entry for the RS
             entry = [nextInst[0], ROBId, nextInst[1][0], None, None, None, None]
 
+            # Match the instruction to its record when driven by a trace
+            address = None
+            if self.driver is not None:
+                address = self.driver.issue(nextInst[0], nextInst[2], nextInst[1], nextInst[3])
+
             # Check if operands are ready now and update
             # Special case for branches:
             if nextName.startswith('B'):
@@ -412,8 +725,12 @@ class Tomasulo:
                         entry[1] = float(self.ROB.q[self.ROB.head][2])
 
                     if f"ROB{self.ROB.head}" == entry[3]:
-                        entry[3] = 4* int(self.ROB.q[self.ROB.head][2])
+                        entry[3] = int(self.ROB.q[self.ROB.head][2])
 
+                # The base register holds 0, so the recorded address takes
+                # the place of the offset
+                if address is not None:
+                    entry[4] = address
 
             else:
                 # Update operands per the RAT
@@ -443,26 +760,136 @@ class Tomasulo:
                         entry[4] = None
                         entry[6] = self.ROB.q[self.ROB.head][2]
 
+            if self.PRF is not None or self.knownValues:
+                self.readReadyOperands(entry, nextName)
 
             # Update RAT if not a branch or store
-            if not (nextName.startswith('B') or nextName == 'SD'):
+            if writesRegister:
                 self.RAT.set(nextInst[1][1], ROBId)
 
             #self.RAT.dump()
 
             # Add the entry to the RS
-            if(nextName == "ADD.D" or nextName == "SUB.D"):
-                self.RS_ALUFPs.add(*entry)
-            elif(nextName == "MULT.D"):
-                self.RS_MULTFPs.add(*entry)
-            elif(nextName == 'SD' or nextName == 'LD'):
-                self.LDSTQ.add(entry[0], entry[2], entry[1], entry[3], entry[4])
+            if(nextName == 'SD' or nextName == 'LD'):
+                self.LDSTQ.add(entry[0], entry[2], entry[1], entry[3], entry[4], nextInst[2])
                 print("LDSTQ:", self.LDSTQ.q)
-            else:
-                self.RS_ALUIs.add(*entry)
+            elif not eliminated:
+                fuClass.RS.add(*entry)
 
             # Log the issue in the output dictionary
             self.updateOutput(entry[0], 0)
+            self.epochs.issue(entry[0])
+            if self.trace is not None:
+                self.trace.issue(entry[0], nextInst[2], nextInst[1], self.cycle)
+            self.stalls.add("issue", ISSUED)
+            if eliminated:
+                self.eliminateAtRename(entry, nextInst[1])
+
+        else:
+            headID = self.ROB.q[self.ROB.head][0]
+            if any(x[0] == headID for x in self.LDSTQ.q):
+                self.stalls.add("issue", ROB_FULL_MEM)
+            else:
+                self.stalls.add("issue", ROB_FULL)
+
+
+    def readReadyOperands(self, entry, nextName):
+        """
+        Reads the operands of an issuing instruction whose values are already
+        known.  Results stay readable in a physical register file from
+        writeback on, not only while their entry is the ROB head, as do the
+        results of instructions eliminated at rename.
+
+        @param entry A list representing the RS entry being issued
+        @param nextName A string representing the operation
+        """
+        if nextName == 'SD' or nextName == 'LD':
+            if isinstance(entry[3], str) and self.isValueReady(entry[3]):
+                entry[3] = int(self.readValue(entry[3]))
+            if nextName == 'SD' and isinstance(entry[1], str) and self.isValueReady(entry[1]):
+                entry[1] = float(self.readValue(entry[1]))
+        else:
+            for tag, value in ((3, 5), (4, 6)):
+                if entry[tag] is not None and self.isValueReady(entry[tag]):
+                    entry[value] = self.readValue(entry[tag])
+                    entry[tag] = None
+
+
+    def isValueReady(self, tag):
+        """
+        Checks if the value of a tag can be read at issue
+        """
+        if self.PRF is not None:
+            return self.PRF.isReady(tag)
+        return tag in self.knownValues
+
+
+    def readValue(self, tag):
+        """
+        Reads the value of a tag for which isValueReady() holds
+        """
+        if self.PRF is not None:
+            return self.PRF.read(tag)
+        return self.knownValues[tag]
+
+
+    def eliminateAtRename(self, entry, instruction):
+        """
+        Resolves a zero idiom or move without executing it.  A zero idiom, or
+        a move whose operand is already known, completes now; any other move
+        completes when the value it copies is broadcast.
+
+        @param entry A list representing the RS entry which was not issued
+        @param instruction A tuple representing the decoded instruction
+        """
+        idiom = renameIdiom(instruction)
+        if idiom == "zero":
+            self.stalls.add("rename", "zero idiom eliminated")
+            self.completeAtRename(entry[0], OPERATIONS[entry[2]](0, 0))
+            return
+        self.stalls.add("rename", "move eliminated")
+        waitingOn = entry[idiom + 1]
+        if waitingOn is None:
+            self.completeAtRename(entry[0], OPERATIONS[entry[2]](entry[5], entry[6]))
+        else:
+            self.pendingMoves.setdefault(waitingOn, []).append(entry)
+
+
+    def resolveMoves(self, name, value):
+        """
+        Completes the eliminated moves waiting on a tag whose value was just
+        broadcast, skipping squashed ones
+
+        @param name A string representing the tag
+        @param value The value broadcast
+        """
+        for entry in self.pendingMoves.pop(name, []):
+            if self.epochs.isSquashed(entry[0]):
+                continue
+            for tag, slot in ((3, 5), (4, 6)):
+                if entry[tag] == name:
+                    entry[tag] = None
+                    entry[slot] = value
+            self.completeAtRename(entry[0], OPERATIONS[entry[2]](entry[5], entry[6]))
+
+
+    def completeAtRename(self, ID, value):
+        """
+        Writes the result of an eliminated instruction, without using the
+        CDB, and wakes anything waiting on it
+        """
+        if self.PRF is not None:
+            dest, name = self.ROB.complete(ID)
+            self.PRF.write(name, value)
+        else:
+            dest, name = self.ROB.findAndUpdateEntry(ID, value)
+            self.knownValues[name] = value
+        print(f"Eliminated {ID} at rename, {dest} is {value}")
+        for RS in self.stations:
+            RS.update(name, value)
+        self.LDSTQ.update(name, value)
+        self.updateOutput(ID, 3)
+        self.resolveMoves(name, value)
 
 
     def executeStage(self):
@@ -471,23 +898,21 @@ class Tomasulo:
         ready to execute
         """
 
-        # Enumerate a list of ready instructions
-        ready_ALUIs = [x for x in self.RS_ALUIs.q if ( (x[5] is not None) and
-                                                       (x[6] is not None) and
-                                                       (not x[7]) and
-                                                       (not self.isNew(x[0])))]
-        ready_ALUFPs = [x for x in self.RS_ALUFPs.q if ( (x[5] is not None) and
-                                                         (x[6] is not None) and
-                                                         (not x[7]) and
-                                                         (not self.isNew(x[0])))]
-        ready_MULTFPs = [x for x in self.RS_MULTFPs.q if ( (x[5] is not None) and
-                                                           (x[6] is not None) and
-                                                           (not x[7]) and
-                                                           (not self.isNew(x[0])))]
+        # Enumerate a list of ready instructions for each class of FU, from
+        # the operations it performs when the RS is shared
+        ready = [[x for x in fuClass.RS.q if ( (x[5] is not None) and
+                                               (x[6] is not None) and
+                                               (not x[7]) and
+                                               fuClass.accepts(x[2]) and
+                                               (not self.isNew(x[0])) and
+                                               (not self.epochs.isSquashed(x[0])))]
+                 for fuClass in self.FUClasses]
 
         #Compute value in LDSTQ and store the memory address in x[3]
         if not self.LDSTQ.busy():
             for i, entry in enumerate(self.LDSTQ.q):
+                if self.epochs.isSquashed(entry[0]):
+                    continue
                 if not self.isNew(entry[0]):
                     if isinstance(entry[3], int) and not entry[5]:
                         self.LDSTQ.executeStage(i)
@@ -498,10 +923,13 @@ class Tomasulo:
                         print(f"INSTRUCTION NOT READY: {entry}")
         else:
             print("LDSTQ BUSY")
+            self.stalls.add("execute", "FU busy (LdStQ address)")
 
         # Allow stores to proceed by marking them as ready in the ROB if all
         # the addresses are ready
         for entry in self.LDSTQ.q:
+            if self.epochs.isSquashed(entry[0]):
+                continue
             if entry[1]=='SD' and self.LDSTQ.instructionReady(entry):
                 for rb in self.ROB.q:
                     if rb[0] == entry[0] and not rb[3]:
@@ -511,124 +939,184 @@ class Tomasulo:
         # Mark executed instructions for cleanup
         markAsExecuting = []
 
-        # Attempt to issue each instruction on an available unit
-        curPos = 0
-        for i, FU in enumerate(self.ALUIs):
-            if curPos >= len(ready_ALUIs):
-                break
-            if not FU.busy():
-                FU.execute( ready_ALUIs[curPos][0],
-                            ready_ALUIs[curPos][2],
-                            int(ready_ALUIs[curPos][5]),
-                            int(ready_ALUIs[curPos][6])
-                )
-                self.updateOutput(ready_ALUIs[curPos][0], 1)
-                markAsExecuting.append(ready_ALUIs[curPos][0])
-                curPos += 1
-
-        curPos = 0
-        for i, FU in enumerate(self.ALUFPs):
-            if curPos >= len(ready_ALUFPs):
-                break
-            if not FU.busy():
-                FU.execute( ready_ALUFPs[curPos][0],
-                            ready_ALUFPs[curPos][2],
-                            ready_ALUFPs[curPos][5],
-                            ready_ALUFPs[curPos][6])
-                self.updateOutput(ready_ALUFPs[curPos][0], 1)
-                markAsExecuting.append(ready_ALUFPs[curPos][0])
-                curPos += 1
-
-        curPos = 0
-        for i, FU in enumerate(self.MULTFPs):
-            if curPos >= len(ready_MULTFPs):
-                break
-            if not FU.busy():
-                FU.execute( ready_MULTFPs[curPos][0],
-                            ready_MULTFPs[curPos][2],
-                            ready_MULTFPs[curPos][5],
-                            ready_MULTFPs[curPos][6])
-                self.updateOutput(ready_MULTFPs[curPos][0], 1)
-                markAsExecuting.append(ready_MULTFPs[curPos][0])
-                curPos += 1
+        # Attempt to issue each instruction on an available unit, in the
+        # order of the select policy
+        graph = None
+        for fuClass, readyEntries in zip(self.FUClasses, ready):
+            # An operation several classes perform may have started already
+            readyEntries[:] = [x for x in readyEntries if x[0] not in markAsExecuting]
+            if len(readyEntries) > 1:
+                if graph is None and self.select.needsGraph:
+                    graph = self.consumerGraph()
+                readyEntries[:] = self.select.order(readyEntries, fuClass.ops, graph)
+            curPos = 0
+            for FU in fuClass.units:
+                if curPos >= len(readyEntries):
+                    break
+                if not FU.busy():
+                    FU.execute( readyEntries[curPos][0],
+                                readyEntries[curPos][2],
+                                readyEntries[curPos][5],
+                                readyEntries[curPos][6])
+                    self.updateOutput(readyEntries[curPos][0], 1)
+                    markAsExecuting.append(readyEntries[curPos][0])
+                    curPos += 1
+
+        # Record why each kind of unit did not start more work
+        for fuClass, readyEntries in zip(self.FUClasses, ready):
+            RS = fuClass.RS
+            started = len([x for x in readyEntries if x[0] in markAsExecuting])
+            if started < len(readyEntries):
+                self.stalls.add("execute", f"FU busy ({RS.name})")
+            elif started == 0 and any(not x[7] and fuClass.accepts(x[2]) and not self.epochs.isSquashed(x[0])
+                                      for x in RS.q):
+                self.stalls.add("execute", f"no ready instruction ({RS.name})")
 
         for item in markAsExecuting:
             # Don't check, just blindly call since IDs are unique
-            self.RS_ALUIs.markAsExecuting(item)
-            self.RS_ALUFPs.markAsExecuting(item)
-            self.RS_MULTFPs.markAsExecuting(item)
+            for RS in self.stations:
+                RS.markAsExecuting(item)
 
 
-    def checkBranchStage(self):
-        """
-        Checks to see if the most recent ALUI result is a branch, and if so
-        processes the result, and checks for misprediction
+    def consumerGraph(self):
         """
-        for FU in self.ALUIs:
-            if FU.isBranchOutcomePending():
-                print("EVALUATING BRANCH OUTCOME")
-                BID, outcome = FU.getResult()
-                prediction = self.branch.predict(BID)
-                if outcome != prediction:
-                    # signal branch rollback
-                    print(f"BRANCH MISPREDICTION, INSTRUCTION {BID}")
-
-                    print("OLD RAT")
-                    self.RAT.dump()
-
-                    # Recover RAT and associated branch instruction ID
-                    self.RAT.reg = self.branch.rollBack(BID)
+        Maps each ROB tag to the instructions waiting on it, for the select
+        policies which look at dependences
 
-                    print("NEW RAT")
-                    self.RAT.dump()
-
-                    # Clear RS for speculative instructions
-                    self.RS_ALUIs.purgeAfterMispredict(BID)
-                    self.RS_ALUFPs.purgeAfterMispredict(BID)
-                    self.RS_MULTFPs.purgeAfterMispredict(BID)
-
-                    # Clear speculative instructions in all FUs
-                    for funcU in self.ALUIs:
-                        funcU.purgeAfterMispredict(BID)
-
-                    for funcU in self.ALUFPs:
-                        funcU.purgeAfterMispredict(BID)
-
-                    for funcU in self.MULTFPs:
-                        funcU.purgeAfterMispredict(BID)
-
-                    self.LDSTQ.purgeAfterMispredict(BID)
+        @return A dictionary mapping tags to lists of (latency, tag of the
+        consumer's own result or None)
+        """
+        graph = {}
+        for RS in self.stations:
+            for entry in RS.q:
+                if self.epochs.isSquashed(entry[0]):
+                    continue
+                latency = 0
+                for fuClass in self.FUClasses:
+                    if fuClass.accepts(entry[2]):
+                        latency = fuClass.ops[entry[2]]
+                        break
+                for tag in (entry[3], entry[4]):
+                    if isinstance(tag, str):
+                        graph.setdefault(tag, []).append((latency, entry[1]))
+        # Loads pass their value on after address generation and memory,
+        # stores end a chain
+        addressLatency = self.Params["LoadStoreUnit"][1]
+        loadLatency = addressLatency + self.Params["LoadStoreUnit"][2]
+        for entry in self.LDSTQ.q:
+            if self.epochs.isSquashed(entry[0]):
+                continue
+            if entry[1] == 'LD':
+                if isinstance(entry[3], str):
+                    dest = entry[2] if isinstance(entry[2], str) else None
+                    graph.setdefault(entry[3], []).append((loadLatency, dest))
+            else:
+                for tag in (entry[2], entry[3]):
+                    if isinstance(tag, str):
+                        graph.setdefault(tag, []).append((addressLatency, None))
+        return graph
 
-                    print("CLEARING ROB")
-                    self.ROB.dump()
 
-                    # Clear ROB entries after branch
-                    self.ROB.purgeAfterMispredict(BID)
+    def checkBranchStage(self):
+        """
+        Checks to see if the most recent result of any unit which resolves
+        branches is a branch, and if so processes the result, and checks for
+        misprediction
+        """
+        for fuClass in self.FUClasses:
+            if not fuClass.branches:
+                continue
+            for FU in fuClass.units:
+                if FU.isBranchOutcomePending():
+                    print("EVALUATING BRANCH OUTCOME")
+                    BID, outcome = FU.getResult()
+                    PC, prediction, recoveryPC, takenTarget = self.branch.getRecord(BID)
+
+                    # Since we pulled the result, handle the ROB bookkeeping
+                    dest, name = self.ROB.findAndUpdateEntry(BID, outcome)
+                    fuClass.RS.remove(BID)
+
+                    if outcome != prediction:
+                        # signal branch rollback
+                        print(f"BRANCH MISPREDICTION, INSTRUCTION {BID}")
+
+                        print("OLD RAT")
+                        self.RAT.dump()
+
+                        # Recover RAT and associated branch instruction ID
+                        if self.walkRecovery:
+                            self.RAT.reset()
+                            for register, tag in self.ROB.walk(BID):
+                                self.RAT.set(register, tag)
+                        else:
+                            self.RAT.restore(self.branch.rollBack(BID))
+
+                        print("NEW RAT")
+                        self.RAT.dump()
+
+                        # Squash everything younger than the branch.  The RS, FUs
+                        # and LDSTQ drop squashed entries the next time they
+                        # touch them, so no structure is scanned here.
+                        self.epochs.squash(BID)
+                        self.branch.squash(BID)
+                        self.window.squash(BID)
+                        if self.driver is not None:
+                            self.driver.redirectAfter(BID)
+                        if self.trace is not None:
+                            self.trace.squash(BID, self.cycle)
+
+                        print("CLEARING ROB")
+
+                        # Clear ROB entries after branch
+                        if self.PRF is not None:
+                            for tag in self.ROB.tagsAfter(BID):
+                                self.PRF.free(tag)
+                        self.ROB.purgeAfterMispredict(name)
+
+                        self.ROB.dump()
+
+                        # Refetch from the true branch outcome
+                        self.fetchUnit.redirect(recoveryPC, self.cycle)
+                    else:
+                        print(f"PREDICTION {prediction} WAS CORRECT")
 
-                    self.ROB.dump()
+                    # Train the BTB with the resolved direction and taken target
+                    self.branch.update(PC, outcome, takenTarget)
 
-                    # Update fetch offset and PC per true branch outcome
-                    self.IQ.setPC(self.branch.getMispredictTarget(BID))
-                    self.fetchOffset = 0
 
-                    # Update branch outcome in branch unit
-                    if prediction:
-                        self.branch.update(BID, False)
-                    else:
-                        self.branch.update(BID, True)
-
-                    # Purge speculations from output
-                    dead = [x for x in self.output.keys() if x > BID]
-                    for deadEntry in dead:
-                        del self.output[deadEntry]
-                    print("OUTPUT")
-                    print(self.output)
-                else:
-                    print(f"PREDICTION {prediction} WAS CORRECT")
+    def checkMemoryOrderStage(self):
+        """
+        Checks if a store address resolved to the address of a younger load
+        which already read memory, and if so squashes from that load on and
+        fetches it again
+        """
+        violation = self.LDSTQ.getViolation()
+        if violation is None or self.epochs.isSquashed(violation[0]):
+            return
+        LID, PC = violation
+        print(f"MEMORY ORDER VIOLATION, INSTRUCTION {LID}")
+
+        # There is no checkpoint for a load, so rebuild the RAT from the ROB
+        self.RAT.reset()
+        for register, tag in self.ROB.walk(LID - 1):
+            self.RAT.set(register, tag)
+
+        # Squash the load and everything after it
+        self.epochs.squash(LID - 1)
+        self.branch.squash(LID - 1)
+        self.window.squash(LID - 1)
+        if self.driver is not None:
+            self.driver.replay(LID)
+        if self.trace is not None:
+            self.trace.squash(LID - 1, self.cycle)
+        if self.PRF is not None:
+            for tag in self.ROB.tagsAfter(LID - 1):
+                self.PRF.free(tag)
+        self.ROB.purgeFrom(self.ROB.find(LID))
+        self.ROB.dump()
 
-                # Since we pulled the result, handle the ROB bookkeeping
-                dest = self.ROB.findAndUpdateEntry(BID, outcome)
-                self.RS_ALUIs.remove(BID)
+        # Fetch the load again
+        self.fetchUnit.redirect(PC, self.cycle)
 
 
     def memoryStage(self):
@@ -642,11 +1130,15 @@ class Tomasulo:
             print("ISSUED A LOAD")
             self.updateOutput(ret,2)
         else:
-            # Attempt to issue any pending loads and mark output on success
+            # Attempt to issue any pending loads and mark output on success,
+            # as many as the memory ports accept
             ret = self.LDSTQ.issueReadyLoad()
-            if ret >= 0:
+            while ret >= 0:
                 print("ISSUED A LOAD")
                 self.updateOutput(ret, 2);
+                ret = self.LDSTQ.issueReadyLoad()
+            if self.LDSTQ.loadsWaitingForMemory():
+                self.stalls.add("memory", "memory busy")
 
 
     def writebackStage(self):
@@ -660,67 +1152,100 @@ class Tomasulo:
         self.LDSTQ.checkMMU()
 
         # Check if there are results ready, track the oldest ID seen (the
-        # smallest ID number)
+        # smallest ID number), in the first class of FUs with any result
         winningFU = None
-        oldestInst = 2**30
-        for FU in self.ALUIs:
-            if FU.isResultReady():
-                temp = FU.getResultID()
-                if temp < oldestInst:
-                    oldestInst = temp
-                    winningFU = FU
-
-        if winningFU is None:
-            for FU in self.ALUFPs:
-                if FU.isResultReady():
-                    temp = FU.getResultID()
-                    if temp < oldestInst:
-                        oldestInst = temp
-                        winningFU = FU
-
-        if winningFU is None:
-            for FU in self.MULTFPs:
-                if FU.isResultReady():
-                    temp = FU.getResultID()
-                    if temp < oldestInst:
-                        oldestInst = temp
-                        winningFU = FU
+        for fuClass in self.FUClasses:
+            oldest = fuClass.oldestResult()
+            if oldest is not None:
+                winningFU = oldest[1]
+                break
 
         # Check if a load is ready, if none of the above work
         if winningFU is None:
             if self.LDSTQ.isResultReady():
                 winningFU = self.LDSTQ
 
+        # Every other ready result lost the CDB this cycle
+        waiting = len([FU for fuClass in self.FUClasses for FU in fuClass.units if FU.isResultReady()])
+        waiting += 1 if self.LDSTQ.isResultReady() else 0
+        if waiting > 1:
+            self.stalls.add("writeback", "CDB conflict", waiting - 1)
+
         if winningFU is not None:
             # Fetch Result
             result = winningFU.getResult()
 
 
-            # Update ROB results
-            dest,name = self.ROB.findAndUpdateEntry(*result)
+            # Update ROB results, or with a PRF write the physical register
+            # and only mark the ROB entry done
+            if self.PRF is not None:
+                dest, name = self.ROB.complete(result[0])
+                self.PRF.write(name, result[1])
+            else:
+                dest,name = self.ROB.findAndUpdateEntry(*result)
 
             print(f"Writing back {result} to ROB Destination: {name}")
 
             # Update Reservation Stations
-            self.RS_ALUIs.update(name, result[1])
-            self.RS_ALUFPs.update(name, result[1])
-            self.RS_MULTFPs.update(name, result[1])
+            for RS in self.stations:
+                RS.update(name, result[1])
 
             # Update LDSTQ
             self.LDSTQ.update(name, result[1])
+            if self.pendingMoves:
+                self.resolveMoves(name, result[1])
 
             # Free old reservation station(just blindly call)
-            self.RS_ALUIs.remove(result[0])
-            self.RS_ALUFPs.remove(result[0])
-            self.RS_MULTFPs.remove(result[0])
+            for RS in self.stations:
+                RS.remove(result[0])
 
             # Update writeback cycle
             self.updateOutput(result[0], 3)
 
 
+    def trimEpochs(self):
+        """
+        Forgets the squash history older than every instruction still held,
+        so that it stays bounded however many squashes a run has.  The queues
+        which only drop squashed entries when full drop them first.
+        """
+        for RS in self.stations:
+            RS.dropSquashed()
+        self.LDSTQ.purgeSquashed()
+        for tag in list(self.pendingMoves):
+            self.pendingMoves[tag] = [x for x in self.pendingMoves[tag] if not self.epochs.isSquashed(x[0])]
+            if len(self.pendingMoves[tag]) == 0:
+                del self.pendingMoves[tag]
+
+        IDs = [self.epochs.lastIssued + 1, self.RATBID]
+        if self.ROB.count() > 0:
+            IDs.append(self.ROB.q[self.ROB.head][0])
+        for RS in self.stations:
+            IDs.extend(x[0] for x in RS.q)
+        for fuClass in self.FUClasses:
+            for FU in fuClass.units:
+                IDs.extend(FU.inFlightIDs())
+        IDs.extend(self.LDSTQ.heldIDs())
+        IDs.extend(x[1][0] for x in self.memory.inflight)
+        IDs.extend(x[0] for x in self.memory.buffer)
+        IDs.extend(self.memory.faults)
+        self.epochs.trim(min(IDs))
+
+
     def commitStage(self):
+        # Keep the squash history bounded
+        if self.epochs.needsTrim():
+            self.trimEpochs()
+
         # Check if the ROB head is ready, and if so grab the result
         resultID = self.ROB.canCommit()
+        if resultID is None:
+            if self.ROB.count() > 0:
+                self.stalls.add("commit", "head not done")
+            else:
+                self.stalls.add("commit", "ROB empty")
+        elif self.isNew(resultID):
+            self.stalls.add("commit", "head written back this cycle")
         if resultID is not None:
             # Verify that we didn't write back this cycle
             if not self.isNew(resultID):
@@ -734,17 +1259,20 @@ class Tomasulo:
                 if found:
                         ss = self.LDSTQ.issueReadyStore()
 
-                        if ss >= 0:
+                        if ss < 0:
+                            self.stalls.add("commit", "commit blocked by store")
+                        else:
+                            self.stalls.add("commit", "committed")
                             print(f"Committing instr. {resultID}")
 
                             # Reference ID, destination, value, doneflag, ROB#
                             #Before commit, check Every lables related to the to-be committed rob instruction has been substitued
-                            name = "ROB" + str(self.ROB.q[self.ROB.head][0])
-                            result = self.ROB.q[self.ROB.head][2]
-                            self.RS_ALUIs.update(name, result)
-                            self.RS_ALUFPs.update(name, result)
-                            self.RS_MULTFPs.update(name, result)
-                            self.LDSTQ.update(name, result)
+                            if self.PRF is None:
+                                name = f"ROB{self.ROB.head}"
+                                result = self.ROB.q[self.ROB.head][2]
+                                for RS in self.stations:
+                                    RS.update(name, result)
+                                self.LDSTQ.update(name, result)
 
                             result = self.ROB.commit()
 
@@ -764,23 +1292,31 @@ class Tomasulo:
                             self.updateOutput(resultID, 4)
 
                 else:
+                    self.memory.checkFault(resultID)
+                    self.stalls.add("commit", "committed")
                     print(f"Committing instr. {resultID}")
 
                     # Reference ID, destination, value, doneflag, ROB#
                     #Before commit, check Every lables related to the to-be committed rob instruction has been substitued
-                    name = "ROB" + str(self.ROB.q[self.ROB.head][0])
-                    result = self.ROB.q[self.ROB.head][2]
-                    self.RS_ALUIs.update(name, result)
-                    self.RS_ALUFPs.update(name, result)
-                    self.RS_MULTFPs.update(name, result)
-                    self.LDSTQ.update(name, result)
+                    #A physical register was read by every consumer at writeback or issue
+                    if self.PRF is None:
+                        name = f"ROB{self.ROB.head}"
+                        result = self.ROB.q[self.ROB.head][2]
+                        for RS in self.stations:
+                            RS.update(name, result)
+                        self.LDSTQ.update(name, result)
+                        if self.pendingMoves:
+                            self.resolveMoves(name, result)
+                        if self.knownValues:
+                            self.knownValues.pop(name, None)
 
                     result = self.ROB.commit()
 
                     print("ROB returned: ",result)
+                    tag = result[2] if self.PRF is not None else f"ROB{result[4]}"
 
                     # Check if the RAT should be updated
-                    if(self.RAT.get(result[1]) == f"ROB{result[4]}"):
+                    if(self.RAT.get(result[1]) == tag):
                         print(f"SETTING RAT {result[1]} to {result[1]}")
                         self.RAT.set(result[1], result[1])
                         # Broadcast results again?
@@ -793,10 +1329,19 @@ class Tomasulo:
                         print(f"RAT IS FINE FOR RESULT: {self.RAT.get(result[1])}")
                         print(f"RESULT SHOWS ROB{result[4]}")
 
-                    # Update ARF if this is not a branch
-                    if not isinstance(result[2], bool):
+                    # Update ARF if this is not a branch.  With a PRF the
+                    # value stays put and only the retirement map moves.
+                    if self.PRF is not None and isinstance(result[2], str):
+                        print(f"RETIRING {result[1]} to {result[2]}")
+                        self.PRF.commit(result[1], result[2])
+                        self.branch.retireMapping(result[1], tag)
+                    elif self.PRF is None and not isinstance(result[2], bool):
                         print(f"SETTING ARF {result[1]} to {result[2]}")
                         self.ARF.set(result[1], result[2])
+                        self.branch.retireMapping(result[1], tag)
+                    else:
+                        # Branch resolved correctly, free its bookkeeping
+                        self.branch.release(resultID)
 
                     self.RAT.dump()
 
@@ -806,13 +1351,139 @@ class Tomasulo:
 # End Class Tomasulo
 
 
+# Options naming a file each core of a multi-core run writes or reads alone
+CORE_FILE_OPTIONS = ["RetireLog", "TraceFile", "TimingTrace", "ProfileOutput"]
+
+
+def coreFileName(fileName, coreID):
+    """
+    Names the file of one core of a multi-core run
+
+    @param fileName A string representing the path given for every core
+    @param coreID An integer representing the core
+    @return A string representing the path with ".core<coreID>" before its
+    extension
+    """
+    root, extension = os.path.splitext(fileName)
+    return f"{root}.core{coreID}{extension}"
+
+
+class MultiCore:
+    """
+    This class runs several Tomasulo cores in lockstep, each on its own program, sharing one memory.
+
+    The memory contents are those described by the first input file, with every core's initial data written into them, and are dumped once at the end if any core names a MemoryDump.  Files written or read by a single core are named per core, "trace.kon" becoming "trace.core1.kon" for core 1.  Each core keeps its own load/store queue, memory ports and optional data cache, and a CoherentBus joins their accesses: the caches are kept coherent with MSI or MESI, and accesses which need the bus wait for it.  Values are exchanged through the shared memory when accesses complete.  No core detects a memory ordering violation caused by another.
+
+    @input inputFileNames A list of strings representing the input file of each core.
+    @input options An optional dictionary of hardware parameters applied to every core.
+    @return A valid MultiCore object with one core per input file.
+
+    Usage:
+    myMultiCore = MultiCore([firstFileName, secondFileName])
+    """
+
+    def __init__(self, inputFileNames, options=None):
+        from src.helpers import DEFAULT_OPTIONS, getParameters
+        from src.Coherence import CoherentBus
+        if len(set(inputFileNames)) != len(inputFileNames):
+            raise ValueError("Each core needs its own input file, their output files would collide")
+        options = dict(options) if options is not None else {}
+        self.bus = CoherentBus(len(inputFileNames),
+                               protocol=options.get("CoherenceProtocol", DEFAULT_OPTIONS["CoherenceProtocol"]),
+                               latency=options.get("BusLatency", DEFAULT_OPTIONS["BusLatency"]))
+        self.cores = []
+        for coreID, inputFileName in enumerate(inputFileNames):
+            backing = self.cores[0].memory.backing if coreID > 0 else None
+            # Resolve the per-core files before the core opens them
+            params = dict(getParameters(inputFileName), **options)
+            coreOptions = dict(options)
+            for key in CORE_FILE_OPTIONS:
+                if params[key]:
+                    coreOptions[key] = coreFileName(params[key], coreID)
+            self.cores.append(Tomasulo(inputFileName, coreOptions, backing=backing, bus=self.bus, coreID=coreID))
+
+        # The statistics of every core go to one file, and the shared memory
+        # is dumped once
+        self.statsFile = next((x.Params["StatsFile"] for x in self.cores if x.Params["StatsFile"]), "")
+        memoryDump = next((x.Params["MemoryDump"] for x in self.cores if x.Params["MemoryDump"]), "")
+        for core in self.cores:
+            core.Params["StatsFile"] = ""
+            core.Params["MemoryDump"] = ""
+        self.cores[0].Params["MemoryDump"] = memoryDump
+
+
+    def runSimulation(self):
+        """
+        Runs every core until all of their programs have finished
+        """
+        print("Beginning Simulation")
+        # Keep the per-cycle traces of the cores from interleaving
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            while not all(core.done for core in self.cores):
+                for core in self.cores:
+                    if core.done:
+                        continue
+                    if core.profiler is not None:
+                        core.profiler.start()
+                    core.step()
+                    if core.profiler is not None:
+                        core.profiler.stop()
+
+        for coreID, core in enumerate(self.cores):
+            print(f" Core {coreID} ".ljust(48, '#').rjust(80,'#'))
+            core.finish()
+        self.dumpStats()
+        if self.statsFile:
+            with open(self.statsFile, 'w') as statsFile:
+                json.dump(self.getStats(), statsFile, indent=2)
+
+
+    def getStats(self):
+        """
+        Getter for the statistics of every core, their aggregate throughput and the bus
+
+        @return A dictionary holding a list of the cores' statistics, the cycles until the last finished, the instructions committed by all of them and their IPC over those cycles
+        """
+        cycles = max(core.cycle for core in self.cores)
+        committed = sum(core.stalls.get("commit", "committed") for core in self.cores)
+        return {"cycles": cycles,
+                "committed": committed,
+                "IPC": committed / cycles if cycles > 0 else 0.0,
+                "bus": self.bus.getStats(),
+                "cores": [core.getStats() for core in self.cores]}
+
+
+    def dumpStats(self):
+        """
+        Pretty-prints the throughput of each core and of all of them together
+        """
+        stats = self.getStats()
+        print("Multi-core Throughput".ljust(48, '=').rjust(80,'='))
+        print("Core	Cycles	Committed	IPC")
+        for coreID, core in enumerate(stats["cores"]):
+            IPC = core["committed"] / core["cycles"] if core["cycles"] > 0 else 0.0
+            print(f"{coreID}\t{core['cycles']}\t{core['committed']}\t\t{IPC:.3f}")
+        print(f"All\t{stats['cycles']}\t{stats['committed']}\t\t{stats['IPC']:.3f}")
+        print()
+        self.bus.dumpStats()
+
+# End Class MultiCore
+
+
 # Run simulation by executing this script directly
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 2:
         print("No imput file provided!")
         print("\nUsage:")
-        print("\n\t$ python3 Tomasulo.py <testFilePath>\n")
+        print("\n\t$ python3 Tomasulo.py <testFilePath> [<testFilePath> ...] [Option=Value ...]\n")
+        print("Several input files run one core each, sharing memory.\n")
         sys.exit(1)
-    myCore = Tomasulo(sys.argv[1])
+    from src.helpers import parseOptions
+    inputFileNames = [x for x in sys.argv[1:] if '=' not in x]
+    options = parseOptions([x for x in sys.argv[1:] if '=' in x])
+    if len(inputFileNames) > 1:
+        myCore = MultiCore(inputFileNames, options)
+    else:
+        myCore = Tomasulo(inputFileNames[0], options)
     myCore.runSimulation()
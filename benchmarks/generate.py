@@ -0,0 +1,172 @@
+# @file         generate.py
+# @authors      Stephen
+
+import argparse
+import os
+import random
+import struct
+
+# Hardware description shared by every generated workload
+HEADER = """  # of rs Cycles in EX  Cycles in Mem # of FUs
+Integer adder 4 1   1
+FP adder  3 3   1
+FP multiplier 2 20    1
+Load/store unit 4 1 4 1
+ROB entries = 64
+CDB buffer entries = 1
+"""
+
+
+def fpChain(count, chainLength=4):
+    """
+    Builds a loop of dependent floating point operations
+
+    @param count An integer representing the target dynamic instruction count
+    @param chainLength An optional integer representing the dependent
+    operations per iteration, every fourth one a multiply
+    @return A tuple (initialization lines, instructions, memory image words)
+    """
+    body = [("MULT.D F2,F2,F6" if i % 4 == 3 else "ADD.D F2,F2,F4") for i in range(chainLength)]
+    body += ["ADDI R1,R1,-1", f"BNE R1,R0,{-(chainLength + 2)}"]
+    trips = max(1, count // len(body))
+    return [f"R1={trips},F4=1.0,F6=1.0"], body, None
+
+
+def aluStreams(count, streams=4):
+    """
+    Builds a loop of independent integer additions
+
+    @param count An integer representing the target dynamic instruction count
+    @param streams An optional integer representing the independent
+    accumulators updated per iteration
+    @return A tuple (initialization lines, instructions, memory image words)
+    """
+    body = [f"ADDI R{5 + i},R{5 + i},{i + 1}" for i in range(streams)]
+    body += ["ADDI R1,R1,-1", f"BNE R1,R0,{-(streams + 2)}"]
+    trips = max(1, count // len(body))
+    return [f"R1={trips}"], body, None
+
+
+def storeLoadForward(count):
+    """
+    Builds a loop where every load reads the value just stored, so its data
+    is forwarded from the store queue
+
+    @param count An integer representing the target dynamic instruction count
+    @return A tuple (initialization lines, instructions, memory image words)
+    """
+    body = ["SD F2,0(R3)",
+            "LD F4,0(R3)",
+            "ADD.D F2,F4,F6",
+            "ADDI R1,R1,-1",
+            "BNE R1,R0,-5"]
+    trips = max(1, count // len(body))
+    return [f"R1={trips},R3=8,F2=1.0,F6=0.5"], body, None
+
+
+def branchy(count, takenRate=0.5, patternLength=64, seed=0):
+    """
+    Builds nested loops whose inner branch follows a random pattern held in
+    memory, taken at the given rate
+
+    @param count An integer representing the target dynamic instruction count
+    @param takenRate An optional float between 0 and 1 representing how often
+    the data-dependent branch is taken
+    @param patternLength An optional integer representing the words in the
+    branch pattern
+    @param seed An optional integer seeding the pattern
+    @return A tuple (initialization lines, instructions, memory image words)
+    """
+    rng = random.Random(seed)
+    pattern = [0.0 if rng.random() < takenRate else 1.0 for i in range(patternLength)]
+    body = ["ADDI R2,R0,0",
+            f"ADDI R1,R0,{patternLength}",
+            "LD R5,0(R2)",
+            "ADDI R2,R2,4",
+            "BEQ R5,R0,1",
+            "ADDI R6,R6,1",
+            "ADDI R1,R1,-1",
+            "BNE R1,R0,-6",
+            "ADDI R7,R7,-1",
+            "BNE R7,R0,-10"]
+    perTrip = 4 + patternLength * (6 - takenRate)
+    trips = max(1, int(count // perTrip))
+    return [f"R7={trips}"], body, pattern
+
+
+def memoryStream(count, words=1024):
+    """
+    Builds nested loops which stream through an array, writing the running
+    sum to a second array
+
+    @param count An integer representing the target dynamic instruction count
+    @param words An optional integer representing the length of each array,
+    shortened so that small counts still make at least one pass
+    @return A tuple (initialization lines, instructions, memory image words)
+    """
+    words = max(1, min(words, (count - 4) // 6))
+    body = ["ADDI R2,R0,0",
+            f"ADDI R1,R0,{words}",
+            "LD F2,0(R2)",
+            "ADD.D F4,F4,F2",
+            f"SD F4,{4 * words}(R2)",
+            "ADDI R2,R2,4",
+            "ADDI R1,R1,-1",
+            "BNE R1,R0,-6",
+            "ADDI R7,R7,-1",
+            "BNE R7,R0,-10"]
+    trips = max(1, count // (4 + 6 * words))
+    data = [float(i % 7) for i in range(words)] + [0.0] * words
+    return [f"R7={trips}"], body, data
+
+
+# Every workload by name, with the parameters used by the suite
+WORKLOADS = {
+    "fpChain": (fpChain, {}),
+    "aluStreams": (aluStreams, {}),
+    "storeLoadForward": (storeLoadForward, {}),
+    "branchy10": (branchy, {"takenRate": 0.1}),
+    "branchy50": (branchy, {"takenRate": 0.5}),
+    "branchy90": (branchy, {"takenRate": 0.9}),
+    "memoryStream": (memoryStream, {}),
+}
+
+
+def writeWorkload(name, directory, count):
+    """
+    Writes the input file, and memory image if any, of a workload
+
+    @param name A string naming a workload in WORKLOADS
+    @param directory A string representing the directory to write to
+    @param count An integer representing the target dynamic instruction count
+    @return A string representing the path of the input file
+    """
+    function, params = WORKLOADS[name]
+    initLines, instructions, image = function(count, **params)
+    inputFile = os.path.join(directory, f"{name}.txt")
+    if image is not None:
+        imageFile = os.path.abspath(os.path.join(directory, f"{name}.bin"))
+        with open(imageFile, 'wb') as outFile:
+            outFile.write(struct.pack(f"<{len(image)}d", *image))
+        initLines = initLines + [f"MemoryImage={imageFile},MemorySize=0"]
+    with open(inputFile, 'w') as outFile:
+        outFile.write(HEADER)
+        for line in initLines:
+            outFile.write(line + "\n")
+        outFile.write("\n")
+        for instruction in instructions:
+            outFile.write(instruction + "\n")
+    return inputFile
+
+
+# Generate the suite by running this script directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the benchmark workloads")
+    parser.add_argument("--scale", type=int, default=100000,
+                        help="target dynamic instructions per workload")
+    parser.add_argument("--out", default="generated", help="directory to write to")
+    parser.add_argument("workloads", nargs="*", help="workloads to generate, all by default")
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    for name in args.workloads or WORKLOADS:
+        print(writeWorkload(name, args.out, args.scale))
@@ -0,0 +1,142 @@
+# @file         run.py
+# @authors      Stephen
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+# The simulator lives in the parent directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Tomasulo import Tomasulo
+from generate import WORKLOADS, writeWorkload
+
+
+def runWorkload(inputFile, options):
+    """
+    Simulates one workload without any console output
+
+    @param inputFile A string representing the path to the input file
+    @param options A dictionary of extra simulation options
+    @return A dictionary with the simulated cycles, committed instructions,
+    host seconds, simulated cycles per second and host nanoseconds per
+    instruction
+    """
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        core = Tomasulo(inputFile, dict(options, Verbose=0))
+        core.runSimulation()
+        seconds = time.perf_counter() - start
+    committed = core.stalls.get("commit", "committed")
+    return {"cycles": core.cycle,
+            "instructions": committed,
+            "seconds": seconds,
+            "cyclesPerSecond": core.cycle / seconds,
+            "nsPerInstruction": 1e9 * seconds / committed if committed > 0 else 0.0,
+            "IPC": committed / core.cycle if core.cycle > 0 else 0.0}
+
+
+def gitRevision():
+    """
+    Getter for the commit being benchmarked
+
+    @return A string representing the short commit hash, or "" outside git
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def loadHistory(fileName):
+    """
+    Reads the results of earlier runs
+
+    @param fileName A string representing the path to the history file,
+    holding one JSON record per line
+    @return A list of records, oldest first
+    """
+    if not os.path.exists(fileName):
+        return []
+    with open(fileName, 'r') as historyFile:
+        return [json.loads(line) for line in historyFile if line.strip()]
+
+
+def reference(history, name, scale, window=5):
+    """
+    Computes the speed to compare a workload against
+
+    @param history A list of records from earlier runs
+    @param name A string naming the workload
+    @param scale An integer representing the workload scale
+    @param window An optional integer representing how many recent runs to
+    take the median of
+    @return A tuple (cycles per second, simulated cycles) of the reference, or
+    None if the workload was never run at this scale
+    """
+    runs = [x["results"][name] for x in history if x["scale"] == scale and name in x["results"]]
+    if not runs:
+        return None
+    speeds = sorted(x["cyclesPerSecond"] for x in runs[-window:])
+    return speeds[len(speeds) // 2], runs[-1]["cycles"]
+
+
+# Run the suite by running this script directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the simulator's speed on the benchmark workloads")
+    parser.add_argument("--scale", type=int, default=100000,
+                        help="target dynamic instructions per workload")
+    parser.add_argument("--history", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl"),
+                        help="file the results are appended to and compared against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="slowdown, as a fraction, reported as a regression")
+    parser.add_argument("--no-record", action="store_true", help="do not append the results to the history")
+    parser.add_argument("options", nargs="*", help="workload names, or Key=Value simulation options")
+    args = parser.parse_args()
+
+    from src.helpers import parseOptions
+    names = [x for x in args.options if '=' not in x] or list(WORKLOADS)
+    options = parseOptions([x for x in args.options if '=' in x])
+    history = loadHistory(args.history)
+
+    results = {}
+    regressions = []
+    print("Workload".ljust(20, ' ') + "Instrs\tCycles\tIPC\tSeconds\tCycles/s\tns/instr")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            result = runWorkload(writeWorkload(name, directory, args.scale), options)
+            results[name] = result
+            line = (f"{name.ljust(20, ' ')}{result['instructions']}\t{result['cycles']}\t{result['IPC']:.2f}\t"
+                    f"{result['seconds']:.2f}\t{result['cyclesPerSecond']:.0f}\t\t{result['nsPerInstruction']:.0f}")
+            previous = None if options else reference(history, name, args.scale)
+            if previous is not None:
+                speed, cycles = previous
+                change = result["cyclesPerSecond"] / speed - 1
+                line += f"\t{100*change:+.1f}%"
+                if change < -args.tolerance:
+                    regressions.append(name)
+                    line += " REGRESSION"
+                if cycles != result["cycles"]:
+                    line += f" (was {cycles} cycles)"
+            print(line)
+
+    # Runs with non-default options are not comparable, so are not recorded
+    if not args.no_record and not options:
+        with open(args.history, 'a') as historyFile:
+            historyFile.write(json.dumps({"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                                          "revision": gitRevision(),
+                                          "python": platform.python_version(),
+                                          "scale": args.scale,
+                                          "results": results}) + "\n")
+
+    if regressions:
+        print(f"Slower than the recent median by more than {100*args.tolerance:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
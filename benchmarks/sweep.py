@@ -0,0 +1,51 @@
+# @file         sweep.py
+# @authors      Stephen
+
+import argparse
+import itertools
+import tempfile
+
+from run import runWorkload
+from generate import WORKLOADS, writeWorkload
+
+
+def settings(options):
+    """
+    Expands options whose values are comma separated lists into every
+    combination of single values
+
+    @param options A list of "Key=Value" or "Key=Value,Value,..." strings
+    @return A list of lists of "Key=Value" strings, one per combination
+    """
+    choices = []
+    for option in options:
+        key, _, values = option.partition('=')
+        choices.append([f"{key}={value}" for value in values.split(',')])
+    return [list(x) for x in itertools.product(*choices)]
+
+
+# Run the sweep by running this script directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare simulated cycles across option settings, "
+                                                 "e.g. SelectPolicy=oldest,latency,critical,random")
+    parser.add_argument("--scale", type=int, default=20000,
+                        help="target dynamic instructions per workload")
+    parser.add_argument("options", nargs="*",
+                        help="workload names, or Key=Value options with comma separated values to sweep")
+    args = parser.parse_args()
+
+    from src.helpers import parseOptions
+    names = [x for x in args.options if '=' not in x] or list(WORKLOADS)
+    combinations = settings([x for x in args.options if '=' in x])
+    labels = [" ".join(x) or "defaults" for x in combinations]
+
+    print("Cycles (IPC) per workload")
+    print("Workload".ljust(20, ' ') + "\t".join(x.ljust(24, ' ') for x in labels))
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            inputFile = writeWorkload(name, directory, args.scale)
+            cells = []
+            for combination in combinations:
+                result = runWorkload(inputFile, parseOptions(combination))
+                cells.append(f"{result['cycles']} ({result['IPC']:.2f})".ljust(24, ' '))
+            print(name.ljust(20, ' ') + "\t".join(cells))
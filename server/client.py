@@ -0,0 +1,94 @@
+# @file         client.py
+# @authors      Stephen
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# The simulator lives in the parent directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.helpers import parseOptions
+from jobserver import LINE_LIMIT
+
+# Messages which end a job
+FINAL = ("result", "error", "cancelled", "timeout")
+
+
+async def submit(inputFile, options, host="127.0.0.1", port=8765, path=None, timeout=None,
+                 cancelAfter=None, retries=10, delay=1.0):
+    """
+    Submits one job to a job server and prints its messages until it ends
+
+    @param inputFile A string representing the path to the input file
+    @param options A dictionary of extra simulation options
+    @param host An optional string representing the server's TCP address
+    @param port An optional integer representing the server's TCP port
+    @param path An optional string representing the server's Unix socket,
+    used instead of TCP
+    @param timeout An optional number of seconds the job may run
+    @param cancelAfter An optional integer, cancel the job after this many
+    progress messages
+    @param retries An optional integer representing how many times to
+    submit again while the server is busy
+    @param delay An optional number of seconds to wait between submissions
+    @return A dictionary, the final message of the job
+    """
+    with open(inputFile, 'r') as inFile:
+        program = inFile.read()
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path, limit=LINE_LIMIT)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+    request = {"type": "submit", "program": program, "options": options, "tag": inputFile}
+    if timeout is not None:
+        request["timeout"] = timeout
+    try:
+        progress = 0
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("The job server closed the connection")
+            message = json.loads(line)
+            if message["type"] == "result":
+                print(message["output"])
+                print(f"Cycles: {message['cycles']}, committed: {message['committed']}, IPC: {message['IPC']:.3f}")
+            else:
+                print(message)
+            if message["type"] == "busy" and retries > 0:
+                retries -= 1
+                await asyncio.sleep(delay)
+                writer.write((json.dumps(request) + "\n").encode())
+                await writer.drain()
+            elif message["type"] == "progress":
+                progress += 1
+                if progress == cancelAfter:
+                    writer.write((json.dumps({"type": "cancel", "job": message["job"]}) + "\n").encode())
+                    await writer.drain()
+            elif message["type"] in FINAL or message["type"] == "busy":
+                return message
+    finally:
+        writer.close()
+
+
+# Submit a job by running this script directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Submit a simulation job to a local job server")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP address of the server")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port of the server")
+    parser.add_argument("--unix", default=None, help="Unix socket of the server, instead of TCP")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds the job may run")
+    parser.add_argument("--cancel-after", type=int, default=None,
+                        help="cancel the job after this many progress messages")
+    parser.add_argument("inputFile", help="input file to simulate")
+    parser.add_argument("options", nargs="*", help="Key=Value options")
+    args = parser.parse_args()
+
+    final = asyncio.run(submit(args.inputFile, parseOptions(args.options), args.host, args.port, args.unix,
+                               args.timeout, args.cancel_after))
+    sys.exit(0 if final["type"] == "result" else 1)
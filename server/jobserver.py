@@ -0,0 +1,342 @@
+# @file         jobserver.py
+# @authors      Stephen
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+# The simulator lives in the parent directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Tomasulo import Tomasulo
+from src.helpers import DEFAULT_OPTIONS, getParameters
+
+# Options naming files on the server, which a job may not set
+FILE_OPTIONS = ["MemoryImage", "MemoryDump", "StatsFile", "ProfileOutput", "TraceFile",
+                "RetireLog", "TimingTrace", "FUConfig"]
+
+# A job's input file, inside its own temporary directory
+JOB_FILE = "job.txt"
+
+# Longest message line in bytes, results carry the whole output file
+LINE_LIMIT = 64 * 1024 * 1024
+
+
+def checkOptions(options):
+    """
+    Validates the options of a job
+
+    @param options A dictionary of option names and values
+    @return None
+
+    Raises ValueError on unknown options and options naming files
+    """
+    if not isinstance(options, dict):
+        raise ValueError("Options must be a JSON object")
+    for key, value in options.items():
+        if key not in DEFAULT_OPTIONS:
+            raise ValueError(f"Unknown option [ {key} ]")
+        if key in FILE_OPTIONS and value != DEFAULT_OPTIONS[key]:
+            raise ValueError(f"Option [ {key} ] names a file on the server")
+
+
+def runJob(jobID, program, options, timeout, progressInterval, events, cancelled):
+    """
+    Simulates one job in a worker process, posting its progress as it goes
+
+    @param jobID An integer representing the job
+    @param program A string holding the contents of an input file
+    @param options A dictionary of extra simulation options
+    @param timeout A number of seconds the simulation may take, or None
+    @param progressInterval An integer representing the cycles between
+    progress messages and checks for cancellation or timeout
+    @param events A queue shared with the server for progress messages
+    @param cancelled A dictionary shared with the server, holding the IDs of
+    cancelled jobs
+    @return A dictionary, the final message of the job
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    with tempfile.TemporaryDirectory() as directory:
+        inputFile = os.path.join(directory, JOB_FILE)
+        with open(inputFile, 'w') as outFile:
+            outFile.write(program)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            # Option lines of the program are checked like the job's own
+            params = getParameters(inputFile)
+            checkOptions({x: params[x] for x in FILE_OPTIONS})
+            core = Tomasulo(inputFile, dict(options, Verbose=0))
+            while not core.done:
+                core.step()
+                if core.cycle % progressInterval == 0:
+                    events.put({"type": "progress", "job": jobID, "cycle": core.cycle,
+                                "committed": core.stalls.get("commit", "committed")})
+                    if jobID in cancelled:
+                        return {"type": "cancelled", "job": jobID}
+                    if deadline is not None and time.monotonic() > deadline:
+                        return {"type": "timeout", "job": jobID, "cycle": core.cycle}
+            core.finish()
+        with open(os.path.join(directory, JOB_FILE[:JOB_FILE.find('.')] + "_output.txt"), 'r') as outFile:
+            output = outFile.read()
+    stats = core.getStats()
+    return {"type": "result", "job": jobID,
+            "cycles": stats["cycles"],
+            "committed": stats["committed"],
+            "IPC": stats["committed"] / stats["cycles"] if stats["cycles"] > 0 else 0.0,
+            "stats": stats,
+            "output": output}
+
+
+class JobServer:
+    """
+    This class serves simulation jobs to local clients over newline
+    delimited JSON, running them on a bounded pool of worker processes.
+
+    Requests, one JSON object per line:
+        {"type": "submit", "program": <input file text>, "options": {...},
+         "timeout": <seconds>, "tag": <any>}
+        {"type": "cancel", "job": <job ID>}
+        {"type": "status"}
+
+    A submitted job is answered with "accepted" and its job ID, then streams
+    "progress" messages while it runs and ends with exactly one of "result",
+    "error", "cancelled" or "timeout".  When the queue of waiting jobs is
+    full, a submission is answered with "busy" and the client should retry
+    later.  A submission's tag, if any, is echoed in every message about the
+    job.  Jobs of a client which disconnects are cancelled.
+    """
+
+    def __init__(self, workers=2, queueSize=16, progressInterval=1000, timeout=None):
+        """
+        Constructor for the JobServer class
+
+        @param workers An optional integer representing the number of worker
+        processes, and so of jobs running at once
+        @param queueSize An optional integer representing how many accepted
+        jobs may wait for a worker
+        @param progressInterval An optional integer representing the cycles
+        between progress messages
+        @param timeout An optional number of seconds a job may run when it
+        does not give its own, None for no limit
+        """
+        if workers < 1 or queueSize < 1 or progressInterval < 1:
+            raise ValueError(f"Job server initialized with {workers} workers, queue size {queueSize} "
+                             f"and progress interval {progressInterval}")
+        self.workers = workers
+        self.progressInterval = progressInterval
+        self.timeout = timeout
+        self.queue = asyncio.Queue(queueSize)
+        self.jobIDs = itertools.count(1)
+        # Job ID -> {"client", "tag", "state"}, until the job ends
+        self.jobs = {}
+        self.running = 0
+
+
+    async def serve(self, host="127.0.0.1", port=8765, path=None):
+        """
+        Accepts clients until cancelled
+
+        @param host An optional string representing the TCP address to bind
+        @param port An optional integer representing the TCP port
+        @param path An optional string representing a Unix socket to listen
+        on instead of TCP
+        """
+        manager = multiprocessing.Manager()
+        self.events = manager.Queue()
+        self.cancelled = manager.dict()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        tasks = [asyncio.create_task(self.dispatch()) for x in range(self.workers)]
+        tasks.append(asyncio.create_task(self.relayProgress()))
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handleClient, path=path, limit=LINE_LIMIT)
+        else:
+            server = await asyncio.start_server(self.handleClient, host=host, port=port, limit=LINE_LIMIT)
+        print(f"Serving on {', '.join(str(x.getsockname()) for x in server.sockets)}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.events.put(None)
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            manager.shutdown()
+
+
+    async def handleClient(self, reader, writer):
+        """
+        Answers the requests of one client until it disconnects
+        """
+        client = {"writer": writer, "lock": asyncio.Lock(), "open": True}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Requests must be JSON objects")
+                except ValueError as e:
+                    await self.send(client, {"type": "error", "message": f"Invalid request: {e}"})
+                    continue
+                await self.handleRequest(client, request)
+        except ConnectionError:
+            pass
+        finally:
+            client["open"] = False
+            for jobID, job in list(self.jobs.items()):
+                if job["client"] is client:
+                    self.cancel(jobID)
+            writer.close()
+
+
+    async def handleRequest(self, client, request):
+        """
+        Answers one request of a client
+        """
+        kind = request.get("type")
+        if kind == "submit":
+            try:
+                if not isinstance(request.get("program"), str):
+                    raise ValueError("A job needs its program as a string")
+                options = request.get("options", {})
+                checkOptions(options)
+                timeout = request.get("timeout", self.timeout)
+                if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+                    raise ValueError(f"Invalid timeout [ {timeout} ]")
+            except ValueError as e:
+                await self.send(client, {"type": "error", "tag": request.get("tag"), "message": str(e)})
+                return
+            if self.queue.full():
+                await self.send(client, {"type": "busy", "tag": request.get("tag"),
+                                         "queued": self.queue.qsize()})
+                return
+            jobID = next(self.jobIDs)
+            self.jobs[jobID] = {"client": client, "tag": request.get("tag"), "state": "queued"}
+            self.queue.put_nowait((jobID, request["program"], options, timeout))
+            await self.send(client, {"type": "accepted", "job": jobID, "tag": request.get("tag"),
+                                     "position": self.queue.qsize()})
+        elif kind == "cancel":
+            job = self.jobs.get(request.get("job"))
+            if job is None or job["client"] is not client:
+                await self.send(client, {"type": "error", "message": f"No job [ {request.get('job')} ]"})
+                return
+            if self.cancel(request["job"]):
+                await self.finishJob(request["job"], {"type": "cancelled", "job": request["job"]})
+        elif kind == "status":
+            await self.send(client, {"type": "status", "queued": self.queue.qsize(),
+                                     "running": self.running, "workers": self.workers})
+        else:
+            await self.send(client, {"type": "error", "message": f"Unknown request type [ {kind} ]"})
+
+
+    def cancel(self, jobID):
+        """
+        Cancels a job, right away if it is still queued or at its next
+        progress check if it is running
+
+        @param jobID An integer representing the job
+        @return True if the job was still queued and has now ended
+        """
+        job = self.jobs[jobID]
+        if job["state"] == "queued":
+            job["state"] = "cancelled"
+            return True
+        self.cancelled[jobID] = True
+        return False
+
+
+    async def dispatch(self):
+        """
+        Runs queued jobs on the worker pool, one at a time
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            jobID, program, options, timeout = await self.queue.get()
+            job = self.jobs[jobID]
+            if job["state"] == "cancelled":
+                del self.jobs[jobID]
+                continue
+            job["state"] = "running"
+            self.running += 1
+            try:
+                message = await loop.run_in_executor(self.pool, runJob, jobID, program, options, timeout,
+                                                     self.progressInterval, self.events, self.cancelled)
+            except Exception as e:
+                message = {"type": "error", "job": jobID, "message": f"{type(e).__name__}: {e}"}
+            finally:
+                self.running -= 1
+                self.cancelled.pop(jobID, None)
+            await self.finishJob(jobID, message)
+
+
+    async def relayProgress(self):
+        """
+        Forwards the progress messages posted by the workers to their clients
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self.events.get)
+            if message is None:
+                return
+            job = self.jobs.get(message["job"])
+            if job is not None:
+                await self.send(job["client"], dict(message, tag=job["tag"]))
+
+
+    async def finishJob(self, jobID, message):
+        """
+        Sends the final message of a job and forgets it.  A job cancelled
+        while queued is forgotten once it leaves the queue.
+        """
+        job = self.jobs.get(jobID)
+        if job is None:
+            return
+        if job["state"] != "cancelled":
+            del self.jobs[jobID]
+        await self.send(job["client"], dict(message, tag=job["tag"]))
+
+
+    async def send(self, client, message):
+        """
+        Writes one message to a client, waiting while its socket buffer is
+        full so that a slow client holds back only its own messages
+        """
+        if not client["open"]:
+            return
+        async with client["lock"]:
+            try:
+                client["writer"].write((json.dumps(message) + "\n").encode())
+                await client["writer"].drain()
+            except ConnectionError:
+                client["open"] = False
+
+
+# Start the server by running this script directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve simulation jobs to local clients")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument("--unix", default=None, help="Unix socket to listen on instead of TCP")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes, and so jobs running at once")
+    parser.add_argument("--queue", type=int, default=16, help="jobs which may wait for a worker")
+    parser.add_argument("--progress", type=int, default=1000, help="cycles between progress messages")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds a job may run when it does not give its own")
+    args = parser.parse_args()
+
+    server = JobServer(args.workers, args.queue, args.progress, args.timeout)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
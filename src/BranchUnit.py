@@ -1,130 +1,307 @@
 # @file         BranchUnit.py
 # @authors      Stephen, Yihao
 
+# Local constants to improve readability of BTB entries
+VALID = 0
+TAG = 1
+TARGET = 2
+TAKEN = 3
+
+class ReturnAddressStack:
+    """
+    This helper class models a small circular return address stack.
+
+    The current ISA has no call or return instructions, so the core never
+    instantiates one by default.  It exists as the extension point for
+    predicting indirect return targets: a call pushes its fall-through PC and
+    a return pops it as the predicted target.  On overflow the oldest entry is
+    overwritten, as in hardware.
+    """
+
+    def __init__(self, size):
+        """
+        Constructor for the ReturnAddressStack class
+
+        @param size An integer representing the number of return addresses
+        that can be held before the oldest is overwritten
+        """
+        if size < 1:
+            raise ValueError(f"RAS initialized with invalid size {size}")
+        self.stack = [None] * size
+        self.size = size
+        self.top = 0
+        self.count = 0
+
+
+    def push(self, PC):
+        """
+        Pushes a return address, overwriting the oldest entry when full
+
+        @param PC An integer representing the return address to push
+        @return None
+        """
+        self.stack[self.top] = PC
+        self.top = (self.top + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+
+    def pop(self):
+        """
+        Pops the most recent return address
+
+        @return An integer representing the predicted return PC, or None if
+        the stack is empty
+        """
+        if self.count == 0:
+            return None
+        self.top = (self.top - 1) % self.size
+        self.count -= 1
+        return self.stack[self.top]
+
+
+    def peek(self):
+        """
+        Getter for the most recent return address without popping it
+
+        @return An integer representing the predicted return PC, or None if
+        the stack is empty
+        """
+        if self.count == 0:
+            return None
+        return self.stack[(self.top - 1) % self.size]
+
+
 class BranchUnit:
     """
     This helper class works together with the top-level Tomasulo class to
     achieve branch prediction and speculative execution.
+
+    The branch target buffer is indexed by the PC (the word address of the
+    instruction) and each entry holds a valid bit, a tag, the last target and
+    a one-bit taken predictor:
+    [<valid>, <tag>, <target PC>, <taken>]
+
+    Every branch in flight also owns a small record holding what was
+    predicted at issue and where to resume fetching on a misprediction.
+    Records are released when the branch commits or is squashed, so this
+    bookkeeping never holds more than the branches currently in flight.
+
+    RAT checkpoints live in a fixed ring with one slot per unresolved branch.
+    A checkpoint only stores the registers that are renamed at the time it is
+    taken.  Slots are allocated in program order and released either at the
+    head when the branch commits or from the tail when branches are squashed.
     """
 
-    def __init__(self, maxCopies=10):
+    def __init__(self, maxCopies=10, BTBEntries=8, RASEntries=0, defaultTaken=True):
         """
         Constructor for the BranchUnit class
 
         @param maxCopies An optional integer representing how many copies
         of the RAT can be stored at any given time.  This effectively limits
-        how many layers of branches can be executing under speculation.
+        how many layers of branches can be executing under speculation, and
+        the core stalls issue of further branches while all are in use.
+        @param BTBEntries An optional integer representing the number of
+        entries in the branch target buffer.  The rubric prescribes 8, which
+        means the 3 LSBs of the PC word address select the entry.
+        @param RASEntries An optional integer representing the depth of the
+        return address stack, 0 to disable it
+        @param defaultTaken An optional boolean representing the static
+        prediction used for a branch which misses in the BTB
 
         Note that the parameter is related to the recursion depth of the
         system, as it will represent how deeply an execution path can go
         before requiring a base condition branch to be determined.
         """
+        if BTBEntries < 1:
+            raise ValueError(f"BTB initialized with invalid size {BTBEntries}")
+        if maxCopies < 1:
+            raise ValueError(f"Branch unit initialized with invalid speculation depth {maxCopies}")
         self.maxCopies = maxCopies
-        # Store copies of the RAT when prompted
-        self.RATs = []
-        self.mispredictedTargets = {}
+        # Ring of RAT checkpoints, each slot holds (ID, compact RAT) or None
+        self.RATs = [None] * maxCopies
+        self.head = 0
+        self.count = 0
 
-        # The branch translation buffer
-        self.BTB = {
-            "000":True,
-            "001":True,
-            "010":True,
-            "011":True,
-            "100":True,
-            "101":True,
-            "110":True,
-            "111":True
-        }
+        # The branch target buffer
+        self.BTBEntries = BTBEntries
+        self.BTB = [ [False, None, None, defaultTaken] for x in range(BTBEntries) ]
+        self.defaultTaken = defaultTaken
 
+        # Optional return address stack
+        self.RAS = ReturnAddressStack(RASEntries) if RASEntries > 0 else None
 
-    def int2BinStr(self, I):
-        """
-        Given a non-negative integer value, returns a string representing the 3
-        LSBs of the binary representation of that integer.
+        # In-flight branch records: ID -> (PC, taken, recovery PC, target)
+        self.inflight = {}
 
-        @param I An integer value
-        @return A string of length 3 representing the lowest 3 bits of the
-        binary representation of the given integer
 
-        Note: it is assumed that the integer is positive
+    def index(self, PC):
         """
-        return f"{I:08b}"[-3:]
+        Given a PC, returns the BTB index and tag it maps to
 
-
-    def predict(self, ID):
+        @param PC A non-negative integer representing the word address of the
+        branch instruction
+        @return A tuple of integers (index, tag)
         """
-        Given an instruction ID, return the predicted target instruction ID
+        return PC % self.BTBEntries, PC // self.BTBEntries
 
-        @param ID An integer representing the instruciton ID of the
-        branch instruction to predict
-        @return True if the branch tracker predicts taken, False otherwise
 
-        Note: To mimic the aliasing behavior of branch predictors, we convert
-        the instruction IDs to bits and use only the 3 LSBs to address our
-        table.  For example, the branch with ID 3 is the third word in the
-        instruction queue, which corresponds to the 12th byte, which has binary
-        representation "1100", so you would pass in "100" as the address.
-        This scheme is prescribed by the rubric.
+    def predict(self, PC, fallthrough, decodedTarget):
         """
-        return self.BTB[self.int2BinStr(ID)]
-
-
-    def update(self, ID, taken):
+        Given the PC of a branch, returns the predicted direction and the PC to
+        continue fetching from
+
+        @param PC An integer representing the word address of the branch
+        @param fallthrough An integer representing the PC of the next
+        sequential instruction
+        @param decodedTarget An integer representing the taken target computed
+        by the decoder from the instruction immediate
+        @return A tuple (taken, nextPC) with the predicted direction and the
+        predicted next PC
+
+        Note: on a BTB hit the stored target is used.  On a miss the branch
+        has already been decoded at fetch, so we fall back to the static
+        default direction and the decoded target.
+        """
+        idx, tag = self.index(PC)
+        entry = self.BTB[idx]
+        if entry[VALID] and entry[TAG] == tag:
+            taken = entry[TAKEN]
+            target = entry[TARGET]
+        else:
+            taken = self.defaultTaken
+            target = decodedTarget
+        return taken, (target if taken else fallthrough)
+
+
+    def update(self, PC, taken, target):
         """
-        Given a branch instruction ID, finds it in the BTB and sets its
-        predictor to indicate the given target ID
+        Given a resolved branch, allocates or refreshes its BTB entry
 
-        @param ID An integer representing the instruction ID of the branch to
+        @param PC An integer representing the word address of the branch to
         update
         @param taken A boolean indicating if the branch was taken
+        @param target An integer representing the resolved taken target
         @return None
         """
-        address = self.int2BinStr(ID)
-        self.BTB[address] = taken
+        idx, tag = self.index(PC)
+        self.BTB[idx] = [True, tag, target, taken]
 
-    def setMispredictTarget(self, ID, PC):
+
+    def track(self, ID, PC, taken, target):
         """
-        Saves an instruction ID and offset pair in case the branch prediction is
-        wrong.
+        Records the prediction made for a newly issued branch
 
         @param ID An integer representing the branch instruction
-        @param PC An integer representing the PC to use if the branch is
-        mispredicted.
+        @param PC An integer representing the word address of the branch
+        @param taken A boolean representing the predicted direction
+        @param target An integer representing the taken target of the branch
         @return None
+
+        The PC to recover to on a misprediction is the path that was not
+        predicted: the fall-through if predicted taken, the target otherwise.
         """
-        self.mispredictedTargets[ID] = PC
+        self.inflight[ID] = (PC, taken, PC + 1 if taken else target, target)
+
+
+    def getRecord(self, ID):
+        """
+        Given the ID of an in-flight branch, returns its prediction record
+
+        @param ID An integer representing the branch instruction
+        @return A tuple (PC, predicted taken, recovery PC, taken target)
+        """
+        return self.inflight[ID]
 
 
     def getMispredictTarget(self, ID):
         """
         Given the ID of a mispredicted branch instruction, returns the PC to
-        use, assuming it was previously set.
+        use, assuming it was previously tracked.
 
         @param ID An integer representing the branch instruction that was
         mispredicted
         @return an integer representing the PC stored for the given branch
         """
-        return self.mispredictedTargets[ID]
+        return self.inflight[ID][2]
+
+
+    def canSpeculate(self):
+        """
+        Determines if another branch may be issued under speculation
+
+        @return True if fewer than maxCopies branches are unresolved
+        """
+        return len(self.inflight) < self.maxCopies
 
 
+    def release(self, ID):
+        """
+        Frees the record and RAT checkpoint of a branch once it commits
+
+        @param ID An integer representing the committed branch instruction
+        @return None
+        """
+        self.inflight.pop(ID, None)
+        while self.count > 0 and self.RATs[self.head][0] <= ID:
+            self.RATs[self.head] = None
+            self.head = (self.head + 1) % self.maxCopies
+            self.count -= 1
+
+
+    def squash(self, BID):
+        """
+        Frees the records and RAT checkpoints of every branch younger than a
+        mispredicted instruction
+
+        @param BID An integer representing the mispredicted instruction, the
+        last one to survive
+        @return None
+        """
+        for dead in [x for x in self.inflight if x > BID]:
+            del self.inflight[dead]
+        while self.count > 0:
+            slot = (self.head + self.count - 1) % self.maxCopies
+            if self.RATs[slot][0] <= BID:
+                break
+            self.RATs[slot] = None
+            self.count -= 1
+
 
     def saveRAT(self, ID, RATdict):
         """
-        Given the current cycle, the ID of a branch instruction, and a copy of
-        the current RAT state, stores the state in the RATs list.
+        Given the ID of a branch instruction, and a copy of the current RAT
+        state, stores the state in the next free checkpoint slot.
 
-        @param cycle An integer representing the current wall time in cycles
         @param ID An integer representing the instruction ID of the branch
         instruction associated with the RAT state
-        @param RATdict A dictionary representing the RAT state
+        @param RATdict A dictionary representing the compact RAT state
+        @return True if the state was stored
 
         It is assumed that a copy of the RAT state is passed in rather than a
-        direct reference
+        direct reference.  Raises IndexError if every slot is in use, the
+        issue stage must check canSpeculate() first.
         """
-        if len(self.RATs) < self.maxCopies:
-            self.RATs.append((ID, RATdict))
-            return True
-        return False
+        if self.count == self.maxCopies:
+            raise IndexError("No free RAT checkpoint slot!")
+        self.RATs[(self.head + self.count) % self.maxCopies] = (ID, RATdict)
+        self.count += 1
+        return True
+
+
+    def retireMapping(self, register, tag):
+        """
+        Removes a committed mapping from every live checkpoint
+
+        @param register A string representing the architectural register
+        @param tag A string representing the ROB entry which just committed
+
+        Once the ROB entry commits its value lives in the ARF, so a
+        checkpoint restored later must point the register back at the ARF.
+        """
+        for i in range(self.count):
+            checkpoint = self.RATs[(self.head + i) % self.maxCopies][1]
+            if checkpoint.get(register) == tag:
+                del checkpoint[register]
 
 
     def rollBack(self, ID):
@@ -140,18 +317,16 @@ class BranchUnit:
         Note: Assumes that the IDs are unique and in strictly ascending order
         Note: Assumes that the branch has been stored previously
         """
-        idx = 0
-        for entry in self.RATs:
+        # Search back from the youngest slot, the usual case
+        while self.count > 0:
+            self.count -= 1
+            slot = (self.head + self.count) % self.maxCopies
+            entry = self.RATs[slot]
+            self.RATs[slot] = None
             if entry[0] == ID:
-                break
-            else:
-                idx += 1
-
-        # Destroy all state that came after the speculation
-        self.RATs = self.RATs[:idx+1]
-
-        # Return the state at the time of speculation
-        return self.RATs.pop(idx)[1]
+                # Return the state at the time of speculation
+                return entry[1]
+        raise KeyError(f"No RAT checkpoint for branch {ID}")
 
 
     def dump(self):
@@ -159,28 +334,41 @@ class BranchUnit:
         Pretty-prints the contents of the branch unit
         """
         print(f"Branch Predictor".ljust(48, '=').rjust(80,'='))
-        keys = sorted(self.BTB.keys())
-        for i in range(0, len(keys), 4):
-            print(f"Address {keys[i]}: {str(self.BTB[keys[i]]).ljust(5, ' ')}".ljust(20, ' '), end='')
-            print(f"Address {keys[i+1]}: {str(self.BTB[keys[i+1]]).ljust(5, ' ')}".ljust(20, ' '), end='')
-            print(f"Address {keys[i+2]}: {str(self.BTB[keys[i+2]]).ljust(5, ' ')}".ljust(20, ' '), end='')
-            print(f"Address {keys[i+3]}: {str(self.BTB[keys[i+3]]).ljust(5, ' ')}".ljust(20, ' '))
-
-        for key, val in self.RATS.items():
-            print(f"Branch Instruction {key}:")
-            print(val)
+        print("Index\tValid\tTag\tTarget\tTaken")
+        for i, entry in enumerate(self.BTB):
+            print(f"{i}\t{entry[VALID]}\t{entry[TAG]}\t{entry[TARGET]}\t{entry[TAKEN]}")
+
+        for key, val in self.inflight.items():
+            print(f"Branch Instruction {key}: PC {val[0]}, taken {val[1]}, recovery PC {val[2]}, target {val[3]}")
+        for i in range(self.count):
+            ID, checkpoint = self.RATs[(self.head + i) % self.maxCopies]
+            print(f"Checkpoint for branch {ID}: {checkpoint}")
         print()
 
 
 # Testing, run this script directly to execute
 if __name__ == "__main__":
     myB = BranchUnit()
-    IDS = [3,7,15,16,31,32]
+    PCS = [3,7,15,16,31,32]
     myB.dump()
-    for i in IDS:
-        myB.predict(i)
+    for i, PC in enumerate(PCS):
+        taken, nextPC = myB.predict(PC, PC+1, PC-2)
+        myB.track(i, PC, taken, PC-2)
     myB.dump()
-    for i in IDS:
-        myB.update(i, False)
+    for PC in PCS:
+        myB.update(PC, False, PC-2)
+    myB.saveRAT(0, {"R1": "ROB0"})
+    myB.saveRAT(1, {"R1": "ROB0", "F2": "ROB3"})
+    myB.saveRAT(2, {"F2": "ROB3"})
+    myB.retireMapping("R1", "ROB0")
     myB.dump()
-
+    print(myB.rollBack(1))
+    myB.squash(1)
+    myB.dump()
+    for i in range(3):
+        myB.release(i)
+    myB.dump()
+    myRAS = ReturnAddressStack(2)
+    for PC in [4, 8, 12]:
+        myRAS.push(PC)
+    print(myRAS.pop(), myRAS.pop(), myRAS.pop())
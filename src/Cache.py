@@ -0,0 +1,317 @@
+# @file         Cache.py
+# @authors      Stephen
+
+import random
+
+# Local constants to improve readability of cache lines
+TAG = 0
+DIRTY = 1
+
+class Cache:
+    """
+    This class models the timing of a set-associative, write-back,
+    write-allocate data cache.
+
+    Only tags are kept here, the data itself always lives in the MemoryUnit,
+    so the cache changes when accesses complete but never what they read.
+    Each set is a list of ways holding [<tag>, <dirty>] or None.
+
+    A miss allocates a miss status holding register (MSHR) until its line is
+    filled.  Further misses to a line which is still being filled merge into
+    its MSHR, and a miss to a new line is refused while every MSHR is in use.
+    """
+
+    def __init__(self, size, assoc, lineSize, hitLatency, missPenalty,
+                 MSHRs=4, replacement="lru", name="Data cache"):
+        """
+        Constructor for the Cache class
+
+        @param size An integer representing the capacity in bytes
+        @param assoc An integer representing the number of ways per set
+        @param lineSize An integer representing the line size in bytes
+        @param hitLatency An integer representing the cycles taken by a hit
+        @param missPenalty An integer representing the extra cycles taken to
+        fill a line from memory
+        @param MSHRs An optional integer representing how many misses to
+        different lines can be outstanding
+        @param replacement An optional string, one of "lru", "plru" (tree
+        pseudo-LRU, needs a power of two ways) or "random"
+        @param name An optional string used as the title of the dumps
+        """
+        if lineSize < 4 or assoc < 1 or size % (assoc * lineSize) != 0:
+            raise ValueError(f"Cache initialized with invalid geometry {size}/{assoc}/{lineSize}")
+        if replacement not in ("lru", "plru", "random"):
+            raise ValueError(f"Unknown replacement policy [ {replacement} ]")
+        if replacement == "plru" and assoc & (assoc - 1) != 0:
+            raise ValueError(f"Tree PLRU needs a power of two ways, not {assoc}")
+        if MSHRs < 1:
+            raise ValueError(f"Cache initialized with {MSHRs} MSHRs")
+
+        self.numSets = size // (assoc * lineSize)
+        self.assoc = assoc
+        self.lineSize = lineSize
+        self.hitLatency = hitLatency
+        self.missPenalty = missPenalty
+        self.replacement = replacement
+        self.name = name
+        self.sets = [ [None] * assoc for x in range(self.numSets) ]
+
+        # Replacement state: ways from least to most recently used for LRU,
+        # the tree bits for PLRU
+        self.recency = [ list(range(assoc)) for x in range(self.numSets) ]
+        self.treeBits = [ [0] * assoc for x in range(self.numSets) ]
+        self.rng = random.Random(0)
+
+        # Outstanding misses: line address -> cycle the fill completes
+        self.MSHRs = MSHRs
+        self.pending = {}
+        # IDs refused for want of an MSHR in the cycle given, each counted once
+        self.refusedAt = -1
+        self.refused = set()
+
+        self.stats = {"hits": 0, "misses": 0, "merged": 0, "MSHRStalls": 0, "writebacks": 0,
+                      "invalidations": 0}
+
+
+    def locate(self, addr):
+        """
+        Given a byte address, returns where it lives in the cache
+
+        @param addr An integer representing the byte address
+        @return A tuple of integers (line address, set index, tag)
+        """
+        line = addr // self.lineSize
+        return line, line % self.numSets, line // self.numSets
+
+
+    def findWay(self, setIdx, tag):
+        """
+        Searches a set for a tag
+
+        @return An integer representing the way holding the tag, or None
+        """
+        for way, entry in enumerate(self.sets[setIdx]):
+            if entry is not None and entry[TAG] == tag:
+                return way
+        return None
+
+
+    def expire(self, time):
+        """
+        Frees the MSHRs of every fill completed by the given cycle
+
+        @param time An integer representing the current cycle
+        """
+        for line in [x for x, done in self.pending.items() if done <= time]:
+            del self.pending[line]
+
+
+    def canAccept(self, addr, time, ID=None):
+        """
+        Determines if an access can start this cycle
+
+        @param addr An integer representing the byte address to access
+        @param time An integer representing the current cycle
+        @param ID An optional integer representing the instruction asking,
+        so that asking again in the same cycle is not counted again
+        @return False if the access misses and no MSHR is free
+
+        Refusals are counted as MSHR stalls.
+        """
+        self.expire(time)
+        line, setIdx, tag = self.locate(addr)
+        if line in self.pending or self.findWay(setIdx, tag) is not None:
+            return True
+        if len(self.pending) < self.MSHRs:
+            return True
+        if self.refusedAt != time:
+            self.refusedAt = time
+            self.refused = set()
+        if ID is None or ID not in self.refused:
+            self.stats["MSHRStalls"] += 1
+        if ID is not None:
+            self.refused.add(ID)
+        return False
+
+
+    def access(self, addr, isWrite, time):
+        """
+        Performs the tag lookup for an access and updates the cache state
+
+        @param addr An integer representing the byte address to access
+        @param isWrite A boolean, True for a store
+        @param time An integer representing the current cycle
+        @return An integer representing the cycles until the access completes
+
+        The caller must check canAccept() first.  A miss installs the line
+        right away, and the MSHR marks it as not yet usable until the fill
+        completes.
+        """
+        self.expire(time)
+        line, setIdx, tag = self.locate(addr)
+        way = self.findWay(setIdx, tag)
+        if line in self.pending:
+            # Secondary miss, wait for the fill already under way
+            self.stats["merged"] += 1
+            latency = max(self.pending[line] - time, self.hitLatency)
+        elif way is not None:
+            self.stats["hits"] += 1
+            latency = self.hitLatency
+        else:
+            self.stats["misses"] += 1
+            way = self.victim(setIdx)
+            if self.sets[setIdx][way] is not None and self.sets[setIdx][way][DIRTY]:
+                # The dirty line is written back through a write buffer
+                self.stats["writebacks"] += 1
+            self.sets[setIdx][way] = [tag, False]
+            latency = self.hitLatency + self.missPenalty
+            self.pending[line] = time + latency
+
+        if way is None:
+            way = self.findWay(setIdx, tag)
+        if isWrite:
+            self.sets[setIdx][way][DIRTY] = True
+        self.touch(setIdx, way)
+        return latency
+
+
+    def holds(self, addr):
+        """
+        Determines if the line holding an address is in the cache
+        """
+        line, setIdx, tag = self.locate(addr)
+        return self.findWay(setIdx, tag) is not None
+
+
+    def invalidate(self, addr):
+        """
+        Drops the line holding an address, as when another cache takes it
+        over.  A fill still under way no longer brings it in.
+
+        @param addr An integer representing a byte address in the line
+        @return A boolean, True if the line was dirty and had to be written back
+        """
+        line, setIdx, tag = self.locate(addr)
+        way = self.findWay(setIdx, tag)
+        if way is None:
+            return False
+        dirty = self.sets[setIdx][way][DIRTY]
+        if dirty:
+            self.stats["writebacks"] += 1
+        self.sets[setIdx][way] = None
+        self.pending.pop(line, None)
+        self.stats["invalidations"] += 1
+        return dirty
+
+
+    def clean(self, addr):
+        """
+        Writes a dirty line back and keeps it, as when another cache reads it
+
+        @param addr An integer representing a byte address in the line
+        @return A boolean, True if the line was dirty
+        """
+        line, setIdx, tag = self.locate(addr)
+        way = self.findWay(setIdx, tag)
+        if way is None or not self.sets[setIdx][way][DIRTY]:
+            return False
+        self.stats["writebacks"] += 1
+        self.sets[setIdx][way][DIRTY] = False
+        return True
+
+
+    def victim(self, setIdx):
+        """
+        Picks the way to replace in a set, preferring an invalid way
+
+        @param setIdx An integer representing the set
+        @return An integer representing the way to replace
+        """
+        for way, entry in enumerate(self.sets[setIdx]):
+            if entry is None:
+                return way
+        if self.replacement == "lru":
+            return self.recency[setIdx][0]
+        if self.replacement == "random":
+            return self.rng.randrange(self.assoc)
+
+        # Follow the tree bits away from the recently used half
+        bits = self.treeBits[setIdx]
+        node = 1
+        while node < self.assoc:
+            node = 2 * node + bits[node]
+        return node - self.assoc
+
+
+    def touch(self, setIdx, way):
+        """
+        Marks a way as the most recently used in its set
+
+        @param setIdx An integer representing the set
+        @param way An integer representing the way
+        """
+        if self.replacement == "lru":
+            self.recency[setIdx].remove(way)
+            self.recency[setIdx].append(way)
+        elif self.replacement == "plru":
+            # Point every node on the path at the other half
+            bits = self.treeBits[setIdx]
+            node = way + self.assoc
+            while node > 1:
+                bits[node // 2] = 1 - (node % 2)
+                node //= 2
+
+
+    def getStats(self):
+        """
+        Getter for the access counters
+
+        @return A dictionary of counters and the hit rate
+        """
+        stats = dict(self.stats)
+        total = stats["hits"] + stats["misses"] + stats["merged"]
+        stats["hitRate"] = stats["hits"] / total if total > 0 else 0.0
+        return stats
+
+
+    def dumpStats(self):
+        """
+        Pretty-prints the access counters
+        """
+        stats = self.getStats()
+        print(self.name.ljust(48, '=').rjust(80,'='))
+        print(f"Hits:\t\t{stats['hits']}")
+        print(f"Misses:\t\t{stats['misses']}")
+        print(f"Merged misses:\t{stats['merged']}")
+        print(f"MSHR stalls:\t{stats['MSHRStalls']}")
+        print(f"Writebacks:\t{stats['writebacks']}")
+        print(f"Hit rate:\t{100*stats['hitRate']:.1f}%")
+        print()
+
+
+    def dump(self):
+        """
+        Pretty-prints the valid lines of the cache
+        """
+        print(self.name.ljust(48, '=').rjust(80,'='))
+        print("Set\tWay\tTag\tDirty")
+        for setIdx, ways in enumerate(self.sets):
+            for way, entry in enumerate(ways):
+                if entry is not None:
+                    print(f"{setIdx}\t{way}\t{entry[TAG]}\t{entry[DIRTY]}")
+        for line, done in self.pending.items():
+            print(f"MSHR: line {line} filled at {done}")
+        print()
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    for policy in ["lru", "plru", "random"]:
+        myCache = Cache(64, 2, 16, 1, 10, MSHRs=1, replacement=policy)
+        # Two misses to the same line merge, a third line must wait
+        print(myCache.access(0, False, 0), myCache.access(4, False, 1))
+        print(myCache.canAccept(32, 2), myCache.canAccept(32, 11))
+        for t, addr in enumerate([32, 0, 64, 0, 32], start=11):
+            myCache.access(addr, addr == 64, 100 * t)
+        myCache.dump()
+        myCache.dumpStats()
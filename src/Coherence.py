@@ -0,0 +1,190 @@
+# @file         Coherence.py
+# @authors      Stephen
+
+# Line states, per core
+MODIFIED = "M"
+EXCLUSIVE = "E"
+SHARED = "S"
+INVALID = "I"
+
+# Supported protocols
+PROTOCOLS = ["msi", "mesi"]
+
+class CoherentBus:
+    """
+    This class models a snooping bus joining the private data caches of
+    several cores to one shared memory, and keeps the caches coherent.
+
+    Like the caches it only tracks timing and line states, the values always
+    live in the shared memory.  Each core holds each line Modified, Shared or
+    Invalid, and with MESI also Exclusive when no other core holds it, so a
+    later write needs no bus transaction.
+
+    Every miss, and every write to a line not held Modified or Exclusive,
+    is a transaction holding the bus for `latency` cycles, and waits while
+    the bus is busy with an earlier one.  A transaction for a line another
+    core holds Modified takes `latency` more while that core writes it back.
+    Writes invalidate the line in every other core.  Cores without a data
+    cache have every access cross the bus, so it only models contention.
+    """
+
+    def __init__(self, cores, protocol="msi", latency=2):
+        """
+        Constructor for the CoherentBus class
+
+        @param cores An integer representing the number of cores attached
+        @param protocol An optional string, one of PROTOCOLS
+        @param latency An optional integer representing the cycles a
+        transaction holds the bus
+
+        Raises ValueError on an unknown protocol
+        """
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown coherence protocol [ {protocol} ]")
+        if cores < 1 or latency < 0:
+            raise ValueError(f"Bus initialized with {cores} cores and latency {latency}")
+        self.cores = cores
+        self.protocol = protocol
+        self.latency = latency
+        self.caches = [None] * cores
+        # Coherence granule in bytes, the cache line size or one word
+        self.lineSize = None
+        # Line address -> list of each core's state
+        self.states = {}
+        # Cycle at which the bus can start its next transaction
+        self.freeAt = 0
+        self.stats = {"transactions": 0, "waitCycles": 0, "upgrades": 0,
+                      "invalidations": 0, "interventions": 0}
+
+
+    def attach(self, coreID, cache=None):
+        """
+        Connects a core, and its data cache if it has one
+
+        @param coreID An integer representing the core
+        @param cache An optional reference to the core's Cache
+
+        Raises ValueError if the caches have different line sizes
+        """
+        lineSize = cache.lineSize if cache is not None else 4
+        if self.lineSize is not None and self.lineSize != lineSize:
+            raise ValueError(f"Every core needs the same line size, not {self.lineSize} and {lineSize}")
+        self.lineSize = lineSize
+        self.caches[coreID] = cache
+
+
+    def access(self, coreID, addr, isWrite, time):
+        """
+        Updates the line states for an access, before it is looked up in
+        the core's own cache
+
+        @param coreID An integer representing the core
+        @param addr An integer representing the byte address
+        @param isWrite A boolean, True for a store
+        @param time An integer representing the current cycle
+        @return An integer representing the extra cycles the access takes
+        """
+        cache = self.caches[coreID]
+        if cache is None:
+            return self.transaction(time)
+
+        line = addr // self.lineSize
+        states = self.states.setdefault(line, [INVALID] * self.cores)
+        state = states[coreID]
+        if state != INVALID and not cache.holds(addr):
+            # Evicted since
+            state = INVALID
+        if state == MODIFIED or (state == EXCLUSIVE and isWrite):
+            states[coreID] = MODIFIED
+            return 0
+        if state != INVALID and not isWrite:
+            return 0
+
+        extra = 0
+        if state == SHARED:
+            self.stats["upgrades"] += 1
+        for other in range(self.cores):
+            if other == coreID or states[other] == INVALID:
+                continue
+            if states[other] == MODIFIED:
+                self.stats["interventions"] += 1
+                extra = self.latency
+            if isWrite:
+                self.caches[other].invalidate(addr)
+                self.stats["invalidations"] += 1
+                states[other] = INVALID
+            else:
+                self.caches[other].clean(addr)
+                states[other] = SHARED
+
+        if isWrite:
+            states[coreID] = MODIFIED
+        elif self.protocol == "mesi" and all(x == INVALID for i, x in enumerate(states) if i != coreID):
+            states[coreID] = EXCLUSIVE
+        else:
+            states[coreID] = SHARED
+        return self.transaction(time) + extra
+
+
+    def transaction(self, time):
+        """
+        Holds the bus for one transaction, after any already under way
+
+        @param time An integer representing the current cycle
+        @return An integer representing the cycles waited and spent on the bus
+        """
+        start = max(time, self.freeAt)
+        self.freeAt = start + self.latency
+        self.stats["transactions"] += 1
+        self.stats["waitCycles"] += start - time
+        return start - time + self.latency
+
+
+    def getStats(self):
+        """
+        Getter for the bus counters
+        """
+        return dict(self.stats)
+
+
+    def dumpStats(self):
+        """
+        Pretty-prints the bus counters
+        """
+        print(f"Coherent bus ({self.protocol.upper()})".ljust(48, '=').rjust(80,'='))
+        print(f"Transactions:\t{self.stats['transactions']}")
+        print(f"Wait cycles:\t{self.stats['waitCycles']}")
+        print(f"Upgrades:\t{self.stats['upgrades']}")
+        print(f"Invalidations:\t{self.stats['invalidations']}")
+        print(f"Interventions:\t{self.stats['interventions']}")
+        print()
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    try:
+        from src.Cache import Cache
+    except ImportError:
+        # Run directly as a script from within src/
+        from Cache import Cache
+    for protocol in PROTOCOLS:
+        myBus = CoherentBus(2, protocol=protocol, latency=2)
+        caches = [Cache(64, 2, 16, 1, 10) for x in range(2)]
+        for coreID, cache in enumerate(caches):
+            myBus.attach(coreID, cache)
+        # Core 0 reads alone, then writes: a silent upgrade only with MESI
+        print(protocol, myBus.access(0, 0, False, 0), myBus.states[0])
+        caches[0].access(0, False, 0)
+        print(myBus.access(0, 0, True, 20), myBus.states[0])
+        caches[0].access(0, True, 20)
+        # Core 1 reads the modified line, then takes it over to write it
+        print(myBus.access(1, 4, False, 21), myBus.states[0])
+        caches[1].access(4, False, 21)
+        print(myBus.access(1, 4, True, 40), myBus.states[0], caches[0].holds(0))
+        caches[1].access(4, True, 40)
+        # Back to back transactions wait for the bus
+        print(myBus.transaction(50), myBus.transaction(50), myBus.getStats())
+    try:
+        CoherentBus(2, protocol="moesi")
+    except ValueError as e:
+        print(e)
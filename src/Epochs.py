@@ -0,0 +1,138 @@
+# @file         Epochs.py
+# @authors      Stephen
+
+from bisect import bisect_right
+
+# Epochs built up before trimming is tried
+TRIM_EPOCHS = 64
+
+class Epochs:
+    """
+    This helper class tracks which instructions have been squashed by a
+    mispredicted branch.
+
+    Every misprediction closes the current epoch and opens a new one for the
+    correct path.  An epoch is the range of instruction IDs issued between two
+    mispredictions, and each epoch remembers the youngest ID in it that
+    survived.  Since IDs are strictly increasing, an instruction is squashed
+    exactly when its ID is beyond the cutoff of the epoch it was issued in.
+
+    A squash is O(1) amortized: it sets one cutoff, kills any younger epochs
+    still alive (each epoch dies at most once) and opens a new epoch.  Nothing
+    is removed from the pipeline structures at that point; they ask
+    isSquashed() when they next encounter an entry and skip it.
+
+    Epochs are kept until trim() is told that no instruction older than a
+    given ID is held anywhere, so their number stays bounded however many
+    squashes a run has.  Any ID older than the oldest epoch kept committed.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the Epochs class
+        """
+        # First instruction ID and youngest surviving ID of each epoch
+        self.starts = [0]
+        self.cutoffs = [float('inf')]
+        # Epochs which still hold surviving instructions, oldest first
+        self.live = [0]
+        self.lastIssued = -1
+        self.squashes = 0
+        # Number of epochs at which trimming is next worth trying
+        self.trimAt = TRIM_EPOCHS
+
+
+    def issue(self, ID):
+        """
+        Records that an instruction has been issued in the current epoch
+
+        @param ID An integer representing the issued instruction
+        @return None
+        """
+        self.lastIssued = ID
+
+
+    def squash(self, BID):
+        """
+        Squashes every instruction issued after the given branch
+
+        @param BID An integer representing the mispredicted branch instruction
+        @return None
+        """
+        # Epochs started after the branch die entirely
+        while self.starts[self.live[-1]] > BID:
+            self.cutoffs[self.live.pop()] = -1
+
+        # The branch's own epoch survives up to and including the branch,
+        # unless part of it was already squashed
+        self.cutoffs[self.live[-1]] = min(self.cutoffs[self.live[-1]], BID)
+
+        # The correct path starts a new epoch
+        self.live.append(len(self.starts))
+        self.starts.append(self.lastIssued + 1)
+        self.cutoffs.append(float('inf'))
+        self.squashes += 1
+
+
+    def needsTrim(self):
+        """
+        Determines if enough epochs have built up since the last trim
+        """
+        return len(self.starts) >= self.trimAt
+
+
+    def trim(self, oldest):
+        """
+        Forgets the epochs which ended before an instruction ID
+
+        @param oldest An integer representing the oldest instruction ID still
+        held by any pipeline structure
+        @return None
+        """
+        drop = bisect_right(self.starts, oldest) - 1
+        if drop > 0:
+            del self.starts[:drop]
+            del self.cutoffs[:drop]
+            self.live = [x - drop for x in self.live if x >= drop]
+        # An epoch still held back is not retried on every squash
+        self.trimAt = max(TRIM_EPOCHS, 2 * len(self.starts))
+
+
+    def isSquashed(self, ID):
+        """
+        Determines if an instruction was squashed
+
+        @param ID An integer representing the instruction to check
+        @return True if the instruction was on a squashed path
+        """
+        # Fast path: nothing in the current epoch has been squashed
+        if ID >= self.starts[-1] or ID < self.starts[0]:
+            return False
+        return ID > self.cutoffs[bisect_right(self.starts, ID) - 1]
+
+
+    def count(self):
+        """
+        Getter for the number of squashes so far
+        """
+        return self.squashes
+
+
+# Test cases, run this script directly to execute
+if __name__ == "__main__":
+    myEpochs = Epochs()
+    for i in range(10):
+        myEpochs.issue(i)
+    myEpochs.squash(4)
+    print([i for i in range(10) if myEpochs.isSquashed(i)])
+    for i in range(10, 15):
+        myEpochs.issue(i)
+    myEpochs.squash(12)
+    print([i for i in range(15) if myEpochs.isSquashed(i)])
+    myEpochs.squash(2)
+    print([i for i in range(15) if myEpochs.isSquashed(i)])
+    myEpochs.issue(15)
+    print(myEpochs.isSquashed(15), myEpochs.count())
+    # Once nothing older than 13 is held, only the epochs from 13 on remain
+    myEpochs.trim(13)
+    print(myEpochs.starts, [i for i in range(13, 16) if myEpochs.isSquashed(i)], myEpochs.count())
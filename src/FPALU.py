@@ -1,6 +1,12 @@
 # @file     FPALU
 # @authopipeline  Yihao
 
+try:
+	from src.Operations import OPERATIONS
+except ImportError:
+	# Run directly as a script from within src/
+	from Operations import OPERATIONS
+
 class FPALU_pipeline:
 	"""
 	This class implements the FPAdder pipeline
@@ -25,6 +31,12 @@ class FPALU_pipeline:
 	def showpip(self):
 		return self.pipeline
 
+	def dropSquashed(self, squashed):
+		'''
+		Removes any instructions in the pipeline which were squashed
+		'''
+		self.pipeline = [x for x in self.pipeline if not squashed(x[0])]
+
 	def check(self, time):
 		'''
 		Check if any instruction in the pipeline can be popped
@@ -36,45 +48,61 @@ class FPALU_pipeline:
 		return output
 
 
-class FPMultiplier:
-	def __init__(self, latency, bufferLen, pipelineLen):
+class FPUnit:
+	"""
+	This class implements a pipelined floating point unit, which performs any operation it is given a latency for.
+	"""
+	def __init__(self, latency, bufferLen, pipelineLen, squashed=None, name="FP Unit", ops=None, evaluate=None):
 		"""
-		Constructor for the Multiplier class
+		Constructor for the FPUnit class
 
 		@param latency An dictionary containing the number of cycles required per operation. e.g. {"ADD.D":8, "MULT.D":10}
 		@param bufferLen An integer value representing how may results to buffer on output before stalling further inputs
 		@param pipelineLen An integer value representing how may instructions to buffer in pipeline
+		@param squashed An optional function which, given an instruction ID, returns True if that instruction was squashed by a misprediction
+		@param name An optional string used to identify this unit in the dump() output
+		@param ops An optional list of the operations this unit performs, every operation in latency by default
+		@param evaluate An optional function (ID, op, a, b) which gives each result in place of computing it, as in trace-driven runs
 		"""
 		self.latency = latency
+		self.ops = tuple(ops) if ops is not None else tuple(latency)
+		self.name = name
 		self.bufferLen = bufferLen									#max buffer length
 		self.buffer = []
 		self.pipeline = FPALU_pipeline(pipelineLen)							#set pipeline length as 5
 		self.time = 0
 		self.activeInstruction = None
+		self.squashed = squashed if squashed is not None else (lambda ID: False)
+		self.evaluate = evaluate
 
 	def execute(self, instr_id, instr, op1, op2):
 		self.activeInstruction = (instr_id, instr, op1, op2)
-		if(instr == 'MULT.D'):
-			result = float(op1 * op2)
-			schedule = self.time + self.latency['MULT.D']
+		if(instr in self.ops):
+			if self.evaluate is None:
+				result = OPERATIONS[instr](op1, op2)
+			else:
+				result = self.evaluate(instr_id, instr, op1, op2)
+			schedule = self.time + self.latency[instr]
 			self.pipeline.add(instr_id, schedule, result) 
 		else:
-		    raise ValueError("Unknown operation [ {} ] in FP.adder, time [ {} ]".format(instr, self.time))
+		    raise ValueError("Unknown operation [ {} ] in {}, time [ {} ]".format(instr, self.name, self.time))
 
 	def busy(self):
+		self.dropSquashed()
+		if self.pipeline.busy():
+			# Squashed instructions only give up their pipeline slot when it is needed
+			self.pipeline.dropSquashed(self.squashed)
 		return ((self.pipeline.busy()) or (len(self.buffer) == self.bufferLen) ) 	
 
-
-	def purgeAfterMispredict(self, BID):
+	def dropSquashed(self):
 		"""
-		Removes all currently queued and completed instructions with ID> BID
-	
-		@param BID An integer representing the instruction ID of the mispredicted branch
+		Discards the oldest buffered results if they were squashed by a misprediction
 		"""
-		self.buffer = [x for x in self.buffer if x[0]<= BID ]
-		self.pipeline.pipeline = [x for x in self.pipeline.pipeline if x[0]<= BID ]
+		while(len(self.buffer) > 0 and self.squashed(self.buffer[0][0])):
+			self.buffer.pop(0)
 
 	def isResultReady(self):
+		self.dropSquashed()
 		return len(self.buffer) > 0
 
 	def getResult(self):
@@ -87,11 +115,24 @@ class FPMultiplier:
 		self.time += 1
 		output = self.pipeline.check(self.time) 		
 		while(output != []):
-			self.buffer.append([output[0],output[2]])
+			if not self.squashed(output[0]):
+				self.buffer.append([output[0], output[2]])
 			output = self.pipeline.check(self.time) 		
+
+	def inFlight(self):
+		'''
+		Returns the number of instructions in the pipeline, without dropping squashed ones
+		'''
+		return len(self.pipeline.pipeline)
+
+	def inFlightIDs(self):
+		'''
+		Returns the IDs of the instructions in the pipeline and output buffer, without dropping squashed ones
+		'''
+		return [x[0] for x in self.pipeline.pipeline] + [x[0] for x in self.buffer]
 	
 	def dump(self):
-		print("FP Multiplier".ljust(48, '=').rjust(80,'='))
+		print(self.name.ljust(48, '=').rjust(80,'='))
 		print("Time:\t\t\t{}".format(self.time))
 		print("Busy:\t\t\t{}".format(self.busy()))
 		print("Instruction:\t\t{}".format(self.activeInstruction))
@@ -100,78 +141,36 @@ class FPMultiplier:
 		for item in self.buffer:
 			print("\tID:{}, Value:{}".format(item[0],item[1]))
 		print()
+
+
+class FPMultiplier(FPUnit):
+	def __init__(self, latency, bufferLen, pipelineLen, squashed=None):
+		"""
+		Constructor for the Multiplier class
+
+		@param latency An dictionary containing the number of cycles required per operation. e.g. {"ADD.D":8, "MULT.D":10}
+		@param bufferLen An integer value representing how may results to buffer on output before stalling further inputs
+		@param pipelineLen An integer value representing how may instructions to buffer in pipeline
+		@param squashed An optional function which, given an instruction ID, returns True if that instruction was squashed by a misprediction
+		"""
+		super().__init__(latency, bufferLen, pipelineLen, squashed, "FP Multiplier", ["MULT.D"])
+
 				
-class FPAdder:
+class FPAdder(FPUnit):
 	"""
 	This class implements a simple floating point adder.
 
 	"""
-	def __init__(self, latency, bufferLen,pipelineLen):
+	def __init__(self, latency, bufferLen, pipelineLen, squashed=None):
 		"""
 		Constructor for the FPAdder class
 
 		@param latency An dictionary containing the number of cycles required per operation. e.g. {"ADD.D":8}
 		@param bufferLen An integer value representing how may results to buffer on output before stalling further inputs
 		@param pipelineLen An integer value representing how may instructions to buffer in pipeline
+		@param squashed An optional function which, given an instruction ID, returns True if that instruction was squashed by a misprediction
 		"""
-		self.latency = latency
-		self.bufferLen = bufferLen									#max buffer length
-		self.buffer = []
-		self.pipeline = FPALU_pipeline(pipelineLen)						#set pipeline length as 5
-		self.time = 0
-		self.activeInstruction = None
-
-	def execute(self, instr_id, instr, op1, op2):
-		self.activeInstruction = (instr_id, instr, op1, op2)
-		if(instr == 'ADD.D'):
-			result = float(op1 + op2)
-			schedule = self.time + self.latency['ADD.D']
-			self.pipeline.add(instr_id, schedule, result) 
-		elif(instr == 'SUB.D'):
-			result = float(op1 - op2)
-			schedule = self.time + self.latency['SUB.D']
-			self.pipeline.add(instr_id, schedule, result) 
-		else:
-		    raise ValueError("Unknown operation [ {} ] in FP.adder, time [ {} ]".format(instr, self.time))
-
-	def busy(self):
-		return ((self.pipeline.busy()) or (len(self.buffer) == self.bufferLen) ) 	
-
-	def purgeAfterMispredict(self, BID):
-		"""
-		Removes all currently queued and completed instructions with ID> BID
-
-		@param BID An integer representing the instruction ID of the mispredicted branch
-		"""
-		self.buffer = [x for x in self.buffer if x[0]<= BID ]
-		self.pipeline.pipeline = [x for x in self.pipeline.pipeline if x[0]<= BID ]
-
-	def isResultReady(self):
-		return len(self.buffer) > 0
-
-	def getResult(self):
-		return self.buffer.pop(0)
-
-	def getResultID(self):
-		return self.buffer[0][0]
-
-	def advanceTime(self):
-		self.time += 1
-		output = self.pipeline.check(self.time) 		
-		while(output != []):
-			self.buffer.append([output[0], output[2]])
-			output = self.pipeline.check(self.time) 		
-	
-	def dump(self):
-		print("FP Adder".ljust(48, '=').rjust(80,'='))
-		print("Time:\t\t\t{}".format(self.time))
-		print("Busy:\t\t\t{}".format(self.busy()))
-		print("Instruction:\t\t{}".format(self.activeInstruction))
-		print("Pipeline:\t\t{}".format(self.pipeline.showpip()))
-		print("Output Buffer Contents:")
-		for item in self.buffer:
-			print("\tID:{}, Value:{}".format(item[0],item[1]))
-		print()
+		super().__init__(latency, bufferLen, pipelineLen, squashed, "FP Adder", ["ADD.D", "SUB.D"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+# @file         FUClass.py
+# @authors      Stephen
+
+import json
+
+try:
+    from src.IntegerALU import IntegerALU
+    from src.FPALU import FPUnit
+    from src.ReservationStation import ReservationStation
+except ImportError:
+    # Run directly as a script from within src/
+    from IntegerALU import IntegerALU
+    from FPALU import FPUnit
+    from ReservationStation import ReservationStation
+
+# Fields every description must give, and the defaults of the others
+REQUIRED_FIELDS = ["name", "ops", "rs", "count"]
+DEFAULT_FIELDS = {"pipelined": False, "depth": 1, "buffer": 1}
+
+class FUClass:
+    """
+    This class builds one class of functional units from a declarative
+    description, and holds its reservation station and units.
+
+    A description is a dictionary with the fields
+
+        name       A string naming the class in dumps and statistics
+        key        An optional short string naming its units in statistics,
+                   the name without spaces by default
+        ops        A dictionary mapping each supported operation to its latency
+        rs         An integer representing the reservation station entries
+        count      An integer representing the number of units
+        pipelined  An optional boolean, False (the default) for units which
+                   hold one operation at a time
+        depth      An optional integer representing the operations each
+                   pipelined unit holds at once
+        buffer     An optional integer representing the results each unit
+                   buffers before stalling
+
+    The core drives every class the same way, so adding a class needs no
+    change to the pipeline stages.  Branches resolve on non-pipelined units
+    only, since only those report branch outcomes.
+    """
+
+    def __init__(self, description, squashed=None, evaluate=None):
+        """
+        Constructor for the FUClass class
+
+        @param description A dictionary of the fields above
+        @param squashed An optional function which, given an instruction ID,
+        returns True if that instruction was squashed by a misprediction
+        @param evaluate An optional function (ID, op, a, b) which gives each
+        result in place of the units computing it
+
+        Raises ValueError on a missing field or an unsupported combination
+        """
+        missing = [x for x in REQUIRED_FIELDS if x not in description]
+        if missing:
+            raise ValueError(f"Functional unit class {description} is missing {missing}")
+        fields = dict(DEFAULT_FIELDS, **description)
+        self.name = fields["name"]
+        self.key = fields.get("key", self.name.replace(" ", ""))
+        self.ops = {op.upper(): int(latency) for op, latency in fields["ops"].items()}
+        self.pipelined = bool(fields["pipelined"])
+        self.branches = any(op.startswith('B') for op in self.ops)
+        if self.pipelined and self.branches:
+            raise ValueError(f"Branches cannot resolve on the pipelined class [ {self.name} ]")
+
+        self.RS = ReservationStation(int(fields["rs"]), self.name, squashed=squashed)
+        if self.pipelined:
+            self.units = [FPUnit(dict(self.ops), int(fields["buffer"]), int(fields["depth"]),
+                                 squashed=squashed, name=self.name, evaluate=evaluate)
+                          for i in range(int(fields["count"]))]
+        else:
+            self.units = [IntegerALU(dict(self.ops), int(fields["buffer"]),
+                                     squashed=squashed, name=self.name, evaluate=evaluate)
+                          for i in range(int(fields["count"]))]
+
+
+    def accepts(self, op):
+        """
+        Checks if this class performs the given operation
+        """
+        return op in self.ops
+
+
+    def oldestResult(self):
+        """
+        Finds the unit holding the oldest result waiting to be written back
+
+        @return A tuple (instruction ID, unit), or None if no result is ready
+        """
+        winner = None
+        for FU in self.units:
+            if FU.isResultReady():
+                ID = FU.getResultID()
+                if winner is None or ID < winner[0]:
+                    winner = (ID, FU)
+        return winner
+
+
+    def advanceTime(self):
+        """
+        Advances the time of every unit
+        """
+        for FU in self.units:
+            FU.advanceTime()
+
+
+    def dump(self):
+        for FU in self.units:
+            FU.dump()
+
+
+def headerDescriptions(params):
+    """
+    Describes the three classes given by the header of the input file
+
+    @param params A dictionary of the parsed input file
+    @return A list of descriptions for the integer ALUs, FP adders and FP
+    multipliers, in that order
+    """
+    return [{"name": "Integer ALU", "key": "ALUI",
+             "ops": {op: params["ALUI"][1] for op in ["ADD", "ADDI", "SUB", "BNE", "BEQ"]},
+             "rs": params["ALUI"][0], "count": params["ALUI"][-1],
+             "pipelined": False, "buffer": 1},
+            {"name": "FP ALU", "key": "ALUFP",
+             "ops": {"ADD.D": params["ALUFP"][1], "SUB.D": params["ALUFP"][1]},
+             "rs": params["ALUFP"][0], "count": params["ALUFP"][-1],
+             "pipelined": True, "depth": 3, "buffer": 1},
+            {"name": "FP Multiplier", "key": "MULTFP",
+             "ops": {"MULT.D": params["MULTFP"][1]},
+             "rs": params["MULTFP"][0], "count": params["MULTFP"][-1],
+             "pipelined": True, "depth": 3, "buffer": 1}]
+
+
+def buildFUClasses(params, squashed=None, evaluate=None):
+    """
+    Builds every functional unit class: those of the input file header, then
+    those of the JSON file named by the FUConfig option, if any.  A class in
+    the file with the same name as a header class replaces it.
+
+    @param params A dictionary of the parsed input file and options
+    @param squashed An optional function which, given an instruction ID,
+    returns True if that instruction was squashed by a misprediction
+    @param evaluate An optional function (ID, op, a, b) which gives each
+    result in place of the units computing it
+    @return A list of FUClass instances, in order of CDB priority
+
+    With the UnifiedRS option every class shares one reservation station,
+    of UnifiedRSEntries entries or by default as many as the split stations
+    had together, and each class selects only the operations it performs.
+    """
+    descriptions = headerDescriptions(params)
+    if params.get("FUConfig"):
+        with open(params["FUConfig"], 'r') as configFile:
+            for description in json.load(configFile):
+                names = [x["name"] for x in descriptions]
+                if description.get("name") in names:
+                    descriptions[names.index(description["name"])] = description
+                else:
+                    descriptions.append(description)
+    classes = [FUClass(x, squashed=squashed, evaluate=evaluate) for x in descriptions]
+    if params.get("UnifiedRS"):
+        size = params.get("UnifiedRSEntries") or sum(x.RS.size for x in classes)
+        shared = ReservationStation(size, "Unified", squashed=squashed)
+        for fuClass in classes:
+            fuClass.RS = shared
+    return classes
+
+
+def uniqueStations(classes):
+    """
+    Lists the reservation stations of the given classes, each once
+
+    @param classes A list of FUClass instances
+    @return A list of ReservationStation instances
+    """
+    stations = []
+    for fuClass in classes:
+        if not any(x is fuClass.RS for x in stations):
+            stations.append(fuClass.RS)
+    return stations
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    params = {"ALUI": [4, 1, 1], "ALUFP": [3, 3, 1], "MULTFP": [2, 20, 1]}
+    myClasses = buildFUClasses(params)
+    myClasses.append(FUClass({"name": "FP Divider", "ops": {"DIV.D": 12}, "rs": 2, "count": 2}))
+    for fuClass in myClasses:
+        print(fuClass.name, fuClass.key, fuClass.ops, fuClass.pipelined, fuClass.branches,
+              len(fuClass.units), fuClass.RS.size)
+    divider = myClasses[-1]
+    divider.units[1].execute(7, "DIV.D", 1.0, 8.0)
+    divider.units[0].execute(9, "DIV.D", 3.0, 0.0)
+    for i in range(12):
+        divider.advanceTime()
+    print(divider.oldestResult()[0], divider.units[1].getResult())
+    params.update(UnifiedRS=1, UnifiedRSEntries=0)
+    myClasses = buildFUClasses(params)
+    print([x.RS.name for x in myClasses], [x.size for x in uniqueStations(myClasses)])
+    try:
+        FUClass({"name": "Bad", "ops": {"BNE": 1}, "rs": 1, "count": 1, "pipelined": True})
+    except ValueError as e:
+        print(e)
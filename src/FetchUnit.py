@@ -0,0 +1,315 @@
+# @file         FetchUnit.py
+# @authors      Stephen
+
+from collections import deque
+
+# Local constants to improve readability of fetch buffer entries
+INSTR = 0
+PC = 1
+TAKEN = 2
+TARGET = 3
+
+class FetchUnit:
+    """
+    This class models the front end: it fetches instructions from the
+    InstructionQueue into a fetch buffer, from which the issue stage takes
+    them in order.
+
+    Up to `width` instructions are fetched per cycle.  A fetch group ends
+    early at a predicted taken branch, at the end of an instruction cache
+    line, or when the buffer fills.  Branches are predicted as they are
+    fetched and fetch carries on from the predicted next PC.
+
+    Each buffer entry is [<instruction>, <PC>, <predicted taken>,
+    <decoded target>], the last two being None for non-branches.
+    Instruction IDs are only assigned when an entry is taken by issue.
+
+    An optional Cache instance models the instruction cache; a miss stops
+    fetch until the line is filled.  An optional LoopBuffer instance replays
+    tight loops once it locks onto one, bypassing the instruction cache and
+    branch prediction.  A redirect from the back end flushes the buffer and
+    stops fetch for the redirect penalty.
+    """
+
+    def __init__(self, IQ, branch, width=1, bufferSize=1, icache=None, redirectPenalty=0,
+                 loopBuffer=None):
+        """
+        Constructor for the FetchUnit class
+
+        @param IQ An InstructionQueue instance holding the program and PC
+        @param branch A BranchUnit instance used to predict fetched branches
+        @param width An optional integer representing the instructions
+        fetched per cycle
+        @param bufferSize An optional integer representing the fetch buffer
+        capacity in instructions
+        @param icache An optional Cache instance for the instruction cache
+        @param redirectPenalty An optional integer representing the cycles
+        fetch is idle after a redirect from the back end
+        @param loopBuffer An optional LoopBuffer instance for tight loops
+        """
+        if width < 1 or bufferSize < 1:
+            raise ValueError(f"Fetch unit initialized with invalid width {width} or buffer {bufferSize}")
+        self.IQ = IQ
+        self.branch = branch
+        self.width = width
+        self.size = bufferSize
+        self.icache = icache
+        self.redirectPenalty = redirectPenalty
+        self.loopBuffer = loopBuffer
+        self.buffer = deque()
+
+        # Fetch is idle until stallUntil, for the reason in stallCause
+        self.stallUntil = 0
+        self.stallCause = None
+        # Line whose miss has already been sent to the instruction cache
+        self.missLine = None
+
+        self.stats = {"cycles": 0, "fetched": 0, "icacheStalls": 0,
+                      "redirectStalls": 0, "bufferFull": 0}
+
+
+    def fetchStage(self, time):
+        """
+        Fetches the next group of instructions into the fetch buffer
+
+        @param time An integer representing the current cycle
+        @return An integer representing the number of instructions fetched
+        """
+        if self.IQ.empty():
+            return 0
+        self.stats["cycles"] += 1
+        if time < self.stallUntil:
+            self.stats[self.stallCause] += 1
+            return 0
+        if len(self.buffer) >= self.size:
+            self.stats["bufferFull"] += 1
+            return 0
+        if self.loopBuffer is not None and self.loopBuffer.isLocked():
+            return self.streamLoop()
+
+        fetched = 0
+        groupLine = None
+        while fetched < self.width and len(self.buffer) < self.size and not self.IQ.empty():
+            if self.icache is not None:
+                line = self.icache.locate(4 * self.IQ.getPC())[0]
+                if groupLine is None:
+                    if line != self.missLine:
+                        latency = self.icache.access(4 * self.IQ.getPC(), False, time)
+                        if latency > 0:
+                            # Wait for the fill, then fetch from the line
+                            self.missLine = line
+                            self.stall(time + latency, "icacheStalls")
+                            self.stats["icacheStalls"] += 1
+                            break
+                    self.missLine = None
+                    groupLine = line
+                elif line != groupLine:
+                    break
+
+            instr, fetchPC = self.IQ.fetch()
+            entry = [instr, fetchPC, None, None]
+            self.buffer.append(entry)
+            fetched += 1
+
+            if instr[0] == "BNE" or instr[0] == "BEQ":
+                fallthrough = fetchPC + 1
+                entry[TARGET] = fallthrough + int(instr[3])
+                entry[TAKEN], nextPC = self.branch.predict(fetchPC, fallthrough, entry[TARGET])
+                self.IQ.setPC(nextPC)
+                if self.loopBuffer is not None:
+                    self.loopBuffer.observe(fetchPC, entry[TARGET], entry[TAKEN], self.IQ.instructions)
+                if entry[TAKEN]:
+                    break
+
+        self.stats["fetched"] += fetched
+        return fetched
+
+
+    def streamLoop(self):
+        """
+        Fetches the next group of instructions from the locked loop buffer.
+        The group does not end at the taken branch closing the loop.
+
+        @return An integer representing the number of instructions fetched
+        """
+        fetched = 0
+        while fetched < self.width and len(self.buffer) < self.size:
+            entry, nextPC = self.loopBuffer.next()
+            self.buffer.append(entry)
+            self.IQ.setPC(nextPC)
+            fetched += 1
+        self.stats["fetched"] += fetched
+        return fetched
+
+
+    def stall(self, until, cause):
+        """
+        Stops fetch until the given cycle
+
+        @param until An integer representing the first cycle fetch may resume
+        @param cause A string naming the stall counter to charge
+        """
+        if until > self.stallUntil:
+            self.stallUntil = until
+            self.stallCause = cause
+
+
+    def stalled(self, time):
+        """
+        Determines why fetch is idle, if it is
+
+        @param time An integer representing the current cycle
+        @return The name of the stall counter being charged, or None if fetch
+        is not stalled
+        """
+        return self.stallCause if time < self.stallUntil else None
+
+
+    def peek(self):
+        """
+        Getter for the name of the instruction at the head of the buffer
+
+        @return A string representing the opcode, or None if the buffer is
+        empty
+        """
+        if not self.buffer:
+            return None
+        return self.buffer[0][INSTR][0]
+
+
+    def peekInstruction(self):
+        """
+        Getter for the whole instruction at the head of the buffer
+
+        @return A tuple representing the decoded instruction, or None if the
+        buffer is empty
+        """
+        if not self.buffer:
+            return None
+        return self.buffer[0][INSTR]
+
+
+    def pop(self):
+        """
+        Removes the instruction at the head of the buffer for issue
+
+        @return A list with the new instruction ID, the instruction data
+        tuple, the PC, the predicted direction and the decoded target
+        """
+        entry = self.buffer.popleft()
+        return [ self.IQ.assignID() ] + entry
+
+
+    def redirect(self, PC, time):
+        """
+        Restarts fetch at a new PC after a misprediction or replay
+
+        @param PC A non-negative integer representing the new PC
+        @param time An integer representing the current cycle
+        @return None
+
+        Everything in the fetch buffer is on the wrong path and is dropped.
+        """
+        self.buffer.clear()
+        self.missLine = None
+        if self.loopBuffer is not None:
+            self.loopBuffer.unlock()
+        self.IQ.setPC(PC)
+        self.stall(time + 1 + self.redirectPenalty, "redirectStalls")
+
+
+    def empty(self):
+        """
+        Determines if there is nothing left to fetch or issue
+
+        @return True if the buffer is empty and the PC is past the end of the
+        program
+        """
+        return not self.buffer and self.IQ.empty()
+
+
+    def getStats(self):
+        """
+        Getter for the fetch counters
+
+        @return A dictionary of counters and the fetched instructions per
+        active fetch cycle
+        """
+        stats = dict(self.stats)
+        stats["fetchRate"] = stats["fetched"] / stats["cycles"] if stats["cycles"] > 0 else 0.0
+        if self.loopBuffer is not None:
+            stats["loopBuffer"] = self.loopBuffer.getStats()
+        return stats
+
+
+    def dumpStats(self):
+        """
+        Pretty-prints the fetch counters
+        """
+        stats = self.getStats()
+        print("Fetch Unit".ljust(48, '=').rjust(80,'='))
+        print(f"Fetch cycles:\t\t{stats['cycles']}")
+        print(f"Fetched:\t\t{stats['fetched']}")
+        print(f"I-cache stalls:\t\t{stats['icacheStalls']}")
+        print(f"Redirect stalls:\t{stats['redirectStalls']}")
+        print(f"Buffer full:\t\t{stats['bufferFull']}")
+        print(f"Fetch rate:\t\t{stats['fetchRate']:.2f}")
+        if self.loopBuffer is not None:
+            print(f"Loop buffer locks:\t{stats['loopBuffer']['locks']}")
+            print(f"Loop buffer fetched:\t{stats['loopBuffer']['streamed']}")
+        print()
+
+
+    def dump(self):
+        """
+        Pretty-prints the contents of the fetch buffer
+        """
+        print("Fetch Buffer".ljust(48, '=').rjust(80,'='))
+        print("PC\tInstruction\t\t\tPrediction")
+        for entry in self.buffer:
+            prediction = "" if entry[TAKEN] is None else ("taken" if entry[TAKEN] else "not taken")
+            print(f"{entry[PC]}\t{entry[INSTR]}\t{prediction}")
+        if self.stallUntil > 0:
+            print(f"Stalled until {self.stallUntil}")
+        print()
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    try:
+        from src.InstructionQueue import InstructionQueue
+        from src.BranchUnit import BranchUnit
+        from src.Cache import Cache
+        from src.LoopBuffer import LoopBuffer
+    except ImportError:
+        from InstructionQueue import InstructionQueue
+        from BranchUnit import BranchUnit
+        from Cache import Cache
+        from LoopBuffer import LoopBuffer
+    insts = [
+        ("ADDI", "R1", "R0", 2),
+        ("ADD.D", "F1", "F2", "F3"),
+        ("ADDI", "R1", "R1", -1),
+        ("BNE", "R1", "R0", -2),
+        ("ADD", "R2", "R2", "R2"),
+    ]
+    myFetch = FetchUnit(InstructionQueue(insts), BranchUnit(), width=2, bufferSize=4,
+                        icache=Cache(32, 1, 8, 0, 3, MSHRs=1, name="Instruction cache"))
+    for t in range(14):
+        print(t, myFetch.fetchStage(t), [e[PC] for e in myFetch.buffer])
+        if t == 5:
+            print(myFetch.pop(), myFetch.pop())
+            myFetch.redirect(4, t)
+    myFetch.dump()
+    myFetch.dumpStats()
+
+    # A trained backward branch locks the loop buffer on its second iteration
+    myBranch = BranchUnit()
+    myBranch.update(3, True, 2)
+    myFetch = FetchUnit(InstructionQueue(insts), myBranch, width=2, bufferSize=4,
+                        loopBuffer=LoopBuffer(4))
+    for t in range(8):
+        print(t, myFetch.fetchStage(t), [e[PC] for e in myFetch.buffer], myFetch.loopBuffer.isLocked())
+        myFetch.buffer.clear()
+    myFetch.redirect(4, t)
+    print(myFetch.loopBuffer.isLocked(), myFetch.getStats()["loopBuffer"])
@@ -0,0 +1,155 @@
+# @file         InflightWindow.py
+# @authors      Stephen
+
+from array import array
+
+# Number of stages tracked per instruction: issue, execute, memory,
+# writeback, commit
+STAGE_COUNT = 5
+
+# Stored in place of a stage the instruction has not reached
+NOT_REACHED = -1
+
+class InflightWindow:
+    """
+    This class holds the stage timings of the instructions in flight.
+
+    Records live in one preallocated array of <capacity> slots, each holding
+    the cycle every stage was reached, so the window never grows however long
+    the run is.  An instruction takes a slot when it issues and gives it back
+    when it commits or is squashed.  Since every instruction in flight holds
+    a ROB entry, a capacity equal to the ROB size is always enough.
+    """
+
+    def __init__(self, capacity):
+        """
+        Constructor for the InflightWindow class
+
+        @param capacity An integer representing the most instructions which
+        can be in flight at once
+        """
+        self.capacity = capacity
+        self.cycles = array('q', [NOT_REACHED] * (capacity * STAGE_COUNT))
+        # The stage each slot reached most recently
+        self.latest = array('q', [NOT_REACHED] * capacity)
+        self.freeSlots = list(range(capacity - 1, -1, -1))
+        self.slots = {}
+
+
+    def issue(self, ID, cycle):
+        """
+        Opens a record for a newly issued instruction
+
+        @param ID An integer representing the instruction
+        @param cycle An integer representing the current cycle
+        @return None
+        """
+        if not self.freeSlots:
+            raise RuntimeError(f"In-flight window of {self.capacity} entries is full")
+        slot = self.freeSlots.pop()
+        self.slots[ID] = slot
+        base = slot * STAGE_COUNT
+        self.cycles[base:base + STAGE_COUNT] = array('q', [cycle] + [NOT_REACHED] * (STAGE_COUNT - 1))
+        self.latest[slot] = cycle
+
+
+    def update(self, ID, stage, cycle):
+        """
+        Records the cycle an instruction reached a stage
+
+        @param ID An integer representing the instruction
+        @param stage An integer representing the stage, 0 being issue
+        @param cycle An integer representing the current cycle
+        @return True if the instruction is in the window, False otherwise
+        """
+        slot = self.slots.get(ID)
+        if slot is None:
+            return False
+        self.cycles[slot * STAGE_COUNT + stage] = cycle
+        self.latest[slot] = cycle
+        return True
+
+
+    def lastCycle(self, ID):
+        """
+        Getter for the cycle an instruction reached its most recent stage
+
+        @param ID An integer representing the instruction
+        @return An integer, or None if the instruction is not in flight
+        """
+        slot = self.slots.get(ID)
+        if slot is None:
+            return None
+        return self.latest[slot]
+
+
+    def get(self, ID):
+        """
+        Getter for an instruction's stage timings
+
+        @param ID An integer representing the instruction
+        @return A list of cycles, None for stages not reached, or None if the
+        instruction is not in flight
+        """
+        slot = self.slots.get(ID)
+        if slot is None:
+            return None
+        base = slot * STAGE_COUNT
+        return [None if x == NOT_REACHED else x for x in self.cycles[base:base + STAGE_COUNT]]
+
+
+    def remove(self, ID):
+        """
+        Closes an instruction's record, freeing its slot
+
+        @param ID An integer representing the instruction
+        @return The instruction's stage timings as from get()
+        """
+        stages = self.get(ID)
+        self.freeSlots.append(self.slots.pop(ID))
+        return stages
+
+
+    def squash(self, cutoff):
+        """
+        Drops every instruction after the given one
+
+        @param cutoff An integer representing the youngest surviving
+        instruction
+        @return None
+        """
+        for ID in [x for x in self.slots if x > cutoff]:
+            self.remove(ID)
+
+
+    def count(self):
+        """
+        Getter for the number of instructions in flight
+        """
+        return len(self.slots)
+
+
+    def dump(self):
+        for ID in sorted(self.slots):
+            print(f"{ID}:{self.get(ID)}")
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    myWindow = InflightWindow(3)
+    myWindow.issue(0, 0)
+    myWindow.issue(1, 1)
+    myWindow.update(0, 1, 1)
+    myWindow.issue(2, 2)
+    myWindow.update(0, 3, 2)
+    print(myWindow.lastCycle(0), myWindow.lastCycle(1), myWindow.lastCycle(7))
+    myWindow.dump()
+    myWindow.squash(1)
+    print(myWindow.remove(0), myWindow.count(), myWindow.update(2, 1, 3))
+    myWindow.issue(3, 3)
+    myWindow.issue(4, 3)
+    myWindow.dump()
+    try:
+        myWindow.issue(5, 4)
+    except RuntimeError as e:
+        print(e)
@@ -18,40 +18,41 @@ class InstructionQueue:
         self.nextID = 0
 
 
-    def fetch(self, offset=0):
+    def fetch(self):
         """
-        Gets the next instruction to execute
+        Gets the instruction at the PC and advances the PC past it
 
-        @param offset An optional integer representing the offset from the
-        current PC in units of instructions
-        @return A list with the instruction ID, and the instruction data tuple
+        @return A list with the instruction data tuple and the PC (word
+        address) the instruction was fetched from
 
-        This function will by default use the internal PC to determine the
-        next instruction to fetch.  When a branch instruction indicates that
-        the target should jump forward or back, this offset can be passed in
-        to replicate that behavior.
+        Instruction IDs are handed out separately by assignID() when an
+        instruction issues, so instructions fetched down a path which is
+        later abandoned do not use up IDs.
         """
-        temp = self.next + offset
-        temp2 = self.nextID
+        PC = self.next
+        self.next = PC + 1
+        return [ self.instructions[PC], PC ]
+
+
+    def assignID(self):
+        """
+        Gets a unique ID for the next instruction to issue
+
+        @return An integer representing the instruction ID
+        """
+        ID = self.nextID
         self.nextID += 1
-        self.next = temp + 1
-        return [ temp2, self.instructions[temp] ]
+        return ID
 
 
-    def empty(self, offset=0):
+    def empty(self):
         """
         Determines if PC has reached the end of the instruction queue.
-        @param offset An optional integer representing the offset from the
-        current PC to investigate.
-        @return True if PC plus the offset is greater than the instruction
-        queue length, false otherwise
-
-        Note: offset is used to handle a corner case where the last
-        instruction is a branch.  In this case, the branch offset can be used
-        to determine if the program is truly complete or if execution will
-        resume elsewhere.
+
+        @return True if PC is at or past the end of the instruction queue,
+        false otherwise
         """
-        return (self.next + offset >= len(self.instructions))
+        return (self.next >= len(self.instructions))
 
 
     def dump(self):
@@ -70,16 +71,14 @@ class InstructionQueue:
         print()
 
 
-    def peek(self, offset=0):
+    def getPC(self):
         """
-        Retrieve a copy of the next instruction type and its unique ID
+        Getter for the current PC
 
-        @param offset An optional integer representing the offset from the
-        current PC to peek at
+        @return A non-negative integer representing the word address of the
+        next instruction to fetch
         """
-        print(f"PEEK at next {self.next} with offset {offset}:{self.instructions[self.next + offset][0]}")
-        assert(self.next + offset >= 0)
-        return (int(self.nextID), self.instructions[self.next + offset][0])
+        return self.next
 
 
     def setPC(self, PC):
@@ -107,6 +106,7 @@ if __name__ == "__main__":
     myQ.dump()
     myQ.fetch()
     myQ.dump()
-    myQ.fetch(-3)
+    myQ.setPC(0)
+    print(myQ.fetch(), myQ.assignID(), myQ.assignID(), myQ.empty())
     myQ.dump()
 
@@ -1,6 +1,15 @@
 # @file     IntegerALU
 # @authors  Stephen
 
+try:
+    from src.Operations import OPERATIONS
+except ImportError:
+    # Run directly as a script from within src/
+    from Operations import OPERATIONS
+
+# Operations of the integer ALU when it is given a single latency
+INTEGER_OPS = ("ADD", "ADDI", "SUB", "BNE", "BEQ")
+
 class IntegerALU:
     """
     This class implements a simple ALU for integer values.
@@ -9,26 +18,41 @@ class IntegerALU:
     instantiation for debugging purposes.  The latency of each instruction is
     encoded along with the maximum output buffer size at instantiation.  This
     implies that this unit is non-pipelined.
+
+    Given a dictionary of latencies instead, it performs any operation in
+    that dictionary, which is how other non-pipelined units are built.
     """
 
 
-    def __init__(self, latency, bufferLen):
+    def __init__(self, latency, bufferLen, squashed=None, name="Integer ALU", evaluate=None):
         """
         Constructor for the IntegerALU class
 
         @param latency An integer value representing the number of cycles
-        required per operation
+        required per operation, or a dictionary mapping each supported
+        operation to its number of cycles
         @param bufferLen An integer value representing how many results to
         buffer on output before stalling further inputs
+        @param squashed An optional function which, given an instruction ID,
+        returns True if that instruction was squashed by a misprediction
+        @param name An optional string used to identify this unit in the
+        dump() output
+        @param evaluate An optional function (ID, op, a, b) which gives each
+        result in place of computing it, as in trace-driven runs
 
         """
+        if isinstance(latency, int):
+            latency = {op: latency for op in INTEGER_OPS}
         self.latency = latency
+        self.name = name
         self.nextFreeTime = -1
         self.time = 0
         self.activeInstruction = None
         self.result = None
         self.bufferLen = bufferLen
         self.buffer = []
+        self.squashed = squashed if squashed is not None else (lambda ID: False)
+        self.evaluate = evaluate
 
 
     def busy(self):
@@ -37,6 +61,7 @@ class IntegerALU:
 
         @return True if still busy, False otherwise
         """
+        self.dropSquashed()
         return (self.time < self.nextFreeTime) and (len(self.buffer) < self.bufferLen)
 
 
@@ -53,24 +78,21 @@ class IntegerALU:
 
         Raises ValueError on bad operation or bad operands
         """
-        self.nextFreeTime = self.time + self.latency
+        if op not in self.latency:
+            raise ValueError(f"Unknown operation [ {op} ] in {self.name}, time [ {self.time} ]")
+        self.nextFreeTime = self.time + self.latency[op]
         self.activeInstruction = (ID, op, a, b)
-        if "ADD" == op or "ADDI" == op:
-            self.result = int(a + b)
-        elif "SUB" == op:
-            self.result = int(a - b)
-        elif "BNE" == op:
-            self.result = (a!=b)
-        elif "BEQ" == op:
-            self.result = (a==b)
+        if self.evaluate is None:
+            self.result = OPERATIONS[op](a, b)
         else:
-            raise ValueError(f"Unknown operation [ {op} ] in integer ALU, time [ {self.time} ]")
+            self.result = self.evaluate(ID, op, a, b)
 
 
     def isResultReady(self):
         """
         Getter determines if a result is waiting to be written back
         """
+        self.dropSquashed()
         return len(self.buffer) > 0
 
 
@@ -92,6 +114,7 @@ class IntegerALU:
         """
         Check if the next result is a branch outcome
         """
+        self.dropSquashed()
         if len(self.buffer) > 0:
             return self.buffer[0][2]
         return False
@@ -127,18 +150,35 @@ class IntegerALU:
             self.nextFreeTime = -1
 
 
-    def purgeAfterMispredict(self, BID):
+    def inFlight(self):
         """
-        Removes all currently queued and completed instructions with ID > BID
+        Getter for the number of instructions executing, without dropping
+        squashed ones
 
-        @param BID An integer representing the instruction ID of the
-        mispredicted branch
+        @return 1 if an instruction is executing, 0 otherwise
+        """
+        return 0 if self.activeInstruction is None else 1
+
+
+    def inFlightIDs(self):
+        """
+        Getter for the IDs of the instructions executing or buffered, without
+        dropping squashed ones
         """
-        self.buffer = [ x for x in self.buffer if x[0] <= BID ]
-        if self.activeInstruction is not None:
-            if self.activeInstruction[0] > BID:
-                self.activeInstruction = None
-                self.nextFreeTime = -1
+        active = [] if self.activeInstruction is None else [self.activeInstruction[0]]
+        return active + [x[0] for x in self.buffer]
+
+
+    def dropSquashed(self):
+        """
+        Cancels the active instruction and discards the oldest buffered
+        results if they were squashed by a misprediction
+        """
+        if self.activeInstruction is not None and self.squashed(self.activeInstruction[0]):
+            self.activeInstruction = None
+            self.nextFreeTime = -1
+        while len(self.buffer) > 0 and self.squashed(self.buffer[0][0]):
+            self.buffer.pop(0)
 
 
 
@@ -146,7 +186,7 @@ class IntegerALU:
         """
         Pretty-prints the state of the ALU
         """
-        print("Integer ALU".ljust(48, '=').rjust(80,'='))
+        print(self.name.ljust(48, '=').rjust(80,'='))
         print(f"Time:\t\t\t{self.time}")
         print(f"Busy:\t\t\t{self.busy()}")
         print(f"Instruction:\t\t{self.activeInstruction}")
@@ -1,11 +1,13 @@
 # @file         LdStQ.py
 # @authors      Yihao, Stephen
 
+from bisect import bisect_left, insort
+
 class LdStQ:
     '''
     This class implements a generic load and store queue
     '''
-    def __init__(self, size, latency, MMU):
+    def __init__(self, size, latency, MMU, squashed=None, predictor=None, speculate=True):
         '''
         Constructor for the St queue class
 
@@ -17,15 +19,42 @@ class LdStQ:
         @param q A list representing the store queue
         @param curInstr An tuple representing the current instruction in the execution stage
         @param MMU A reference to an instance of the MemoryUnit class
+        @param squashed An optional function which, given an instruction ID,
+        returns True if that instruction was squashed by a misprediction
+        @param predictor An optional reference to an instance of the
+        StoreSets class, consulted to hold back loads which previously read
+        stale data
+        @param speculate An optional boolean, if False loads always wait for
+        every older store address to be known
         '''
         self.size = size
         self.q = []
         self.time = 0
         self.buffer = []
+        # Results forwarded from a store this cycle, buffered next cycle
+        self.forwarded = []
         self.latency = latency
         self.nextFreeTime = -1
         self.curInstr = None
         self.MMU = MMU
+        self.squashed = squashed if squashed is not None else (lambda ID: False)
+
+        # Memory disambiguation
+        self.predictor = predictor
+        self.speculate = speculate
+        # Stores in the queue by ID, the IDs of those without an address yet,
+        # and the IDs of those with an address indexed by word, all sorted
+        self.stores = {}
+        self.unresolved = []
+        self.storeIndex = {}
+        # Loads which went ahead of an older store with an unknown address:
+        # ID -> (word, PC, ID of the store forwarded from or -1)
+        self.specLoads = {}
+        # Oldest load found to have read stale data, as (ID, PC)
+        self.violation = None
+
+        # Where loads got their data from
+        self.stats = {"forwarded": 0, "memory": 0, "partial": 0}
 
 
     def busy(self):
@@ -37,36 +66,129 @@ class LdStQ:
         self.curInstr = self.q[position]
 
 
+    def youngestOlder(self, IDs, ID):
+        '''
+        Given a sorted list of store IDs, finds the youngest live store older
+        than the given instruction
+
+        @param IDs A sorted list of integers representing store instructions
+        @param ID An integer representing the younger instruction
+        @return An integer representing the store, or None if there is none
+
+        Squashed stores met along the way are dropped from the list.
+        '''
+        pos = bisect_left(IDs, ID)
+        while pos > 0:
+            if not self.squashed(IDs[pos - 1]):
+                return IDs[pos - 1]
+            IDs.pop(pos - 1)
+            pos -= 1
+        return None
+
+
+    def findSource(self, position):
+        '''
+        Given the position of a load with a known address, determines where
+        its data must come from
+
+        @param position An integer representing the position of the load in
+        the queue
+        @return A tuple (source, store, speculative).  source is "forward" if
+        the youngest older store to the same address has its data, "wait" if
+        the load must stall, or "memory" otherwise.  store is the matching
+        store entry or None, and speculative is True if an older store with an
+        unknown address was passed over.
+
+        The youngest older store to the same word is looked up in the store
+        index, so the cost does not grow with the number of stores queued.
+        The memory is word addressed, so a store to the same word at a
+        different byte address only partially overlaps the load.  Its data
+        cannot be forwarded and the load waits for it to reach memory.
+        '''
+        load = self.q[position]
+        sourceID = self.youngestOlder(self.storeIndex.get(int(load[3]/4), []), load[0])
+
+        # Stores between the source and the load whose addresses are unknown
+        speculative = False
+        blockerID = self.youngestOlder(self.unresolved, load[0])
+        if blockerID is not None and (sourceID is None or blockerID > sourceID):
+            if not self.speculate:
+                return "wait", None, speculative
+            waitFor = load[8]
+            if waitFor is not None and (sourceID is None or waitFor > sourceID):
+                pos = bisect_left(self.unresolved, waitFor)
+                if pos < len(self.unresolved) and self.unresolved[pos] == waitFor:
+                    return "wait", None, speculative
+            speculative = True
+
+        if sourceID is None:
+            return "memory", None, speculative
+        store = self.stores[sourceID]
+        if store[3] != load[3]:
+            if not load[9]:
+                load[9] = True
+                self.stats["partial"] += 1
+            return "wait", store, speculative
+        if self.instructionReady(store):
+            return "forward", store, speculative
+        return "wait", store, speculative
+
+
     def doForwards(self):
         for i, entry in enumerate(self.q):
-            if entry[1] == 'LD' and isinstance(entry[3], int): # if the address of this load is known
-                for j in range(i): #find all previous stores
-                    idx = len(self.q) - 1 - j
-                    # if the instruction is ready and we have a matching address
-                    if (self.q[idx][1] == 'SD') and (self.instructionReady(self.q[idx])) and (self.q[idx][3] == entry[3]):
-                        # get data from the store and put it directly in the
-                        # output buffer
-                        self.buffer.append(entry[0], self.q[idx][2])
-                        self.q.pop(i)
-                        return entry[0]
-                    else:
-                        return -1
+            if self.squashed(entry[0]):
+                continue
+            if entry[1] == 'LD' and entry[5] and not entry[6]: # if the address of this load is known
+                source, store, speculative = self.findSource(i)
+                if source == "forward":
+                    # get data from the store, forwarding takes one cycle
+                    # before it reaches the output buffer
+                    self.forwarded.append([entry[0], store[2]])
+                    if speculative:
+                        self.specLoads[entry[0]] = (int(entry[3]/4), entry[7], store[0])
+                    self.stats["forwarded"] += 1
+                    self.q.pop(i)
+                    return entry[0]
         return -1
 
 
     def issueReadyLoad(self):
         for i, entry in enumerate(self.q):
+            if self.squashed(entry[0]):
+                continue
             if entry[1] == 'LD' and self.instructionReady(entry) and not self.MMU.busy() and not entry[6]:
+                source, store, speculative = self.findSource(i)
+                if source != "memory" or not self.MMU.canAccept(entry[3], entry[0]):
+                    continue
                 self.MMU.execute(entry)
                 entry[6] = True
+                if speculative:
+                    self.specLoads[entry[0]] = (int(entry[3]/4), entry[7], -1)
+                self.stats["memory"] += 1
                 return entry[0]
 
         return -1
 
 
+    def loadsWaitingForMemory(self):
+        '''
+        Determines if a ready load, which cannot forward from a store, has yet
+        to be accepted by the memory unit
+        '''
+        for i, entry in enumerate(self.q):
+            if self.squashed(entry[0]):
+                continue
+            if entry[1] == 'LD' and self.instructionReady(entry) and not entry[6]:
+                if self.findSource(i)[0] == "memory":
+                    return True
+        return False
+
+
     def issueReadyStore(self):
         for i, entry in enumerate(self.q):
-            if entry[1] == 'SD' and self.instructionReady(entry) and not self.MMU.busy() and not entry[6]:
+            if self.squashed(entry[0]):
+                continue
+            if entry[1] == 'SD' and self.instructionReady(entry) and not entry[6] and self.MMU.canAccept(entry[3], entry[0]):
                 self.MMU.execute(entry)
                 entry[6] = True
                 return entry[0]
@@ -74,8 +196,13 @@ class LdStQ:
 
 
     def checkMMU(self):
-        if self.MMU.isResultReady():
-            if self.MMU.buffer[0][1] is None:
+        self.MMU.dropFaults(self.squashed)
+        while self.MMU.isResultReady():
+            if self.squashed(self.MMU.buffer[0][0]):
+                # A load which was squashed while in memory, drop it
+                self.remove(self.MMU.buffer[0][0])
+                self.MMU.getResult()
+            elif self.MMU.buffer[0][1] is None:
                 print("STORE COMPLETE MMU")
                 self.remove(self.MMU.buffer[0][0])
                 self.MMU.getResult()
@@ -103,16 +230,89 @@ class LdStQ:
             if entry[0] == instr[0]:
                 entry[3] = entry[3] + entry[4]
                 entry[5] = True
+                if entry[1] == 'SD':
+                    self.unresolved.pop(bisect_left(self.unresolved, entry[0]))
+                    insort(self.storeIndex.setdefault(int(entry[3]/4), []), entry[0])
+                    if self.predictor is not None:
+                        self.predictor.removeStore(entry[7], entry[0])
+                    self.checkViolation(entry)
+
+
+    def checkViolation(self, store):
+        '''
+        Given a store whose address was just computed, finds any younger load
+        which already read stale data for that address
+
+        @param store A list representing the store entry
+        @return None
+
+        The oldest violating load is recorded for getViolation(), and the
+        load and store are placed in the same store set.  Speculative loads
+        with no older unresolved store left are forgotten.
+        '''
+        word = int(store[3]/4)
+        for ID, (loadWord, PC, source) in self.specLoads.items():
+            if ID > store[0] and loadWord == word and source < store[0] and not self.squashed(ID):
+                if self.violation is None or ID < self.violation[0]:
+                    self.violation = (ID, PC)
+                if self.predictor is not None:
+                    self.predictor.train(PC, store[7])
+
+        oldest = float('inf')
+        for ID in self.unresolved:
+            if not self.squashed(ID):
+                oldest = ID
+                break
+        self.specLoads = { k:v for k,v in self.specLoads.items() if k > oldest and not self.squashed(k) }
+
+
+    def getViolation(self):
+        '''
+        Getter for the oldest load which violated memory ordering since the
+        last call
+
+        @return A tuple (ID, PC) of the load to squash and refetch, or None
+        '''
+        violation = self.violation
+        self.violation = None
+        return violation
 
 
     def isFull(self):
         '''
         Getter to determie if the St queue can accept new entries
+
+        Squashed entries are only dropped here, when they would otherwise
+        cause a structural stall.
         '''
+        self.dropSquashed()
+        if len(self.q) == self.size:
+            self.purgeSquashed()
         return (len(self.q) == self.size) or (len(self.buffer) > 0)
 
 
-    def add(self, ID, instr, robid, value, offset):
+    def purgeSquashed(self):
+        '''
+        Removes every squashed entry from the queue
+        '''
+        for entry in self.q:
+            if self.squashed(entry[0]):
+                self.forget(entry)
+        self.q = [x for x in self.q if not self.squashed(x[0])]
+
+
+    def heldIDs(self):
+        '''
+        Getter for the IDs of every instruction the queue still holds,
+        without dropping squashed ones
+        '''
+        IDs = [x[0] for x in self.q] + [x[0] for x in self.buffer] + [x[0] for x in self.forwarded]
+        if self.curInstr is not None:
+            IDs.append(self.curInstr[0])
+        return IDs + list(self.specLoads)
+
+
+    def add(self, ID, instr, robid, value, offset, PC=0):
         '''
         Adds a new entry to the end of the st queue
 
@@ -120,26 +320,76 @@ class LdStQ:
         @param robid An integar representing the ROB id of the target address
         @param value An integar representing the memory address storing the value
         @param offset An integar representing the offset of value address
+        @param PC An optional integer representing the word address of the
+        instruction, used by the store set predictor
 
         Note: the fifth entry indicates whether the byte address has been
         computed yet or not
         Note: the sixth entry indicates whether the instruction is being
         serviced by the MMU
+        Note: the eighth entry is the ID of the store a load was predicted to
+        depend on, or None
+        Note: the ninth entry indicates whether a load was held back by a
+        partially overlapping store
+        '''
+        waitFor = None
+        if self.predictor is not None:
+            if instr == 'SD':
+                self.predictor.addStore(PC, ID)
+            else:
+                waitFor = self.predictor.dependence(PC)
+        entry = [ID, instr, robid, value, offset, False, False, PC, waitFor, False]
+        if instr == 'SD':
+            self.stores[ID] = entry
+            self.unresolved.append(ID)
+        self.q.append(entry)
+
+
+    def forget(self, entry):
+        '''
+        Removes a store leaving the queue from the store index
+
+        @param entry A list representing the queue entry
+        @return None
+        '''
+        if entry[1] != 'SD' or self.stores.pop(entry[0], None) is None:
+            return
+        IDs = self.storeIndex.get(int(entry[3]/4), []) if entry[5] else self.unresolved
+        pos = bisect_left(IDs, entry[0])
+        if pos < len(IDs) and IDs[pos] == entry[0]:
+            IDs.pop(pos)
+        if entry[5] and len(IDs) == 0:
+            self.storeIndex.pop(int(entry[3]/4), None)
+
+
+    def pendingStores(self):
+        '''
+        Determines if a committed store has yet to finish writing memory
+
+        @return True if a store is being serviced by the MMU
         '''
-        self.q.append([ID, instr, robid, value, offset, False, False])
+        return any(x[6] for x in self.q if x[1] == 'SD' and not self.squashed(x[0]))
 
 
     def instructionReady(self, entry):
-        return entry[5] and (entry[1] == 'LD' or isinstance(entry[2], float) )
+        # Store data is ready once it is a value rather than a ROB tag,
+        # integer data is stored as a single word
+        return entry[5] and (entry[1] == 'LD' or isinstance(entry[2], (int, float)) )
 
 
-    def purgeAfterMispredict(self, BID):
-        self.q = [x for x in self.q if x[0]<=BID]
-        self.buffer = [x for x in self.buffer if x[0]<=BID]
+    def dropSquashed(self):
+        '''
+        Discards the oldest buffered results if they were squashed by a
+        misprediction
+        '''
+        while len(self.buffer) > 0 and self.squashed(self.buffer[0][0]):
+            self.buffer.pop(0)
 
 
     def advanceTime(self):
         self.time += 1
+        self.buffer.extend(self.forwarded)
+        self.forwarded = []
         if self.time == self.nextFreeTime:
             self.nextFreeTime = -1
             self.computeAddress(self.curInstr)
@@ -147,12 +397,14 @@ class LdStQ:
 
 
     def isResultReady(self):
+        self.dropSquashed()
         return len(self.buffer) > 0
 
 
     def remove(self, ID):
         for i, entry in enumerate(self.q):
             if entry[0] == ID:
+                self.forget(entry)
                 self.q.pop(i)
                 return
 
@@ -174,6 +426,33 @@ class LdStQ:
         return self.buffer[0][0]
 
 
+    def getStats(self):
+        '''
+        Getter for the load data source counters
+
+        @return A dictionary with the number of loads forwarded from a store,
+        sent to memory, and held back by a partially overlapping store, and
+        the forwarding hit rate
+        '''
+        stats = dict(self.stats)
+        total = stats["forwarded"] + stats["memory"]
+        stats["forwardRate"] = stats["forwarded"] / total if total > 0 else 0.0
+        return stats
+
+
+    def dumpStats(self):
+        '''
+        Pretty-prints the load data source counters
+        '''
+        stats = self.getStats()
+        print("Load forwarding".ljust(50, '=').rjust(80, '='))
+        print(f"Forwarded:\t{stats['forwarded']}")
+        print(f"From memory:\t{stats['memory']}")
+        print(f"Partial overlap:\t{stats['partial']}")
+        print(f"Hit rate:\t{100*stats['forwardRate']:.1f}%")
+        print()
+
+
     def dump(self):
         print("Load/Store queue".ljust(50, '=').rjust(80, '='))
         if(len(self.q) == 0):
@@ -0,0 +1,126 @@
+# @file         LoopBuffer.py
+# @authors      Stephen
+
+# Local constants to improve readability of the templates, laid out as fetch
+# buffer entries
+INSTR = 0
+PC = 1
+TAKEN = 2
+TARGET = 3
+
+class LoopBuffer:
+    """
+    This class models a loop stream buffer in the front end.
+
+    It watches the branches fetched.  When the same backward branch is
+    predicted taken on consecutive iterations, closing a body of at most
+    `size` instructions with no other branch in it, the buffer captures that
+    body as decoded templates and locks.  While it is locked, fetch replays
+    the templates instead of reading the instruction cache and predicting
+    the closing branch, which is always predicted taken, and a fetch group
+    may carry on past it into the next iteration.  A redirect from the back
+    end, such as the mispredicted loop exit, unlocks it.
+    """
+
+    def __init__(self, size):
+        """
+        Constructor for the LoopBuffer class
+
+        @param size An integer representing the most instructions a
+        captured loop body may hold
+        """
+        if size < 1:
+            raise ValueError(f"Loop buffer initialized with invalid size {size}")
+        self.size = size
+        self.templates = []
+        self.position = 0
+        # The (PC, target) of the branch seen closing a loop, and how many
+        # iterations in a row it has
+        self.candidate = None
+        self.iterations = 0
+        self.stats = {"locks": 0, "streamed": 0}
+
+
+    def isLocked(self):
+        """
+        Determines if fetch should stream from the buffer
+        """
+        return len(self.templates) > 0
+
+
+    def observe(self, PC, target, taken, instructions):
+        """
+        Watches a branch fetched from the instruction queue, locking onto
+        the loop it closes once it has been taken twice in a row
+
+        @param PC An integer representing the word address of the branch
+        @param target An integer representing its decoded taken target
+        @param taken A boolean representing the predicted direction
+        @param instructions A list of the program's instruction tuples
+        @return True if the buffer locked
+        """
+        if not taken or target > PC or PC - target + 1 > self.size:
+            self.candidate = None
+            return False
+        if self.candidate != (PC, target):
+            self.candidate = (PC, target)
+            self.iterations = 0
+        self.iterations += 1
+        if self.iterations < 2:
+            return False
+
+        body = instructions[target:PC + 1]
+        if any(x[0] in ("BNE", "BEQ") for x in body[:-1]):
+            return False
+        self.templates = [[instr, target + i, None, None] for i, instr in enumerate(body)]
+        self.templates[-1][TAKEN] = True
+        self.templates[-1][TARGET] = target
+        self.position = 0
+        self.stats["locks"] += 1
+        return True
+
+
+    def next(self):
+        """
+        Replays the next instruction of the loop body
+
+        @return A new fetch buffer entry, and the PC to fetch after it
+        """
+        template = self.templates[self.position]
+        self.position = (self.position + 1) % len(self.templates)
+        self.stats["streamed"] += 1
+        return list(template), self.templates[self.position][PC]
+
+
+    def unlock(self):
+        """
+        Drops the captured loop, as when fetch is redirected
+        """
+        self.templates = []
+        self.candidate = None
+
+
+    def getStats(self):
+        """
+        Getter for the loop buffer counters
+        """
+        return dict(self.stats)
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    insts = [("ADDI", "R1", "R0", 2),
+             ("ADD.D", "F1", "F2", "F3"),
+             ("ADDI", "R1", "R1", -1),
+             ("BNE", "R1", "R0", -3),
+             ("ADD", "R2", "R2", "R2")]
+    myBuffer = LoopBuffer(4)
+    print(myBuffer.observe(3, 1, True, insts), myBuffer.isLocked())
+    print(myBuffer.observe(3, 1, True, insts), myBuffer.isLocked())
+    for i in range(4):
+        print(myBuffer.next())
+    myBuffer.unlock()
+    print(myBuffer.isLocked(), myBuffer.getStats())
+    # Too long a body never locks
+    myBuffer = LoopBuffer(2)
+    print(myBuffer.observe(3, 1, True, insts), myBuffer.observe(3, 1, True, insts))
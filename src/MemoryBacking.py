@@ -0,0 +1,333 @@
+# @file         MemoryBacking.py
+# @authors      Stephen
+
+import mmap
+import os
+import sys
+from array import array
+
+# Local constants for the type tag kept with every word
+INT = 0
+FLOAT = 1
+
+class DenseMemory:
+    """
+    This class stores memory contents as one contiguous typed array.
+
+    Every word holds a single value, kept as a double alongside a one byte
+    type tag so that integers read back as integers.  This suits small or
+    densely used address spaces.
+
+    The values may also live directly in a memory-mapped image (see
+    mapImage), in which case every word starts out as a float.
+    """
+
+    def __init__(self, words, buffer=None):
+        """
+        Constructor for the DenseMemory class
+
+        @param words An integer representing the number of 4-byte words
+        @param buffer An optional writable buffer of 8 bytes per word, in
+        native byte order, to use for the values without copying
+        """
+        self.words = words
+        if buffer is None:
+            self.values = array('d', bytes(8 * words))
+            self.types = bytearray(words)
+        else:
+            self.values = memoryview(buffer).cast('d')
+            self.types = bytearray([FLOAT]) * words
+
+
+    def read(self, word):
+        """
+        Getter for the value of a word
+
+        @param word An integer representing the word address
+        @return An integer or float representing the stored value
+        """
+        value = self.values[word]
+        return value if self.types[word] == FLOAT else int(value)
+
+
+    def write(self, word, value):
+        """
+        Setter for the value of a word
+
+        @param word An integer representing the word address
+        @param value An integer or float to be stored
+        """
+        self.values[word] = value
+        self.types[word] = FLOAT if isinstance(value, float) else INT
+
+
+    def load(self, buffer, word=0):
+        """
+        Copies a block of little-endian doubles into memory as floats
+
+        @param buffer A bytes-like object holding 8 bytes per word
+        @param word An optional integer representing the first word to fill
+        """
+        count = len(buffer) // 8
+        block = array('d')
+        block.frombytes(buffer[:8 * count])
+        if sys.byteorder != 'little':
+            block.byteswap()
+        self.values[word:word + count] = block
+        self.types[word:word + count] = bytes([FLOAT]) * count
+
+
+    def nonzero(self):
+        """
+        Getter for every word holding a nonzero value
+
+        @return A list of tuples (word address, value) in address order
+        """
+        return [ (i, self.read(i)) for i, x in enumerate(self.values) if x != 0.0 ]
+
+
+    def blocks(self):
+        """
+        Getter for the raw contents in blocks
+
+        @return A list of tuples (first word, buffer of native doubles)
+        """
+        return [ (0, self.values) ]
+
+
+class SparseMemory:
+    """
+    This class stores memory contents in fixed-size pages which are only
+    allocated when first written, for large and sparsely used address spaces.
+
+    Each page is a typed array of values and a matching array of type tags,
+    as in DenseMemory.  Words in pages never written read as integer zero.
+    """
+
+    def __init__(self, words, pageWords=1024):
+        """
+        Constructor for the SparseMemory class
+
+        @param words An integer representing the number of 4-byte words
+        @param pageWords An optional integer representing the words per page
+        """
+        self.words = words
+        self.pageWords = pageWords
+        self.pages = {}
+
+
+    def page(self, word):
+        """
+        Given a word address, returns its page, allocating it if needed
+
+        @param word An integer representing the word address
+        @return A tuple (values, types) for the page
+        """
+        number = word // self.pageWords
+        if number not in self.pages:
+            self.pages[number] = (array('d', bytes(8 * self.pageWords)), bytearray(self.pageWords))
+        return self.pages[number]
+
+
+    def read(self, word):
+        """
+        Getter for the value of a word
+
+        @param word An integer representing the word address
+        @return An integer or float representing the stored value
+        """
+        number = word // self.pageWords
+        if number not in self.pages:
+            return 0
+        values, types = self.pages[number]
+        value = values[word % self.pageWords]
+        return value if types[word % self.pageWords] == FLOAT else int(value)
+
+
+    def write(self, word, value):
+        """
+        Setter for the value of a word
+
+        @param word An integer representing the word address
+        @param value An integer or float to be stored
+        """
+        values, types = self.page(word)
+        values[word % self.pageWords] = value
+        types[word % self.pageWords] = FLOAT if isinstance(value, float) else INT
+
+
+    def load(self, buffer, word=0):
+        """
+        Copies a block of little-endian doubles into memory as floats, one
+        page at a time, leaving pages which are entirely zero unallocated
+
+        @param buffer A bytes-like object holding 8 bytes per word
+        @param word An optional integer representing the first word to fill
+        """
+        count = len(buffer) // 8
+        done = 0
+        while done < count:
+            offset = (word + done) % self.pageWords
+            chunk = min(self.pageWords - offset, count - done)
+            raw = buffer[8 * done:8 * (done + chunk)]
+            if any(raw):
+                block = array('d')
+                block.frombytes(raw)
+                if sys.byteorder != 'little':
+                    block.byteswap()
+                values, types = self.page(word + done)
+                values[offset:offset + chunk] = block
+                types[offset:offset + chunk] = bytes([FLOAT]) * chunk
+            done += chunk
+
+
+    def blocks(self):
+        """
+        Getter for the raw contents of the allocated pages
+
+        @return A list of tuples (first word, buffer of native doubles)
+        """
+        return [ (number * self.pageWords, self.pages[number][0]) for number in sorted(self.pages) ]
+
+
+    def nonzero(self):
+        """
+        Getter for every word holding a nonzero value
+
+        @return A list of tuples (word address, value) in address order
+        """
+        entries = []
+        for number in sorted(self.pages):
+            values, types = self.pages[number]
+            base = number * self.pageWords
+            entries.extend([ (base + i, self.read(base + i)) for i, x in enumerate(values) if x != 0.0 ])
+        return entries
+
+
+def loadImage(backing, fileName, word=0):
+    """
+    Fills a memory backing from a binary image file
+
+    @param backing A DenseMemory or SparseMemory instance to fill
+    @param fileName A string representing the path to the image, holding one
+    little-endian double per word
+    @param word An optional integer representing the first word to fill
+    @return An integer representing the number of words loaded
+
+    The file is memory mapped so it is handed to the backing in one block
+    rather than parsed entry by entry.
+    """
+    with open(fileName, 'rb') as imageFile:
+        with mmap.mmap(imageFile.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            count = len(image) // 8
+            if word + count > backing.words:
+                raise ValueError(f"Memory image [ {fileName} ] does not fit in {backing.words} words")
+            with memoryview(image) as view:
+                backing.load(view, word)
+    return count
+
+
+def mapImage(fileName):
+    """
+    Creates a dense memory whose values are the pages of a binary image file
+
+    @param fileName A string representing the path to the image, holding one
+    little-endian double per word
+    @return A DenseMemory instance with one word per double in the image
+
+    The image is mapped copy-on-write, so loading copies nothing and stores
+    made by the simulation never reach the file.  Hosts which are not little
+    endian fall back to copying the image.
+    """
+    size = os.path.getsize(fileName)
+    if size == 0 or size % 8 != 0:
+        raise ValueError(f"Memory image [ {fileName} ] is not a whole number of words")
+    if sys.byteorder != 'little':
+        backing = DenseMemory(size // 8)
+        loadImage(backing, fileName)
+        return backing
+    with open(fileName, 'rb') as imageFile:
+        image = mmap.mmap(imageFile.fileno(), size, access=mmap.ACCESS_COPY)
+    backing = DenseMemory(size // 8, image)
+    # Keep the mapping alive as long as the memory
+    backing.image = image
+    return backing
+
+
+def saveImage(backing, fileName):
+    """
+    Writes the contents of a memory backing to a binary image file
+
+    @param backing A DenseMemory or SparseMemory instance to save
+    @param fileName A string representing the path to write, receiving one
+    little-endian double per word
+    @return None
+
+    The file is sized first and memory mapped, and each block of the backing
+    is copied straight into the mapping.  Pages of a sparse memory which were
+    never written are left as holes.  Integers are written as doubles.
+    """
+    with open(fileName, 'w+b') as imageFile:
+        imageFile.truncate(8 * backing.words)
+        with mmap.mmap(imageFile.fileno(), 8 * backing.words) as image:
+            for word, block in backing.blocks():
+                # The last page of a sparse memory may run past its end
+                block = block[:backing.words - word]
+                if sys.byteorder != 'little':
+                    block = array('d', block)
+                    block.byteswap()
+                with memoryview(block).cast('B') as raw:
+                    image[8 * word:8 * word + len(raw)] = raw
+
+
+def createBacking(kind, words, imageFile=""):
+    """
+    Creates the memory backing described by the simulation options
+
+    @param kind A string, "dense" or "sparse"
+    @param words An integer representing the number of 4-byte words, or 0
+    to size the memory to the image
+    @param imageFile An optional string representing the path to an image
+    to initialize the memory with
+    @return A DenseMemory or SparseMemory instance
+
+    A dense memory the same size as its image is mapped without copying,
+    any other combination copies the image in.
+    """
+    if kind not in ("dense", "sparse"):
+        raise ValueError(f"Unknown memory backing [ {kind} ]")
+    if imageFile:
+        imageWords = os.path.getsize(imageFile) // 8
+        if words == 0:
+            words = imageWords
+        if kind == "dense" and words == imageWords:
+            return mapImage(imageFile)
+    if words <= 0:
+        raise ValueError(f"Memory initialized with invalid size {words} words")
+    backing = DenseMemory(words) if kind == "dense" else SparseMemory(words)
+    if imageFile:
+        loadImage(backing, imageFile)
+    return backing
+
+
+# Test cases, run this script directly to execute
+if __name__ == "__main__":
+    import struct
+    import tempfile
+    for backing in [DenseMemory(64), SparseMemory(1 << 20, pageWords=16)]:
+        backing.write(1, 1)
+        backing.write(2, 3.4)
+        backing.write(1000 % backing.words, 7)
+        print(backing.read(1), backing.read(2), backing.read(3))
+        with tempfile.NamedTemporaryFile(delete=False) as image:
+            image.write(struct.pack('<4d', 1.5, 0.0, 2.5, 0.0) + bytes(8 * 16))
+        print(loadImage(backing, image.name, 30))
+        os.remove(image.name)
+        print(backing.nonzero())
+
+        # Round trip through an image, the mapped copy is private
+        saveImage(backing, image.name)
+        mapped = mapImage(image.name)
+        mapped.write(31, 9)
+        print(mapped.words, mapped.read(30), mapped.read(31), mapImage(image.name).read(31))
+        os.remove(image.name)
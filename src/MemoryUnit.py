@@ -1,35 +1,121 @@
 # @file         MemoryUnit.py
 # @authors      Yihao
 
+try:
+    from src.MemoryBacking import DenseMemory
+except ImportError:
+    # Run directly as a script from within src/
+    from MemoryBacking import DenseMemory
+
 class MemoryUnit:
     """
-    This class implements a single-ported 256B memory Unit
+    This class implements a memory Unit with one or more ports and
+    address-interleaved banks, 256B by default
+
+    Every access takes the full latency.  A port which is not pipelined is
+    held for the whole access, a pipelined port accepts a new access every
+    cycle.  Consecutive words map to consecutive banks, and a bank is held
+    for the whole access unless pipelined, in which case it accepts a new
+    access every bankBusy cycles.  A single non-pipelined port and bank is
+    the default.
+
+    With a data cache attached, the latency of each access is the one the
+    cache reports instead of the flat memory latency.
     """
-    def __init__(self, latency):
+    def __init__(self, latency, ports=1, banks=1, pipelined=False, bankBusy=1, cache=None, backing=None,
+                 values=True, bus=None, coreID=0):
         """
         Constructor for the memory unit
 
-        @param memory A list representing the memory unit for each word
-        @param flag A list representing if the corresponding word address is taken by float value
+        @param backing An optional DenseMemory or SparseMemory instance
+        holding the contents, a dense 64 word memory by default
         @param memory_max_length An integar representing the maximum length of the memory byte address
 
         @param buffer An list storing the result of memory read
+        @param latency An integer representing the cycles taken by an access
+        @param ports An optional integer representing how many accesses can
+        be started in the same cycle
+        @param banks An optional integer representing the number of
+        word-interleaved banks
+        @param pipelined An optional boolean, if True ports and banks accept
+        a new access before the previous one completes
+        @param bankBusy An optional integer representing the cycles a bank is
+        held by each access when pipelined
+        @param cache An optional reference to an instance of the Cache class
+        which sets the latency of each access
+        @param values An optional boolean, if False accesses are only timed:
+        loads give 0.0 and stores write nothing, as in trace-driven runs
+        @param bus An optional reference to a CoherentBus shared with other
+        cores, which adds the cycles spent keeping their caches coherent
+        @param coreID An optional integer representing this core on the bus
         """
-        self.memory = [0] * 64
-        self.flag = [0] * 64
-        self.memory_max_length = 256
+        if ports < 1 or banks < 1:
+            raise ValueError(f"Memory initialized with {ports} ports and {banks} banks")
+        self.backing = backing if backing is not None else DenseMemory(64)
+        self.memory_max_length = 4 * self.backing.words
         self.latency = latency
         self.time = 0
-        self.nextFreeTime = -1
-        self.curInstr = None
         self.buffer = []
 
+        # Time at which each port and bank can accept its next access
+        self.pipelined = pipelined
+        self.portFree = [0] * ports
+        self.bankFree = [0] * banks
+        self.bankBusy = bankBusy
+        self.cache = cache
+        self.values = values
+        self.bus = bus
+        self.coreID = coreID
+        if bus is not None:
+            bus.attach(coreID, cache)
+        # Accesses in flight as [completion time, instruction], oldest first
+        self.inflight = []
+        self.bankConflicts = 0
+        # IDs refused for a bank conflict this cycle, each counted once
+        self.refused = set()
+        # Loads which read outside memory, by instruction ID, with the address
+        self.faults = {}
+
 
     def busy(self):
         """
         Getter for the busy status of the Memory
+
+        @return True if no port can start an access this cycle
+        """
+        return min(self.portFree) > self.time
+
+
+    def bank(self, addr):
+        """
+        Given a byte address, returns the bank holding it
+
+        @param addr An integer representing the byte address
+        @return An integer representing the bank
         """
-        return (self.time < self.nextFreeTime) and (len(self.buffer) == 0)
+        return int(addr/4) % len(self.bankFree)
+
+
+    def canAccept(self, addr, ID=None):
+        """
+        Determines if an access to the given address can start this cycle
+
+        @param addr An integer representing the byte address to access
+        @param ID An optional integer representing the instruction asking,
+        so that asking again in the same cycle is not counted again
+        @return True if both a port and the address' bank are free
+        """
+        if self.busy():
+            return False
+        if self.bankFree[self.bank(addr)] > self.time:
+            if ID is None or ID not in self.refused:
+                self.bankConflicts += 1
+            if ID is not None:
+                self.refused.add(ID)
+            return False
+        if self.cache is not None:
+            return self.cache.canAccept(addr, self.time, ID)
+        return True
 
 
     def isResultReady(self):
@@ -58,21 +144,44 @@ class MemoryUnit:
         Run the Load/Store memory stage
 
         @instr An tuple containing the id, instruction_type, target_address and value 
+
+        The caller must check canAccept() first.
         """
-        self.nextFreeTime = self.time + self.latency
-        self.curInstr = instr
+        latency = self.latency
+        extra = 0
+        if self.bus is not None:
+            extra = self.bus.access(self.coreID, instr[3], instr[1] == 'SD', self.time)
+        if self.cache is not None:
+            latency = self.cache.access(instr[3], instr[1] == 'SD', self.time)
+        latency += extra
+        port = self.portFree.index(min(self.portFree))
+        self.portFree[port] = self.time + (1 if self.pipelined else latency)
+        self.bankFree[self.bank(instr[3])] = self.time + (self.bankBusy if self.pipelined else latency)
+        self.inflight.append([self.time + latency, instr])
 
 
     def advanceTime(self):
         self.time += 1
-        if self.time == self.nextFreeTime:
-            if(self.curInstr[1] == 'LD'):
-                result = self.mem_read(self.curInstr[3])
-                self.buffer.append([self.curInstr[0],result])
-            elif(self.curInstr[1] == 'SD'):
-                self.mem_write(self.curInstr[3],self.curInstr[2])
-                self.buffer.append([self.curInstr[0], None])
-            self.nextFreeTime = -1
+        self.refused = set()
+        # Accesses may complete out of order once hits overtake misses.  A
+        # cache hit taking 0 cycles is due the cycle it starts, so it
+        # completes on the next step like a 1 cycle access.
+        done = [x for x in self.inflight if x[0] <= self.time]
+        self.inflight = [x for x in self.inflight if x[0] > self.time]
+        for readyTime, curInstr in done:
+            if(curInstr[1] == 'LD'):
+                if 0 <= curInstr[3] < self.memory_max_length:
+                    result = self.mem_read(curInstr[3]) if self.values else 0.0
+                else:
+                    # A load down a mispredicted path may compute any
+                    # address, so it only faults if it commits
+                    self.faults[curInstr[0]] = curInstr[3]
+                    result = 0.0
+                self.buffer.append([curInstr[0],result])
+            elif(curInstr[1] == 'SD'):
+                if self.values:
+                    self.mem_write(curInstr[3],curInstr[2])
+                self.buffer.append([curInstr[0], None])
 
 
     def mem_write(self, addr, value):
@@ -81,35 +190,58 @@ class MemoryUnit:
 
         @param addr An integar representing the byte address to be written
         @param value An integar or float to be written
+
+        Each word holds one value, and the backing keeps a type tag with it
+        so that integers and floats read back as written.
         """
-        if isinstance(value, int):        #int for 4 Bytes
-            if addr > 256 or addr < 0:
-                raise ValueError("Address value [ {} ] outrange in memory unit".format(addr))
-            elif self.flag[int(addr/4)] != 0:            #if the word is taken by a float
-                tmp = self.flag[int(addr/4)]
-                self.memory[int(addr/4)] = value
-                self.memory[int(addr/4) + tmp] = 0    #clear the other word according to the value of flag
-                self.flag[int(addr/4) + tmp] = 0
-                self.flag[int(addr/4)] = 0
-            else:
-                self.memory[int(addr/4)] = value
-        if isinstance(value, float):    #float for 8 Bytes
-            if addr > 252 or addr < 0:
-                raise ValueError("Address value [ {} ] outrange in memory unit".format(addr))
-            else:
-                self.memory[int(addr/4)] = value
-                self.flag[int(addr/4)] = 1
-                self.flag[int(addr/4)] = -1
+        if addr < 0 or addr >= self.memory_max_length:
+            raise ValueError("Address value [ {} ] outrange in memory unit".format(addr))
+        self.backing.write(int(addr/4), value)
 
 
     def mem_read(self, addr):
-        return self.memory[int(addr/4)]
+        if addr < 0 or addr >= self.memory_max_length:
+            raise ValueError("Address value [ {} ] outrange in memory unit".format(addr))
+        return self.backing.read(int(addr/4))
+
+
+    def checkFault(self, ID):
+        """
+        Raises the error of a load which read outside memory, once it is
+        known to commit
+
+        @param ID An integer representing the committing instruction
+
+        Raises ValueError if the load read outside memory
+        """
+        if ID in self.faults:
+            raise ValueError("Address value [ {} ] outrange in memory unit".format(self.faults.pop(ID)))
+
+
+    def dropFaults(self, squashed):
+        """
+        Forgets the faults of loads which were squashed, as they never commit
+
+        @param squashed A function which, given an instruction ID, returns
+        True if that instruction was squashed
+        """
+        if len(self.faults) > 0:
+            self.faults = {k: v for k, v in self.faults.items() if not squashed(k)}
+
+
+    def contents(self):
+        """
+        Getter for the nonzero words of memory
+
+        @return A list of tuples (word address, value) in address order
+        """
+        return self.backing.nonzero()
 
 
     def dump(self):
         print("Memory Unit".ljust(48, '=').rjust(80,'='))
         print("Memory contents:")
-        entries = [(str(i),x) for i,x in enumerate(self.memory) if ((x < 0.0) or (x > 0.0))]
+        entries = [(str(i),x) for i,x in self.contents()]
         newLine = False
         for address, contents in entries:
             print(f"Word {address.rjust(2,'0')}: {contents:.6f} ".ljust(40,' '),end='')
@@ -118,6 +250,8 @@ class MemoryUnit:
             newLine = not newLine
 
         print('\n')
+        for readyTime, instr in self.inflight:
+            print(f"In flight: {instr[1]} {instr[0]} at {instr[3]}, done at {readyTime}")
 
 if __name__ == "__main__":
     MMU = MemoryUnit(4)
@@ -148,3 +282,30 @@ if __name__ == "__main__":
     MMU.advanceTime()
     MMU.dump()
 
+
+    # Two pipelined ports over two banks: the access to word 4 conflicts
+    # with the one to word 2 in the same cycle
+    MMU = MemoryUnit(4, ports=2, banks=2, pipelined=True)
+    MMU.mem_write(8,2)
+    for ID, addr in enumerate([8, 16, 12]):
+        accepted = MMU.canAccept(addr)
+        print(f"Accept {addr}?:{accepted}")
+        if accepted:
+            MMU.execute((ID,'LD',None,addr))
+    MMU.advanceTime()
+    print(f"Accept 16?:{MMU.canAccept(16)}")
+    MMU.execute((1,'LD',None,16))
+    MMU.dump()
+    for i in range(4):
+        MMU.advanceTime()
+    print(f"Results:{MMU.buffer}, bank conflicts:{MMU.bankConflicts}")
+
+    # A load past the end faults only if it commits, a squashed one is forgotten
+    MMU = MemoryUnit(4, ports=2, banks=2, pipelined=True)
+    for ID, addr in [(5, 4096), (7, 4100)]:
+        MMU.execute((ID,'LD',None,addr))
+    for i in range(4):
+        MMU.advanceTime()
+    print(f"Faults:{MMU.faults}")
+    MMU.dropFaults(lambda ID: ID == 5)
+    print(f"Faults after squashing 5:{MMU.faults}")
@@ -0,0 +1,139 @@
+# @file         Occupancy.py
+# @authors      Stephen
+
+class Occupancy:
+    """
+    This helper class collects per-cycle occupancy histograms and busy-cycle
+    counts for the structures of the core.
+
+    A histogram is a list indexed by occupancy, holding the number of cycles
+    the structure held that many entries, so a sample is a single increment.
+    Entries squashed by a misprediction still count until their structure
+    drops them, since they still hold the slot.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the Occupancy class
+        """
+        self.cycles = 0
+        self.histograms = {}
+        self.busy = {}
+
+
+    def tick(self):
+        """
+        Records that one more cycle has been sampled
+        """
+        self.cycles += 1
+
+
+    def histogram(self, name):
+        """
+        Getter for the histogram of a structure, created empty on first use.
+        Callers sampling every cycle keep the reference and pass it to add(),
+        so no name is built or looked up per sample.
+
+        @param name A string naming the structure
+        @return A list, the histogram
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = []
+        return histogram
+
+
+    def add(self, histogram, value):
+        """
+        Records the occupancy of a structure for the current cycle
+
+        @param histogram A list, the structure's histogram from histogram()
+        @param value A non-negative integer representing the entries in use
+        @return None
+        """
+        if value >= len(histogram):
+            histogram.extend([0] * (value + 1 - len(histogram)))
+        histogram[value] += 1
+
+
+    def sample(self, name, value):
+        """
+        Records the occupancy of a structure for the current cycle
+
+        @param name A string naming the structure
+        @param value A non-negative integer representing the entries in use
+        @return None
+        """
+        self.add(self.histogram(name), value)
+
+
+    def unit(self, name):
+        """
+        Registers a functional unit with no busy cycles yet, so callers
+        sampling every cycle can count its busy cycles in self.busy directly
+
+        @param name A string naming the functional unit
+        @return None
+        """
+        self.busy.setdefault(name, 0)
+
+
+    def sampleBusy(self, name, busy):
+        """
+        Records whether a functional unit did work in the current cycle
+
+        @param name A string naming the functional unit
+        @param busy A boolean, True if the unit was busy
+        @return None
+        """
+        self.busy[name] = self.busy.get(name, 0) + (1 if busy else 0)
+
+
+    def getStats(self):
+        """
+        Getter for the histograms and their summaries
+
+        @return A dictionary with, for each structure, its histogram, mean and
+        maximum occupancy, and for each functional unit its busy cycles and
+        utilisation
+        """
+        structures = {}
+        for name, histogram in self.histograms.items():
+            samples = sum(histogram)
+            total = sum(i * count for i, count in enumerate(histogram))
+            structures[name] = {"histogram": list(histogram),
+                                "mean": total / samples if samples > 0 else 0.0,
+                                "max": max(len(histogram) - 1, 0)}
+        units = {}
+        for name, count in self.busy.items():
+            units[name] = {"busyCycles": count,
+                           "utilisation": count / self.cycles if self.cycles > 0 else 0.0}
+        return {"cycles": self.cycles, "structures": structures, "units": units}
+
+
+    def dumpStats(self):
+        """
+        Pretty-prints the mean and maximum occupancy of each structure and the
+        utilisation of each functional unit
+        """
+        stats = self.getStats()
+        print("Occupancy".ljust(48, '=').rjust(80,'='))
+        print("Structure".ljust(32, ' ') + "Mean\tMax")
+        for name, summary in stats["structures"].items():
+            print(f"{name.ljust(32, ' ')}{summary['mean']:.2f}\t{summary['max']}")
+        print()
+        print("Unit".ljust(32, ' ') + "Busy\tUtilisation")
+        for name, summary in stats["units"].items():
+            print(f"{name.ljust(32, ' ')}{summary['busyCycles']}\t{100*summary['utilisation']:.1f}%")
+        print()
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    myOccupancy = Occupancy()
+    for value in [0, 1, 3, 3, 2]:
+        myOccupancy.tick()
+        myOccupancy.sample("ROB", value)
+        myOccupancy.sampleBusy("ALUI0", value > 1)
+    print(myOccupancy.getStats())
+    myOccupancy.dumpStats()
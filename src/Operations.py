@@ -0,0 +1,80 @@
+# @file         Operations.py
+# @authors      Stephen
+
+import math
+
+
+def divide(a, b):
+    """
+    Floating point division, giving an infinity or NaN on division by zero
+    as IEEE 754 hardware does
+
+    @param a A numeric value representing the dividend
+    @param b A numeric value representing the divisor
+    @return A float
+    """
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return float(a / b)
+
+
+# What each arithmetic opcode computes from its two operands.  Integer
+# operations truncate their operands first, as the integer datapath does, and
+# branches give whether they are taken.
+OPERATIONS = {
+    "ADD": lambda a, b: int(int(a) + int(b)),
+    "ADDI": lambda a, b: int(int(a) + int(b)),
+    "SUB": lambda a, b: int(int(a) - int(b)),
+    "MUL": lambda a, b: int(int(a) * int(b)),
+    "BNE": lambda a, b: int(a) != int(b),
+    "BEQ": lambda a, b: int(a) == int(b),
+    "ADD.D": lambda a, b: float(a + b),
+    "SUB.D": lambda a, b: float(a - b),
+    "MULT.D": lambda a, b: float(a * b),
+    "DIV.D": divide,
+}
+
+
+def isZero(operand):
+    """
+    Checks if an operand is always zero: R0, F0 or a zero immediate
+    """
+    return operand in ("R0", "F0") or (isinstance(operand, int) and operand == 0)
+
+
+def renameIdiom(instruction):
+    """
+    Recognises the instructions whose result is known at rename: zero
+    idioms, which give zero whatever their operands hold, and moves, which
+    give one operand unchanged since the other is zero.  Moves still apply
+    their operation to the copied value once it is known, so int and float
+    conversions and signed zeros come out as executing them would.
+
+    @param instruction A tuple (op, destination, operand, operand)
+    @return "zero" for a zero idiom, the index (2 or 3) of the operand a move
+    copies, or None
+    """
+    op, _, a, b = instruction[:4]
+    if op not in ("ADD", "ADDI", "SUB", "ADD.D", "SUB.D"):
+        return None
+    # x - x is not zero for infinities and NaNs, so only integers qualify
+    if (isZero(a) and isZero(b)) or (op == "SUB" and a == b):
+        return "zero"
+    if isZero(b):
+        return 2
+    if isZero(a) and op in ("ADD", "ADD.D"):
+        return 3
+    return None
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    for op, a, b in [("ADD", 3, 4.0), ("ADDI", 7, -2), ("BNE", 1, 1), ("BEQ", 2, 2.0),
+                     ("MULT.D", 1.5, 2), ("DIV.D", 1.0, 4), ("DIV.D", -1.0, 0), ("DIV.D", 0.0, 0)]:
+        print(op, a, b, OPERATIONS[op](a, b))
+    for inst in [("ADD", "R2", "R0", "R0"), ("ADD.D", "F2", "F0", "F0"), ("SUB", "R1", "R3", "R3"),
+                 ("SUB.D", "F1", "F3", "F3"), ("ADDI", "R1", "R2", 0), ("ADD", "R1", "R0", "R2"),
+                 ("SUB", "R1", "R0", "R2"), ("ADDI", "R1", "R2", 4), ("MULT.D", "F1", "F2", "F0")]:
+        print(inst, renameIdiom(inst))
@@ -0,0 +1,175 @@
+# @file         PhysicalRegisterFile.py
+# @authors      Stephen
+
+from collections import deque
+
+# Architectural registers, in the order they take the first physical registers
+REGISTERS = [f"R{x}" for x in range(32)] + [f"F{x}" for x in range(32)]
+
+class PhysicalRegisterFile:
+    """
+    This class implements a unified physical register file for R10K style
+    renaming.
+
+    Every value, speculative or committed, lives in a physical register named
+    "P<n>".  The first 64 hold the initial architectural state and the rest
+    start on the free list.  A retirement map points each architectural
+    register at the physical register holding its committed value, so
+    committing is a pointer update which frees the register it replaces.
+
+    It offers the ARF's get() and dump() for the committed state, so it can
+    stand in for the ARF.
+    """
+
+    def __init__(self, size, initVals=None):
+        """
+        Constructor for the PhysicalRegisterFile class
+
+        @param size An integer representing the number of physical registers,
+        more than the 64 architectural ones
+        @param initVals An optional list of tuples (string, numeric value)
+        that represents the initialization values associated with the string
+        name of the registers
+
+        Raises ValueError if there are no registers to rename to
+        """
+        if size <= len(REGISTERS):
+            raise ValueError(f"A physical register file needs more than {len(REGISTERS)} registers, not {size}")
+        self.size = size
+        self.values = [0] * 32 + [0.0] * 32 + [None] * (size - len(REGISTERS))
+        self.ready = [True] * len(REGISTERS) + [False] * (size - len(REGISTERS))
+        self.retired = {x: f"P{i}" for i, x in enumerate(REGISTERS)}
+        self.freeList = deque(f"P{i}" for i in range(len(REGISTERS), size))
+        if initVals is not None:
+            for register, value in initVals:
+                self.values[REGISTERS.index(register)] = value
+        if self.values[0] != 0 or self.values[32] != 0.0:
+            raise ValueError("Invalid register file initialization: R0, F0 must be zero")
+
+
+    def canAllocate(self):
+        """
+        Determines if a physical register is free to rename a destination to
+        """
+        return len(self.freeList) > 0
+
+
+    def allocate(self):
+        """
+        Takes a register off the free list, not yet holding a value
+
+        @return A string representing the physical register
+        """
+        name = self.freeList.popleft()
+        self.ready[int(name[1:])] = False
+        return name
+
+
+    def free(self, name):
+        """
+        Returns a physical register to the free list
+        """
+        self.ready[int(name[1:])] = False
+        self.freeList.append(name)
+
+
+    def isReady(self, name):
+        """
+        Determines if a physical register holds its value yet
+        """
+        return self.ready[int(name[1:])]
+
+
+    def read(self, name):
+        """
+        Getter for the value of a physical register
+        """
+        return self.values[int(name[1:])]
+
+
+    def write(self, name, value):
+        """
+        Writes a result into its physical register
+        """
+        index = int(name[1:])
+        self.values[index] = value
+        self.ready[index] = True
+
+
+    def commit(self, register, name):
+        """
+        Makes a physical register hold the committed value of an
+        architectural register, freeing the one it replaces
+
+        @param register A string representing the architectural register
+        @param name A string representing the physical register
+
+        Throws ValueError if register is R0 or F0, these are read-only
+        Note: Silently coerces the value to the type of the register, as the
+        ARF does on writes
+        """
+        if "R0" == register or "F0" == register:
+            raise ValueError("R0 and F0 are read-only!")
+        index = int(name[1:])
+        self.values[index] = float(self.values[index]) if register.startswith("F") else int(self.values[index])
+        self.free(self.retired[register])
+        self.retired[register] = name
+
+
+    def get(self, key):
+        """
+        Getter for the committed value of an architectural register
+
+        @param key A string representing the register name to read from
+        @return A numeric value representing the contents of the register
+        """
+        if isinstance(key, int):
+            return key
+        return self.read(self.retired[key])
+
+
+    def inUse(self):
+        """
+        Getter for the number of physical registers holding a value or
+        waiting for one
+        """
+        return self.size - len(self.freeList)
+
+
+    def dump(self):
+        """
+        Pretty-prints the committed registers and where they live
+        """
+        print("Physical Register File".ljust(48, '=').rjust(80,'='))
+        print(f"In use:\t\t\t{self.inUse()} / {self.size}")
+        keys = [f"R{x}" for x in range(32)]
+        for i in range(0,len(keys),4):
+            for key in keys[i:i+4]:
+                print(f"{key.ljust(3,' ')}: {self.get(key)} ({self.retired[key]})".ljust(20, ' '), end='')
+            print()
+        keys = [f"F{x}" for x in range(32)]
+        for i in range(0, len(keys),2):
+            for key in keys[i:i+2]:
+                print(f"{key.ljust(3,' ')}: {self.get(key):.6f} ({self.retired[key]})".ljust(40, ' '), end='')
+            print()
+        print()
+
+
+# Test cases, run this script directly to execute
+if __name__ == "__main__":
+    myPRF = PhysicalRegisterFile(66, initVals=[("R1", 13), ("F2", 2.5)])
+    print(myPRF.get("R1"), myPRF.get("F2"), myPRF.inUse())
+    first = myPRF.allocate()
+    second = myPRF.allocate()
+    print(first, second, myPRF.canAllocate(), myPRF.isReady(first))
+    myPRF.write(first, 14.7)
+    print(myPRF.isReady(first), myPRF.read(first))
+    myPRF.commit("R1", first)
+    print(myPRF.get("R1"), myPRF.retired["R1"], list(myPRF.freeList))
+    myPRF.free(second)
+    print(list(myPRF.freeList), myPRF.inUse())
+    try:
+        myPRF.commit("R0", myPRF.allocate())
+    except ValueError as e:
+        print(e)
+    myPRF.dump()
@@ -0,0 +1,333 @@
+# @file         PipelineTrace.py
+# @authors      Stephen
+
+import heapq
+import json
+
+# Stage names in the order of the columns of the output table
+STAGES = ["Is", "Ex", "Mem", "Wb", "Cm"]
+
+# Local constants to improve readability of in-flight records
+STAGE = 0
+START = 1
+LANE = 2
+LABEL = 3
+
+class PipelineTrace:
+    """
+    This class streams the life of every instruction to a pipeline viewer
+    file while the simulation runs.
+
+    Only instructions in flight are remembered, each as [<stage>, <cycle the
+    stage started>, <lane>, <label>], and they are forgotten as soon as they
+    commit or are squashed, so memory does not grow with the length of the
+    run.  Subclasses turn the events into a file format.
+    """
+
+    def __init__(self, fileName):
+        """
+        Constructor for the PipelineTrace class
+
+        @param fileName A string representing the path of the trace to write
+        """
+        self.outFile = open(fileName, 'w')
+        self.inflight = {}
+        self.freeLanes = []
+        self.nextLane = 1
+
+
+    def issue(self, ID, PC, instr, cycle):
+        """
+        Records that an instruction was issued
+
+        @param ID An integer representing the instruction
+        @param PC An integer representing the word address of the instruction
+        @param instr A tuple representing the decoded instruction
+        @param cycle An integer representing the current cycle
+        """
+        if self.freeLanes:
+            lane = heapq.heappop(self.freeLanes)
+        else:
+            lane = self.nextLane
+            self.nextLane += 1
+        label = f"{PC}: {instr[0]} {', '.join(str(x) for x in instr[1:])}"
+        self.inflight[ID] = [0, cycle, lane, label]
+        self.begin(ID, label, cycle)
+
+
+    def stage(self, ID, stage, cycle):
+        """
+        Records that an instruction reached a later stage
+
+        @param ID An integer representing the instruction
+        @param stage An integer representing the stage, an index into STAGES
+        @param cycle An integer representing the current cycle
+
+        Reaching the commit stage retires the instruction.
+        """
+        record = self.inflight.get(ID)
+        if record is None:
+            return
+        self.endStage(ID, record, cycle, False)
+        record[STAGE] = stage
+        record[START] = cycle
+        if stage == len(STAGES) - 1:
+            self.retire(ID, record, cycle)
+            self.release(ID)
+        else:
+            self.beginStage(ID, record, cycle)
+
+
+    def squash(self, cutoff, cycle):
+        """
+        Records that every instruction after the given one was squashed
+
+        @param cutoff An integer representing the youngest surviving
+        instruction
+        @param cycle An integer representing the current cycle
+        """
+        for ID in sorted(x for x in self.inflight if x > cutoff):
+            self.endStage(ID, self.inflight[ID], cycle, True)
+            self.flush(ID, self.inflight[ID], cycle)
+            self.release(ID)
+
+
+    def release(self, ID):
+        """
+        Forgets an instruction and frees its lane
+        """
+        heapq.heappush(self.freeLanes, self.inflight.pop(ID)[LANE])
+
+
+    def issueStall(self, cause, cycle):
+        """
+        Records what the issue stage spent the cycle on
+
+        @param cause A string naming the stall cause, or "issued"
+        @param cycle An integer representing the current cycle
+        """
+        pass
+
+
+    def begin(self, ID, label, cycle):
+        """
+        Writes the start of an instruction's life, in the first stage
+        """
+        pass
+
+
+    def beginStage(self, ID, record, cycle):
+        """
+        Writes the start of an instruction's current stage, before commit
+        """
+        pass
+
+
+    def endStage(self, ID, record, cycle, squashed):
+        """
+        Writes the end of an instruction's current stage
+        """
+        pass
+
+
+    def retire(self, ID, record, cycle):
+        """
+        Writes the commit stage of an instruction, and its retirement
+        """
+        pass
+
+
+    def flush(self, ID, record, cycle):
+        """
+        Writes that an instruction was squashed
+        """
+        pass
+
+
+    def close(self, cycle):
+        """
+        Finishes the file
+
+        @param cycle An integer representing the final cycle
+        """
+        self.outFile.close()
+
+
+class KonataTrace(PipelineTrace):
+    """
+    This class writes the Kanata log format read by the Konata pipeline
+    viewer.  Stalls show up as long stages; Konata has no separate track for
+    the issue stage's stall causes.
+    """
+
+    def __init__(self, fileName):
+        """
+        Constructor for the KonataTrace class
+
+        @param fileName A string representing the path of the trace to write
+        """
+        super().__init__(fileName)
+        self.cycle = 0
+        self.retired = 0
+        # Commits are retired in the log one cycle later, so the commit
+        # stage is one cycle long
+        self.retiring = []
+        self.outFile.write("Kanata\t0004\nC=\t0\n")
+
+
+    def advance(self, cycle):
+        """
+        Moves the log forward to the given cycle
+        """
+        if cycle > self.cycle:
+            self.outFile.write(f"C\t{cycle - self.cycle}\n")
+            self.cycle = cycle
+            for ID in self.retiring:
+                self.outFile.write(f"R\t{ID}\t{self.retired}\t0\n")
+                self.retired += 1
+            self.retiring = []
+
+
+    def begin(self, ID, label, cycle):
+        self.advance(cycle)
+        self.outFile.write(f"I\t{ID}\t{ID}\t0\nL\t{ID}\t0\t{label}\nS\t{ID}\t0\t{STAGES[0]}\n")
+
+
+    def beginStage(self, ID, record, cycle):
+        self.advance(cycle)
+        self.outFile.write(f"S\t{ID}\t0\t{STAGES[record[STAGE]]}\n")
+
+
+    def endStage(self, ID, record, cycle, squashed):
+        self.advance(cycle)
+        self.outFile.write(f"E\t{ID}\t0\t{STAGES[record[STAGE]]}\n")
+
+
+    def retire(self, ID, record, cycle):
+        self.outFile.write(f"S\t{ID}\t0\t{STAGES[record[STAGE]]}\n")
+        self.retiring.append(ID)
+
+
+    def flush(self, ID, record, cycle):
+        self.outFile.write(f"R\t{ID}\t{ID}\t1\n")
+
+
+    def close(self, cycle):
+        self.advance(cycle + 1)
+        super().close(cycle)
+
+
+class ChromeTrace(PipelineTrace):
+    """
+    This class writes Chrome trace-event JSON, read by chrome://tracing and
+    Perfetto.  One cycle is shown as one microsecond.  Each in-flight
+    instruction gets a lane of its own, reused once it leaves, with one
+    event per stage; squashed instructions' stages are in the "squashed"
+    category.  Lane 0 shows what the issue stage spent each run of cycles on.
+    """
+
+    def __init__(self, fileName):
+        """
+        Constructor for the ChromeTrace class
+
+        @param fileName A string representing the path of the trace to write
+        """
+        super().__init__(fileName)
+        self.outFile.write("[\n")
+        self.event({"name": "thread_name", "ph": "M", "pid": 0, "tid": 0,
+                    "args": {"name": "Issue"}}, first=True)
+        # Current run of cycles with the same issue cause: [cause, start]
+        self.stallRun = None
+
+
+    def event(self, event, first=False):
+        """
+        Writes one trace event
+        """
+        self.outFile.write(("" if first else ",\n") + json.dumps(event, separators=(',', ':')))
+
+
+    def endStage(self, ID, record, cycle, squashed):
+        self.event({"name": STAGES[record[STAGE]], "cat": "squashed" if squashed else "pipeline",
+                    "ph": "X", "ts": record[START], "dur": cycle - record[START],
+                    "pid": 0, "tid": record[LANE], "args": {"id": ID, "instr": record[LABEL]}})
+
+
+    def retire(self, ID, record, cycle):
+        self.endStage(ID, record, cycle + 1, False)
+
+
+    def issueStall(self, cause, cycle):
+        if self.stallRun is not None and self.stallRun[0] == cause:
+            return
+        self.endStallRun(cycle)
+        self.stallRun = [cause, cycle]
+
+
+    def endStallRun(self, cycle):
+        """
+        Writes the current run of issue cycles as one event
+        """
+        if self.stallRun is not None:
+            self.event({"name": self.stallRun[0], "cat": "issue", "ph": "X",
+                        "ts": self.stallRun[1], "dur": cycle - self.stallRun[1],
+                        "pid": 0, "tid": 0})
+
+
+    def close(self, cycle):
+        self.endStallRun(cycle + 1)
+        self.outFile.write("\n]\n")
+        super().close(cycle)
+
+
+def openTrace(fileName, traceFormat):
+    """
+    Creates a pipeline trace writer
+
+    @param fileName A string representing the path of the trace to write
+    @param traceFormat A string, "konata" or "chrome"
+    @return A PipelineTrace instance
+    """
+    if traceFormat == "konata":
+        return KonataTrace(fileName)
+    if traceFormat == "chrome":
+        return ChromeTrace(fileName)
+    raise ValueError(f"Unknown trace format [ {traceFormat} ]")
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    import os
+    import tempfile
+    for traceFormat in ["konata", "chrome"]:
+        fileName = os.path.join(tempfile.gettempdir(), "trace." + traceFormat)
+        myTrace = openTrace(fileName, traceFormat)
+        myTrace.issue(0, 0, ("ADDI", "R1", "R0", 2), 0)
+        myTrace.issueStall("issued", 0)
+        myTrace.issue(1, 1, ("BNE", "R1", "R0", -2), 1)
+        myTrace.issueStall("issued", 1)
+        myTrace.stage(0, 1, 1)
+        myTrace.issue(2, 0, ("ADDI", "R1", "R0", 2), 2)
+        myTrace.issueStall("issued", 2)
+        myTrace.stage(0, 3, 2)
+        myTrace.stage(1, 1, 3)
+        myTrace.issueStall("ROB full", 3)
+        myTrace.stage(0, 4, 3)
+        myTrace.squash(1, 4)
+        myTrace.close(4)
+        print(myTrace.inflight, myTrace.freeLanes)
+        with open(fileName) as inFile:
+            contents = inFile.read()
+        print(contents)
+        os.remove(fileName)
+        if traceFormat == "konata":
+            # Every stage ended, Ex and Wb included, must have been started
+            started = set()
+            unmatched = []
+            for line in contents.splitlines():
+                fields = line.split("\t")
+                if fields[0] == "S":
+                    started.add((fields[1], fields[3]))
+                elif fields[0] == "E" and (fields[1], fields[3]) not in started:
+                    unmatched.append(line)
+            print(f"Stages ended without a start: {unmatched}")
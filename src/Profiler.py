@@ -0,0 +1,140 @@
+# @file         Profiler.py
+# @authors      Stephen
+
+import cProfile
+from time import perf_counter_ns
+
+class Profiler:
+    """
+    This helper class measures where the simulator itself spends host time.
+
+    Each pipeline stage method is replaced by a wrapper which counts its
+    calls and adds up the nanoseconds spent in it.  Nothing is wrapped unless
+    profiling is asked for, so normal runs pay nothing.
+
+    Optionally the whole run is also recorded with cProfile, and the stage
+    timings are written as folded stacks, one "frame;frame count" line per
+    stage, which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, useCProfile=False):
+        """
+        Constructor for the Profiler class
+
+        @param useCProfile An optional boolean, True to also record the run
+        with cProfile
+        """
+        self.calls = {}
+        self.nanoseconds = {}
+        self.wallTime = 0
+        self.startTime = None
+        self.profile = cProfile.Profile() if useCProfile else None
+
+
+    def wrap(self, name, function):
+        """
+        Given a stage method, returns a version of it which is timed
+
+        @param name A string naming the stage in the report
+        @param function The bound method to time
+        @return A function taking the same arguments as the method
+        """
+        self.calls[name] = 0
+        self.nanoseconds[name] = 0
+        calls = self.calls
+        nanoseconds = self.nanoseconds
+
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                nanoseconds[name] += perf_counter_ns() - start
+                calls[name] += 1
+        return timed
+
+
+    def start(self):
+        """
+        Starts the wall clock, and cProfile if enabled
+        """
+        if self.profile is not None:
+            self.profile.enable()
+        self.startTime = perf_counter_ns()
+
+
+    def stop(self):
+        """
+        Stops the wall clock, and cProfile if enabled
+        """
+        self.wallTime += perf_counter_ns() - self.startTime
+        if self.profile is not None:
+            self.profile.disable()
+
+
+    def getStats(self, cycles, instructions):
+        """
+        Getter for the stage timings and overall simulation speed
+
+        @param cycles An integer representing the simulated cycles
+        @param instructions An integer representing the committed instructions
+        @return A dictionary of per-stage calls and nanoseconds, the wall time,
+        simulated cycles per second and host nanoseconds per instruction
+        """
+        stages = {}
+        for name in self.calls:
+            stages[name] = {"calls": self.calls[name],
+                            "nanoseconds": self.nanoseconds[name],
+                            "share": self.nanoseconds[name] / self.wallTime if self.wallTime > 0 else 0.0}
+        return {"stages": stages,
+                "wallNanoseconds": self.wallTime,
+                "cyclesPerSecond": 1e9 * cycles / self.wallTime if self.wallTime > 0 else 0.0,
+                "nanosecondsPerInstruction": self.wallTime / instructions if instructions > 0 else 0.0}
+
+
+    def dumpStats(self, cycles, instructions):
+        """
+        Pretty-prints the stage timings, slowest first
+
+        @param cycles An integer representing the simulated cycles
+        @param instructions An integer representing the committed instructions
+        """
+        stats = self.getStats(cycles, instructions)
+        print("Simulator Profile".ljust(48, '=').rjust(80,'='))
+        print("Stage".ljust(28, ' ') + "Calls\tTotal ms\tns/call\tShare")
+        for name, stage in sorted(stats["stages"].items(), key=lambda x: -x[1]["nanoseconds"]):
+            perCall = stage["nanoseconds"] // stage["calls"] if stage["calls"] > 0 else 0
+            print(f"{name.ljust(28, ' ')}{stage['calls']}\t{stage['nanoseconds']/1e6:.3f}\t\t{perCall}\t{100*stage['share']:.1f}%")
+        print(f"Wall time:\t\t\t{stats['wallNanoseconds']/1e6:.3f} ms")
+        print(f"Simulated cycles/s:\t\t{stats['cyclesPerSecond']:.1f}")
+        print(f"Host ns per instruction:\t{stats['nanosecondsPerInstruction']:.0f}")
+        print()
+
+
+    def write(self, fileName):
+        """
+        Writes the cProfile statistics to the given file, and the stage
+        timings as folded stacks to the same name with ".folded" appended
+
+        @param fileName A string representing the path to write
+        @return None
+        """
+        if self.profile is not None:
+            self.profile.dump_stats(fileName)
+        with open(fileName + ".folded", 'w') as foldedFile:
+            other = self.wallTime - sum(self.nanoseconds.values())
+            for name, nanoseconds in self.nanoseconds.items():
+                foldedFile.write(f"runSimulation;{name} {nanoseconds}\n")
+            foldedFile.write(f"runSimulation {max(other, 0)}\n")
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    myProfiler = Profiler()
+    busyWork = myProfiler.wrap("busyWork", lambda n: sum(range(n)))
+    myProfiler.start()
+    for i in range(100):
+        busyWork(1000)
+    myProfiler.stop()
+    print(myProfiler.calls, myProfiler.nanoseconds["busyWork"] <= myProfiler.wallTime)
+    myProfiler.dumpStats(100, 50)
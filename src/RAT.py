@@ -62,6 +62,35 @@ class RAT():
         return dict(self.reg)
 
 
+    def getCheckpoint(self):
+        """
+        Getter for a compact copy of the RAT's internal state, for use by the
+        branch unit
+
+        @return A dictionary holding only the registers which are currently
+        renamed, mapped to the ROB entries they point to
+        """
+        return {k: v for k, v in self.reg.items() if k != v}
+
+
+    def restore(self, checkpoint):
+        """
+        Restores the RAT from a compact checkpoint
+
+        @param checkpoint A dictionary as returned by getCheckpoint()
+        @return None
+        """
+        self.reset()
+        self.reg.update(checkpoint)
+
+
+    def reset(self):
+        """
+        Points every register back at the ARF
+        """
+        self.reg = dict(zip(self.names, self.names))
+
+
     def dump(self):
         """
         Pretty-prints the RAT contents
@@ -6,6 +6,7 @@ ID = 0
 DEST = 1
 VALUE = 2
 DONEFLAG = 3
+WRITESREG = 4
 
 class ROB():
     """
@@ -17,28 +18,33 @@ class ROB():
     enforce ordering by our head and tail counters.
 
     The internal data structure is a list of this format:
-    [< instr. ID>, <ARF destination>, <value>, <complete flag>, <stale flag>]
+    [< instr. ID>, <ARF destination>, <value>, <complete flag>, <writes register flag>]
 
     In order to avoid complications with the circular queue, we initialize with
-    a dummy entry marked as stale.
+    dummy entries marked as complete, and count the entries in flight so that
+    full and empty can be told apart when the head meets the tail.
+
+    When renaming to a physical register file, results live in the register
+    file instead, and the value field of a register-writing entry holds the
+    name of its physical register.  The ROB then carries only the mapping,
+    and that name takes the place of the ROB entry name as its tag.
     """
-    def __init__(self,size):
+    def __init__(self, size, physical=False):
         if size < 1:
             raise IndexError(f"ROB initialized with invalid size {size}")
-        self.q = [ [-1, "", None, True] for x in range(size)]
+        self.q = [ [-1, "", None, True, False] for x in range(size)]
         self.size = size
+        self.physical = physical
         self.head = 0
         self.tail = 0
+        self.entries = 0
 
 
     def isFull(self):
         """
         Determines if the ROB is full.
-
-        In this case, full means the head and tail both point to an instruction
-        which is not complete.
         """
-        return self.head == self.tail and not self.q[self.head][DONEFLAG]
+        return self.entries == self.size
 
     def findAndUpdateEntry(self, entryID, value):
         """
@@ -64,7 +70,24 @@ class ROB():
         return found, name
 
 
-    def add(self, entryID, destination):
+    def complete(self, entryID):
+        """
+        Searches the ROB entries for the instruction with the given ID and
+        marks it as complete, leaving its value field alone.  Used when the
+        result is written to a physical register instead.
+
+        @param entryID An integer representing the instruction entry to find
+        @return A tuple (destination, physical register name) if found,
+        (None, None) otherwise
+        """
+        for entry in self.q:
+            if entry[ID] == entryID:
+                entry[DONEFLAG] = True
+                return entry[DEST], entry[VALUE]
+        return None, None
+
+
+    def add(self, entryID, destination, writesRegister=True, tag=None):
         """
         Adds an entry to the ROB given an instruction ID and destination
         register.
@@ -72,6 +95,10 @@ class ROB():
         @param entryID An integer representing the instruction ID
         @param destination A string representing the destination register in
         the ARF
+        @param writesRegister An optional boolean, False for instructions
+        such as branches and stores which do not rename their destination
+        @param tag An optional string representing the physical register
+        the entry writes, kept in its value field
         @return A string representing the name of the ROB entry created
 
         Raises IndexError exception if the ROB is considered full
@@ -80,11 +107,12 @@ class ROB():
         if self.isFull():
             raise IndexError("The ROB is full!")
         else:
-            self.q[self.tail] = [entryID, destination, None, False]
+            self.q[self.tail] = [entryID, destination, tag, False, writesRegister]
             ret = f"ROB{self.tail}"
             self.tail += 1
             if self.tail == self.size:
                 self.tail = 0
+            self.entries += 1
             return ret
 
 
@@ -94,7 +122,7 @@ class ROB():
 
         @return The ID of the oldest instruction, or None if it is not ready
         """
-        if self.q[self.head][DONEFLAG] and self.head != self.tail:
+        if self.entries > 0 and self.q[self.head][DONEFLAG]:
             return self.q[self.head][ID]
 
         return None
@@ -107,43 +135,109 @@ class ROB():
         @return A copy of the ROB entry as a tuple: (ID, destination, value,
         doneflag, ROB#)
         """
-        retVal = list(self.q[self.head].copy())
+        retVal = self.q[self.head][:WRITESREG]
         retVal.append(self.head)
         print(f"ROB HAS IN COMMIT: {retVal}")
 
         self.head += 1
         if self.head == self.size:
             self.head = 0
+        self.entries -= 1
 
         return tuple(retVal)
 
 
-    def purgeAfterMispredict(self, branchID):
+    def count(self):
+        """
+        Getter for the number of entries currently in flight
+        """
+        return self.entries
+
+
+    def walk(self, stopID):
+        """
+        Walks the ROB from the oldest entry up to and including the given
+        instruction, reporting the register mappings those entries establish.
+
+        @param stopID An integer representing the last instruction to visit,
+        entries younger than it are not visited
+        @return A list of tuples (ARF destination, ROB entry name or
+        physical register), oldest first, for every visited entry which
+        writes a register
+
+        Replaying these mappings over an identity RAT rebuilds the RAT state
+        as it was just after stopID was issued.
+        """
+        mappings = []
+        for i in range(self.count()):
+            pos = (self.head + i) % self.size
+            entry = self.q[pos]
+            if entry[ID] > stopID:
+                break
+            if entry[WRITESREG]:
+                mappings.append((entry[DEST], entry[VALUE] if self.physical else f"ROB{pos}"))
+        return mappings
+
+
+    def tagsAfter(self, stopID):
+        """
+        Lists the physical registers written by the entries younger than the
+        given instruction, to free them before those entries are cleared
+
+        @param stopID An integer representing the last instruction to keep
+        @return A list of strings representing physical register names
+        """
+        tags = []
+        for i in range(self.count()):
+            entry = self.q[(self.head + i) % self.size]
+            if entry[ID] > stopID and entry[WRITESREG]:
+                tags.append(entry[VALUE])
+        return tags
+
+
+    def find(self, entryID):
+        """
+        Searches the in-flight ROB entries for the instruction with the given ID
+
+        @param entryID An integer representing the instruction entry to find
+        @return A string representing the ROB entry name, None if not found
         """
-        Given the instruction ID of a mispredicted branch, clears all entries
+        for i in range(self.entries):
+            pos = (self.head + i) % self.size
+            if self.q[pos][ID] == entryID:
+                return f"ROB{pos}"
+        return None
+
+
+    def purgeAfterMispredict(self, branchName):
+        """
+        Given the ROB entry of a mispredicted branch, clears all entries
         which came after that branch.
 
-        @param branchID An integer representing the mispredicted branch instruction
+        @param branchName A string representing the ROB entry of the
+        mispredicted branch instruction
 
         Note: since the internal queue is circular, removing entries is as
-        simple as setting their DONEFLAG entry to True and backing up the tail
-        pointer
+        simple as backing up the tail pointer to just after the branch.  The
+        stale entries are overwritten as new instructions are added.
         """
         print("CLEANING ROB...")
-        print(f"SEARCHING FOR ID {ID}...")
-        branchPos = self.head
-        while self.q[branchPos][ID] != branchID:
-            print(f"CHECKING {self.q[branchPos][ID]}...")
-            branchPos += 1
-            assert(branchPos != self.tail)
+        branchPos = int(branchName[3:])
+        self.tail = (branchPos + 1) % self.size
+        self.entries = (branchPos - self.head) % self.size + 1
 
-        pos = branchPos + 1
 
-        while pos < self.tail:
-            self.q[pos][DONEFLAG] = True
-            pos += 1
+    def purgeFrom(self, name):
+        """
+        Given a ROB entry, clears that entry and all entries which came after
+        it, as when a load is replayed after a memory ordering violation.
 
-        self.tail = branchPos + 1
+        @param name A string representing the oldest ROB entry to clear
+        """
+        print("CLEANING ROB...")
+        pos = int(name[3:])
+        self.tail = pos
+        self.entries = (pos - self.head) % self.size
 
 
     def dump(self):
@@ -203,4 +297,13 @@ if __name__ == "__main__":
         myRob.commit()
         myRob.dump()
 
+    # Testing with results held in physical registers
+    myRob = ROB(4, physical=True)
+    myRob.add(1, "R1", tag="P64")
+    myRob.add(2, "R2", writesRegister=False)
+    myRob.add(3, "R1", tag="P65")
+    print(myRob.complete(3))
+    print(myRob.walk(2), myRob.tagsAfter(1))
+    myRob.dump()
+
 
@@ -16,26 +16,42 @@ class ReservationStation:
     This class implements a generic reservation station
     """
 
-    def __init__(self, size, name):
+    def __init__(self, size, name, squashed=None):
         """
         Constructor for the RS class
 
         @param size An integer representing the maximum amount of entries for
         this reservation station
         @param name A string used to identify this RS in the dump() output
+        @param squashed An optional function which, given an instruction ID,
+        returns True if that instruction was squashed by a misprediction
         """
         self.size = size
         self.name = name
         self.q = []
+        self.squashed = squashed if squashed is not None else (lambda ID: False)
 
 
     def isFull(self):
         """
         Getter to determine if the RS can accept new entries
+
+        Squashed entries are only dropped here, when they would otherwise
+        cause a structural stall.
         """
+        if len(self.q) == self.size:
+            self.dropSquashed()
         return len(self.q) == self.size
 
 
+    def dropSquashed(self):
+        """
+        Removes any entries whose instructions were squashed
+        """
+        if any(self.squashed(entry[ID]) for entry in self.q):
+            self.q = [ entry for entry in self.q if not self.squashed(entry[ID]) ]
+
+
     def add(self, instructionID, dest, op, Qi, Qj, Vi, Vj):
         """
         Adds a new entry to the end of the RS
@@ -87,19 +103,6 @@ class ReservationStation:
                 return True
         return False
 
-    def purgeAfterMispredict(self, instructionID):
-        """
-        Given an instruction ID, removes all entries with newer instruction
-        IDs (greater in value, since they are strictly increasing)
-
-        @param instructionID An integer representing the mispredicted branch
-        instruction ID
-        @return None
-        """
-        dead = [ i for i, entry in enumerate(self.q) if entry[ID] > instructionID  ]
-        self.q = [ entry for i, entry in enumerate(self.q) if not i in dead ]
-
-
     def update(self, tag, value):
         """
         Given a tag and a value, updates the value operand of any entries with
@@ -0,0 +1,153 @@
+# @file         RetireLog.py
+# @authors      Stephen
+
+import tempfile
+from array import array
+
+# Fields per record: the instruction ID, then the cycle of each of issue,
+# execute, memory, writeback and commit
+RECORD_FIELDS = 6
+
+# Stored in place of a stage the instruction never went through
+NOT_REACHED = -1
+
+# Supported log formats
+FORMATS = ["binary", "csv", "text"]
+
+class RetireLog:
+    """
+    This class streams the stage timings of committed instructions to disk.
+
+    Records are gathered in an array and written out a block at a time, so
+    memory stays flat however many instructions commit.  The formats are:
+
+        binary  <RECORD_FIELDS> native-endian 64 bit integers per record,
+                with -1 for stages never reached
+        csv     a header line, then one comma separated record per line,
+                with empty fields for stages never reached
+        text    the rows of the Instruction Completion Table
+
+    Without a file name the log goes to an anonymous temporary file which is
+    deleted once closed.
+    """
+
+    def __init__(self, fileName="", logFormat="binary", blockRecords=4096):
+        """
+        Constructor for the RetireLog class
+
+        @param fileName An optional string representing the path to write, ""
+        for a temporary file
+        @param logFormat An optional string, one of FORMATS
+        @param blockRecords An optional integer representing the records
+        gathered before they are written out
+        """
+        if logFormat not in FORMATS:
+            raise ValueError(f"Unknown retirement log format [ {logFormat} ]")
+        self.logFormat = logFormat
+        self.blockRecords = blockRecords
+        self.buffer = array('q')
+        self.records = 0
+        mode = "w+b" if logFormat == "binary" else "w+"
+        if fileName:
+            self.logFile = open(fileName, mode)
+        else:
+            self.logFile = tempfile.TemporaryFile(mode)
+        if logFormat == "csv":
+            self.logFile.write("ID,IS,EX,MEM,WB,COM\n")
+
+
+    def append(self, ID, stages):
+        """
+        Adds the record of a committed instruction
+
+        @param ID An integer representing the instruction
+        @param stages A list of the cycle of each stage, None for stages never
+        reached
+        @return None
+        """
+        self.buffer.append(ID)
+        self.buffer.extend(NOT_REACHED if x is None else x for x in stages)
+        self.records += 1
+        if len(self.buffer) >= self.blockRecords * RECORD_FIELDS:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Writes out the gathered records
+        """
+        if self.logFormat == "binary":
+            self.buffer.tofile(self.logFile)
+        else:
+            lines = []
+            for i in range(0, len(self.buffer), RECORD_FIELDS):
+                record = [None if x == NOT_REACHED else x for x in self.buffer[i:i + RECORD_FIELDS]]
+                if self.logFormat == "csv":
+                    lines.append(",".join("" if x is None else str(x) for x in record))
+                else:
+                    lines.append(f"{record[0]}\t| {record[1]}\t\t {record[2]}\t\t {record[3]}\t\t {record[4]}\t\t {record[5]}")
+            if lines:
+                self.logFile.write("\n".join(lines) + "\n")
+        self.buffer = array('q')
+        self.logFile.flush()
+
+
+    def read(self):
+        """
+        Reads every record back, oldest first, a block at a time
+
+        @return A generator of (ID, stages) tuples, with None for stages
+        never reached
+        """
+        self.flush()
+        self.logFile.seek(0)
+        if self.logFormat == "binary":
+            while True:
+                block = array('q')
+                data = self.logFile.read(self.blockRecords * RECORD_FIELDS * block.itemsize)
+                if not data:
+                    break
+                block.frombytes(data)
+                for i in range(0, len(block), RECORD_FIELDS):
+                    yield block[i], [None if x == NOT_REACHED else x for x in block[i + 1:i + RECORD_FIELDS]]
+        else:
+            if self.logFormat == "csv":
+                self.logFile.readline()
+            for line in self.logFile:
+                if self.logFormat == "csv":
+                    fields = line.strip().split(",")
+                else:
+                    ID, stages = line.split("|")
+                    fields = [ID.strip()] + stages.split()
+                record = [None if x in ("", "None") else int(x) for x in fields]
+                yield record[0], record[1:]
+        self.logFile.seek(0, 2)
+
+
+    def close(self):
+        """
+        Writes out any gathered records and closes the file
+        """
+        self.flush()
+        self.logFile.close()
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    import os
+    for logFormat in FORMATS:
+        fileName = os.path.join(tempfile.gettempdir(), "retire." + logFormat)
+        myLog = RetireLog(fileName, logFormat, blockRecords=2)
+        myLog.append(0, [0, 1, None, 2, 3])
+        myLog.append(1, [1, 3, 4, 5, 6])
+        myLog.append(3, [3, 4, None, None, 7])
+        print(logFormat, myLog.records, list(myLog.read()))
+        myLog.append(4, [4, 5, None, 6, 8])
+        print(list(myLog.read())[-1])
+        myLog.close()
+        print(os.path.getsize(fileName))
+        os.remove(fileName)
+    myLog = RetireLog()
+    myLog.append(0, [0, None, None, None, 1])
+    print(list(myLog.read()))
+    myLog.close()
@@ -0,0 +1,108 @@
+# @file         SelectPolicy.py
+# @authors      Stephen
+
+import random
+
+# Private constants for readability of RS entries
+ID = 0
+DEST = 1
+OPERATION = 2
+
+# Supported policies
+POLICIES = ["oldest", "latency", "dependents", "critical", "random"]
+
+class SelectPolicy:
+    """
+    This class decides which ready instructions of a class of functional
+    units start first when there are more of them than free units.
+
+        oldest      lowest instruction ID first.  IDs are handed out in
+                    program order, so comparing them answers what an age
+                    matrix would without keeping one.
+        latency     longest latency operation first
+        dependents  most instructions waiting on the result first
+        critical    longest chain of dependent latencies first
+        random      a seeded random order, as a baseline
+
+    Ties are broken oldest first.  The dependents and critical policies look
+    at a consumer graph mapping each ROB tag to the instructions waiting on
+    it, as a list of (latency, tag of their own result or None).
+    """
+
+    def __init__(self, policy="oldest", seed=0):
+        """
+        Constructor for the SelectPolicy class
+
+        @param policy An optional string, one of POLICIES
+        @param seed An optional integer seeding the random policy
+
+        Raises ValueError on an unknown policy
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown select policy [ {policy} ]")
+        self.policy = policy
+        self.random = random.Random(seed)
+        # Only these policies need the consumer graph built each cycle
+        self.needsGraph = policy in ("dependents", "critical")
+
+
+    def order(self, ready, latency, graph=None):
+        """
+        Orders ready RS entries by priority
+
+        @param ready A list of ready RS entries
+        @param latency A dictionary mapping each operation to its latency
+        @param graph A dictionary mapping ROB tags to their consumers, needed
+        by the dependents and critical policies
+        @return A new list of the entries, highest priority first
+        """
+        if len(ready) < 2:
+            return list(ready)
+        if self.policy == "oldest":
+            return sorted(ready, key=lambda x: x[ID])
+        if self.policy == "latency":
+            return sorted(ready, key=lambda x: (-latency.get(x[OPERATION], 0), x[ID]))
+        if self.policy == "dependents":
+            return sorted(ready, key=lambda x: (-len(graph.get(x[DEST], [])), x[ID]))
+        if self.policy == "critical":
+            memo = {}
+            return sorted(ready, key=lambda x: (-(latency.get(x[OPERATION], 0) +
+                                                  pathLength(x[DEST], graph, memo)), x[ID]))
+        shuffled = list(ready)
+        self.random.shuffle(shuffled)
+        return shuffled
+
+
+def pathLength(tag, graph, memo):
+    """
+    Computes the longest chain of latencies waiting on a result
+
+    @param tag A string representing the ROB tag of the result
+    @param graph A dictionary mapping ROB tags to lists of (latency, tag)
+    @param memo A dictionary of lengths already computed
+    @return An integer representing the cycles of the longest chain
+    """
+    if tag in memo:
+        return memo[tag]
+    memo[tag] = 0
+    longest = 0
+    for latency, dest in graph.get(tag, []):
+        longest = max(longest, latency + (pathLength(dest, graph, memo) if dest is not None else 0))
+    memo[tag] = longest
+    return longest
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    latency = {"ADD.D": 3, "MULT.D": 20}
+    # ROB1 feeds a chain of two multiplies, ROB2 feeds three adds
+    ready = [[1, "ROB1", "ADD.D"], [2, "ROB2", "ADD.D"], [3, "ROB3", "MULT.D"]]
+    graph = {"ROB1": [(20, "ROB4")], "ROB4": [(20, None)],
+             "ROB2": [(3, None), (3, None), (3, "ROB5")], "ROB5": [(3, None)]}
+    for policy in POLICIES:
+        mySelect = SelectPolicy(policy, seed=1)
+        print(policy, [x[ID] for x in mySelect.order(ready, latency, graph)])
+    try:
+        SelectPolicy("youngest")
+    except ValueError as e:
+        print(e)
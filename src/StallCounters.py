@@ -0,0 +1,125 @@
+# @file         StallCounters.py
+# @authors      Stephen
+
+# Local constants for the issue causes, one of which is recorded per cycle
+ISSUED = "issued"
+ROB_FULL = "ROB full"
+ROB_FULL_MEM = "ROB full (memory at head)"
+LDSTQ_FULL = "LdStQ full"
+BRANCH_LIMIT = "branch checkpoints full"
+PRF_FULL = "physical registers full"
+RECOVERY = "mispredict recovery"
+ICACHE = "I-cache miss"
+FETCH = "fetch bandwidth"
+DRAIN = "drain"
+
+class StallCounters:
+    """
+    This helper class attributes every cycle to a cause.
+
+    Each pipeline stage records what it did, or why it could not, under its
+    own name.  The issue stage records exactly one cause per cycle, and
+    since one instruction issues per cycle these issue slots are split into
+    a top-down breakdown:
+
+        Retiring         slots issuing an instruction which later committed
+        Bad speculation  slots issuing a squashed instruction, or idle while
+                         fetch recovered from a mispredict or replay
+        Frontend bound   slots idle because fetch supplied nothing
+        Backend bound    slots blocked by a full ROB, RS, LdStQ or physical
+                         register file, or by the branch checkpoint
+                         limit, split into memory bound (LdStQ full, or
+                         ROB full behind a load or store) and core bound
+
+    Slots after the last instruction has issued count as backend bound,
+    since the machine is only waiting for the back end to drain.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the StallCounters class
+        """
+        self.counts = {}
+        # The cause each stage recorded most recently
+        self.last = {}
+
+
+    def add(self, stage, cause, amount=1):
+        """
+        Records that a stage spent a cycle, or an event, on a cause
+
+        @param stage A string naming the pipeline stage
+        @param cause A string naming the cause
+        @param amount An optional integer to add, 1 by default
+        @return None
+        """
+        causes = self.counts.setdefault(stage, {})
+        causes[cause] = causes.get(cause, 0) + amount
+        self.last[stage] = cause
+
+
+    def get(self, stage, cause):
+        """
+        Getter for a single counter
+
+        @return An integer, 0 if the cause was never recorded
+        """
+        return self.counts.get(stage, {}).get(cause, 0)
+
+
+    def topDown(self, squashedIssued):
+        """
+        Computes the top-down breakdown of the issue slots
+
+        @param squashedIssued An integer representing how many issued
+        instructions were later squashed
+        @return A dictionary mapping each category to its number of slots
+        """
+        issue = self.counts.get("issue", {})
+        slots = sum(issue.values())
+        memory = self.get("issue", LDSTQ_FULL) + self.get("issue", ROB_FULL_MEM)
+        frontend = self.get("issue", ICACHE) + self.get("issue", FETCH)
+        badSpeculation = squashedIssued + self.get("issue", RECOVERY)
+        retiring = self.get("issue", ISSUED) - squashedIssued
+        backend = slots - retiring - badSpeculation - frontend
+        return {"slots": slots, "retiring": retiring, "badSpeculation": badSpeculation,
+                "frontend": frontend, "backend": backend, "memory": memory,
+                "core": backend - memory}
+
+
+    def dumpStats(self, squashedIssued):
+        """
+        Pretty-prints every counter by stage, then the top-down breakdown
+
+        @param squashedIssued An integer representing how many issued
+        instructions were later squashed
+        """
+        print("Stall Cycles".ljust(48, '=').rjust(80,'='))
+        for stage, causes in self.counts.items():
+            print(f"{stage}:")
+            for cause, count in sorted(causes.items(), key=lambda x: -x[1]):
+                print(f"\t{cause.ljust(40, ' ')}{count}")
+        print()
+
+        breakdown = self.topDown(squashedIssued)
+        slots = max(breakdown["slots"], 1)
+        print("Top-down".ljust(48, '=').rjust(80,'='))
+        for label, key in [("Retiring", "retiring"),
+                           ("Bad speculation", "badSpeculation"),
+                           ("Frontend bound", "frontend"),
+                           ("Backend bound", "backend"),
+                           ("  Memory bound", "memory"),
+                           ("  Core bound", "core")]:
+            print(f"{label.ljust(20, ' ')}{breakdown[key]}\t{100*breakdown[key]/slots:.1f}%")
+        print()
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    myCounters = StallCounters()
+    for cause in [ISSUED, ISSUED, ROB_FULL, ISSUED, RECOVERY, LDSTQ_FULL, ICACHE, DRAIN]:
+        myCounters.add("issue", cause)
+    myCounters.add("writeback", "CDB conflict", 2)
+    print(myCounters.get("issue", ISSUED), myCounters.get("commit", "store blocked"))
+    print(myCounters.topDown(1))
+    myCounters.dumpStats(1)
@@ -0,0 +1,141 @@
+# @file         StoreSets.py
+# @authors      Stephen
+
+class StoreSets:
+    """
+    This helper class implements a store-set memory dependence predictor.
+
+    Loads are allowed to go to memory before older stores have computed their
+    addresses.  When that turns out to be wrong, the load and the store are
+    placed in the same store set, and from then on the load waits for the
+    most recent in-flight store of its set instead of speculating.
+
+    The store set ID table (SSIT) is indexed by the PC of the load or store
+    and holds a store set ID, or None.  The last fetched store table (LFST)
+    maps a store set ID to the instruction ID of the youngest store of that
+    set which is still in flight.
+    """
+
+    def __init__(self, entries=16):
+        """
+        Constructor for the StoreSets class
+
+        @param entries An optional integer representing the number of entries
+        in the store set ID table
+        """
+        if entries < 1:
+            raise ValueError(f"SSIT initialized with invalid size {entries}")
+        self.entries = entries
+        self.SSIT = [None] * entries
+        self.LFST = {}
+        self.nextSet = 0
+
+
+    def index(self, PC):
+        """
+        Given a PC, returns the SSIT index it maps to
+
+        @param PC A non-negative integer representing the word address of the
+        load or store instruction
+        @return An integer representing the SSIT index
+        """
+        return PC % self.entries
+
+
+    def addStore(self, PC, ID):
+        """
+        Records a newly issued store as the youngest of its store set
+
+        @param PC An integer representing the word address of the store
+        @param ID An integer representing the store instruction
+        @return None
+        """
+        storeSet = self.SSIT[self.index(PC)]
+        if storeSet is not None:
+            self.LFST[storeSet] = ID
+
+
+    def removeStore(self, PC, ID):
+        """
+        Clears a store from the LFST once its address is known
+
+        @param PC An integer representing the word address of the store
+        @param ID An integer representing the store instruction
+        @return None
+        """
+        storeSet = self.SSIT[self.index(PC)]
+        if storeSet is not None and self.LFST.get(storeSet) == ID:
+            del self.LFST[storeSet]
+
+
+    def dependence(self, PC):
+        """
+        Given the PC of a newly issued load, returns the store it should wait
+        for
+
+        @param PC An integer representing the word address of the load
+        @return An integer representing the store instruction ID to wait for,
+        or None if the load may issue speculatively
+        """
+        storeSet = self.SSIT[self.index(PC)]
+        if storeSet is None:
+            return None
+        return self.LFST.get(storeSet)
+
+
+    def train(self, loadPC, storePC):
+        """
+        Places a load and a store in the same store set after a memory
+        ordering violation between them
+
+        @param loadPC An integer representing the word address of the load
+        @param storePC An integer representing the word address of the store
+        @return None
+
+        If neither has a set a new one is allocated, if one has a set the
+        other joins it, and if both have sets they both take the smaller ID.
+        """
+        loadIdx = self.index(loadPC)
+        storeIdx = self.index(storePC)
+        loadSet = self.SSIT[loadIdx]
+        storeSet = self.SSIT[storeIdx]
+        if loadSet is None and storeSet is None:
+            newSet = self.nextSet
+            self.nextSet += 1
+        elif loadSet is None:
+            newSet = storeSet
+        elif storeSet is None:
+            newSet = loadSet
+        else:
+            newSet = min(loadSet, storeSet)
+        self.SSIT[loadIdx] = newSet
+        self.SSIT[storeIdx] = newSet
+
+
+    def dump(self):
+        """
+        Pretty-prints the contents of the predictor
+        """
+        print(f"Store Sets".ljust(48, '=').rjust(80,'='))
+        print("Index\tStore Set")
+        for i, storeSet in enumerate(self.SSIT):
+            if storeSet is not None:
+                print(f"{i}\t{storeSet}")
+        for key, val in self.LFST.items():
+            print(f"Store set {key}: last store {val}")
+        print()
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    mySets = StoreSets(8)
+    mySets.addStore(4, 1)
+    print(mySets.dependence(5))
+    mySets.train(5, 4)
+    mySets.addStore(4, 6)
+    print(mySets.dependence(5))
+    mySets.train(13, 2)
+    mySets.train(13, 4)
+    mySets.dump()
+    mySets.removeStore(4, 6)
+    print(mySets.dependence(5))
@@ -0,0 +1,296 @@
+# @file         TimingTrace.py
+# @authors      Stephen
+
+import hashlib
+from array import array
+
+try:
+    from src.ARF import ARF
+    from src.MemoryUnit import MemoryUnit
+    from src.MemoryBacking import createBacking
+    from src.Operations import OPERATIONS
+except ImportError:
+    # Run directly as a script from within src/
+    from ARF import ARF
+    from MemoryUnit import MemoryUnit
+    from MemoryBacking import createBacking
+    from Operations import OPERATIONS
+
+# A trace starts with a header identifying the program it was recorded from,
+# then holds a flat list of native 64 bit integer triples, one per committed
+# instruction: its PC, its kind, then the byte address of a load or store, 1
+# or 0 for a taken or not taken branch, and 0 otherwise.  The opcode and
+# registers are those of the instruction at the PC, so they are not repeated.
+BRANCHES = ("BNE", "BEQ")
+MAGIC = b"TTRACE01"
+RECORD = 3
+
+# Record kinds
+OTHER = 0
+BRANCH = 1
+MEMORY = 2
+
+
+def recordKind(instr):
+    """
+    Getter for the kind of record an instruction has in a trace
+    """
+    if instr[0] in BRANCHES:
+        return BRANCH
+    if instr[0] == "LD" or instr[0] == "SD":
+        return MEMORY
+    return OTHER
+
+
+def fingerprint(params):
+    """
+    Hashes everything a trace depends on: the program, its initial register
+    and memory data, and the memory options
+
+    @param params A dictionary of the parsed input file and options
+    @return A bytes object representing the SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    for key in ["Instructions", "RegFileInitData", "MemInitData", "MemoryBacking", "MemorySize"]:
+        digest.update(repr((key, params[key])).encode())
+    if params["MemoryImage"]:
+        with open(params["MemoryImage"], 'rb') as imageFile:
+            digest.update(imageFile.read())
+    return digest.digest()
+
+
+def runFunctional(params):
+    """
+    Executes a program architecturally, one instruction after the other,
+    without modelling any timing
+
+    @param params A dictionary of the parsed input file and options
+    @return A generator of (PC, kind, address or outcome or 0) tuples, one
+    per instruction executed
+    """
+    instructions = params["Instructions"]
+    registers = ARF(initVals=params["RegFileInitData"] if len(params["RegFileInitData"]) > 0 else None)
+    memory = MemoryUnit(1, backing=createBacking(params["MemoryBacking"], params["MemorySize"] // 4,
+                                                 params["MemoryImage"]))
+    for byteAddress, value in params["MemInitData"]:
+        memory.mem_write(byteAddress, value)
+
+    PC = 0
+    while PC < len(instructions):
+        instr = instructions[PC]
+        op = instr[0]
+        nextPC = PC + 1
+        extra = 0
+        if op == "LD":
+            extra = int(registers.get(instr[3])) + instr[2]
+            registers.set(instr[1], memory.mem_read(extra))
+        elif op == "SD":
+            extra = int(registers.get(instr[3])) + instr[2]
+            memory.mem_write(extra, float(registers.get(instr[1])))
+        elif op in BRANCHES:
+            taken = OPERATIONS[op](registers.get(instr[1]), registers.get(instr[2]))
+            extra = int(taken)
+            if taken:
+                nextPC = PC + 1 + int(instr[3])
+        else:
+            registers.set(instr[1], OPERATIONS[op](registers.get(instr[2]), registers.get(instr[3])))
+        yield PC, recordKind(instr), extra
+        PC = nextPC
+
+
+def recordTrace(params, fileName, blockRecords=4096):
+    """
+    Runs the functional pass and writes its trace
+
+    @param params A dictionary of the parsed input file and options
+    @param fileName A string representing the path to write
+    @param blockRecords An optional integer representing how many records
+    are buffered between writes
+    @return An integer representing the number of instructions recorded
+    """
+    count = 0
+    block = array('q')
+    with open(fileName, 'wb') as traceFile:
+        traceFile.write(MAGIC + fingerprint(params))
+        for PC, kind, extra in runFunctional(params):
+            block.append(PC)
+            block.append(kind)
+            block.append(extra)
+            count += 1
+            if len(block) >= RECORD * blockRecords:
+                block.tofile(traceFile)
+                block = array('q')
+        block.tofile(traceFile)
+    return count
+
+
+def readTrace(fileName, params):
+    """
+    Reads a trace written by recordTrace()
+
+    @param fileName A string representing the path to read
+    @param params A dictionary of the parsed input file and options the
+    trace is to drive
+    @return An array of the flattened (PC, kind, extra) triples
+
+    Raises ValueError if the trace was recorded from another program, other
+    initial data or other memory options
+    """
+    records = array('q')
+    with open(fileName, 'rb') as traceFile:
+        header = traceFile.read(len(MAGIC) + hashlib.sha256().digest_size)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"[ {fileName} ] is not a timing trace")
+        if header[len(MAGIC):] != fingerprint(params):
+            raise ValueError(f"The timing trace [ {fileName} ] was recorded from another program, "
+                             "initial data or memory options; remove it to record it again")
+        records.frombytes(traceFile.read())
+    return records
+
+
+class TraceDriver:
+    """
+    This class feeds a recorded trace to the timing model in place of the
+    values it would otherwise compute.
+
+    Instructions are matched to the trace in the order they issue, until a
+    branch is predicted against its recorded outcome.  What issues after it
+    is on the wrong path and has no record, so its branches resolve as they
+    were predicted and its loads and stores use their offsets as addresses.
+    Recovering from the mispredict, or replaying a load, moves the trace
+    back to the first record not yet issued on the correct path.
+
+    Every register and memory value in a trace-driven run is 0, so a load or
+    store whose offset is replaced by its recorded address computes that
+    address, and evaluate() gives every result without computing it.
+    """
+
+    def __init__(self, records):
+        """
+        Constructor for the TraceDriver class
+
+        @param records An array of flattened (PC, kind, extra) triples
+        """
+        self.records = records
+        self.cursor = 0
+        self.wrongPath = False
+        # Record index of each correct path instruction in flight, by ID
+        self.indices = {}
+        # Outcome each branch in flight reports when it executes, by ID
+        self.outcomes = {}
+
+
+    def issue(self, ID, PC, instr, predictTaken=None):
+        """
+        Matches an issuing instruction to its record
+
+        @param ID An integer representing the instruction ID
+        @param PC An integer representing the word address of the instruction
+        @param instr A tuple representing the decoded instruction
+        @param predictTaken An optional boolean, the predicted direction of a
+        branch
+        @return An integer representing the recorded byte address of a load
+        or store on the correct path, None otherwise
+
+        Raises ValueError if the record does not match the instruction
+        """
+        if self.wrongPath:
+            if instr[0] in BRANCHES:
+                self.outcomes[ID] = bool(predictTaken)
+            return None
+        index = self.cursor
+        if RECORD * index >= len(self.records) or self.records[RECORD * index] != PC \
+                or self.records[RECORD * index + 1] != recordKind(instr):
+            raise ValueError(f"The timing trace does not match the program at PC [ {PC} ]")
+        self.cursor += 1
+        self.indices[ID] = index
+        extra = self.records[RECORD * index + 2]
+        if instr[0] in BRANCHES:
+            self.outcomes[ID] = bool(extra)
+            self.wrongPath = bool(extra) != bool(predictTaken)
+            return None
+        if instr[0] == "LD" or instr[0] == "SD":
+            return extra
+        return None
+
+
+    def evaluate(self, ID, op, a, b):
+        """
+        Gives the result of an operation without computing it, as the
+        functional units' evaluate function
+        """
+        if op in BRANCHES:
+            return self.outcomes.pop(ID)
+        return 0.0 if op.endswith(".D") else 0
+
+
+    def redirectAfter(self, ID):
+        """
+        Recovers from a mispredicted branch, everything younger than it
+        being squashed
+        """
+        self.cursor = self.indices[ID] + 1
+        self.wrongPath = False
+        self.forgetAfter(ID)
+
+
+    def replay(self, ID):
+        """
+        Recovers from a memory ordering violation, the load and everything
+        younger than it being squashed and fetched again.  A load on the
+        wrong path is fetched again on the wrong path.
+        """
+        if ID in self.indices:
+            self.cursor = self.indices[ID]
+            self.wrongPath = False
+        self.forgetAfter(ID - 1)
+
+
+    def forgetAfter(self, ID):
+        """
+        Drops the records of the instructions younger than the given one
+        """
+        self.indices = {k: v for k, v in self.indices.items() if k <= ID}
+        self.outcomes = {k: v for k, v in self.outcomes.items() if k <= ID}
+
+
+    def retire(self, ID):
+        """
+        Drops the record of a committed instruction
+        """
+        self.indices.pop(ID, None)
+
+
+# Testing, run this script directly to execute
+if __name__ == "__main__":
+    import os
+    import tempfile
+    params = {"Instructions": [("ADDI", "R1", "R0", 2),
+                               ("LD", "F2", 4, "R1"),
+                               ("SD", "F2", 0, "R1"),
+                               ("ADDI", "R1", "R1", -1),
+                               ("BNE", "R1", "R0", -4)],
+              "RegFileInitData": [], "MemInitData": [(4, 1.5), (8, 2.5)],
+              "MemoryBacking": "dense", "MemorySize": 64, "MemoryImage": ""}
+    print(list(runFunctional(params)))
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = os.path.join(directory, "test.trace")
+        print(recordTrace(params, fileName, blockRecords=2))
+        myDriver = TraceDriver(readTrace(fileName, params))
+        # The same path cannot drive another program
+        try:
+            readTrace(fileName, dict(params, MemInitData=[(4, 1.5)]))
+        except ValueError as e:
+            print(e)
+    instructions = params["Instructions"]
+    print([myDriver.issue(ID, ID, instructions[ID]) for ID in range(4)])
+    # Predicting the loop exits early puts what follows on the wrong path
+    print(myDriver.issue(4, 4, instructions[4], False), myDriver.wrongPath)
+    print(myDriver.issue(5, 5, ("LD", "F1", 8, "R0")), myDriver.evaluate(4, "BNE", 0, 0))
+    myDriver.redirectAfter(4)
+    print(myDriver.cursor, myDriver.wrongPath, myDriver.indices)
+    # The next record is the load at PC 1, not an ALU operation
+    try:
+        myDriver.issue(6, 1, ("ADD", "R2", "R2", "R2"))
+    except ValueError as e:
+        print(e)
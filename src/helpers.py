@@ -1,6 +1,109 @@
 # @file:		helpers.py
 # @authors:		Stephen
 
+# Optional hardware parameters and their defaults.  Any of these can be set on
+# an optional line of the input file or on the command line, e.g. BTBEntries=16
+DEFAULT_OPTIONS = {
+    "BTBEntries": 8,
+    "RASEntries": 0,
+    "MaxBranches": 10,
+    "RecoveryMode": "checkpoint",
+    "RenameMode": "rob",
+    "PhysRegs": 0,
+    "MoveElimination": 0,
+    "LoadSpeculation": "storeset",
+    "StoreSetEntries": 16,
+    "MemPorts": 1,
+    "MemBanks": 1,
+    "MemPipelined": 0,
+    "MemBankBusy": 1,
+    "CacheSize": 0,
+    "CacheAssoc": 2,
+    "CacheLineSize": 16,
+    "CacheReplacement": "lru",
+    "CacheHitLatency": 1,
+    "CacheMissPenalty": 0,
+    "CacheMSHRs": 4,
+    "MemorySize": 256,
+    "MemoryBacking": "dense",
+    "MemoryImage": "",
+    "MemoryDump": "",
+    "CoherenceProtocol": "msi",
+    "BusLatency": 2,
+    "FetchWidth": 1,
+    "FetchBuffer": 1,
+    "FetchRedirectPenalty": 0,
+    "LoopBufferSize": 0,
+    "ICacheSize": 0,
+    "ICacheAssoc": 2,
+    "ICacheLineSize": 16,
+    "ICacheMissPenalty": 0,
+    "StatsFile": "",
+    "Profile": 0,
+    "ProfileOutput": "",
+    "Verbose": 1,
+    "TraceFile": "",
+    "TraceFormat": "konata",
+    "RetireLog": "",
+    "RetireLogFormat": "binary",
+    "TimingTrace": "",
+    "FUConfig": "",
+    "UnifiedRS": 0,
+    "UnifiedRSEntries": 0,
+    "SelectPolicy": "oldest",
+    "SelectSeed": 0,
+}
+
+
+def parseValue(raw):
+    """
+    Given a raw string, converts it to an integer or float when possible
+
+    @param raw A string representing the value to convert
+    @return An integer, float, or the stripped string itself
+    """
+    raw = raw.strip()
+    try:
+        return int(raw)
+    except ValueError:
+        pass
+    try:
+        return float(raw)
+    except ValueError:
+        return raw
+
+
+def parseOptions(entries):
+    """
+    Given a list of "Key=Value" strings, parses out the optional hardware
+    parameters
+
+    @param entries A list of strings, each of the form Key=Value
+    @return A dictionary mapping option names to their parsed values
+
+    Raises ValueError on unknown option names
+    """
+    options = {}
+    for entry in entries:
+        key, _, value = entry.partition('=')
+        key = key.strip()
+        if key not in DEFAULT_OPTIONS:
+            raise ValueError(f"Unknown option [ {key} ]")
+        options[key] = parseValue(value)
+    return options
+
+
+def isOptionLine(line):
+    """
+    Determines if an optional input line holds hardware parameters rather
+    than register or memory initialization values
+
+    @param line A string representing a stripped line of the input file
+    @return True if the first entry names a known option, False otherwise
+    """
+    return line.split(',')[0].partition('=')[0].strip() in DEFAULT_OPTIONS
+
+
 def getParameters(inputFileName):
     """
     Given the full path to an input file, parses out the system parameters,
@@ -21,6 +124,7 @@ def getParameters(inputFileName):
         params['LoadStoreUnit'] = [int(x) for x in inFile.readline().split()[2:]]
         params['ROBEntries'] = int(inFile.readline().split()[3])
         params['CDBBufferEntries'] = int(inFile.readline().split()[4])
+        params.update(DEFAULT_OPTIONS)
 
         memInitData = []
         regFileInitData = []
@@ -29,7 +133,10 @@ def getParameters(inputFileName):
         x = inFile.readline().strip()
         while len(x) > 1:   # Handle single newline case 0 -> 1
             data = x.split(',')
-            if data[0][0].upper() == "M":
+            if isOptionLine(x):
+                # Case optional hardware parameters
+                params.update(parseOptions(data))
+            elif data[0][0].upper() == "M":
                 # Case memory initialization inputs
                 for entry in data:
                     temp = entry.split('=')
@@ -116,5 +223,6 @@ if __name__ == "__main__":
     print(parseInstructions(["BNE R1 , R1 ,100", "BEQ R0,R2,-12 ", "BEQ R1, R0, -19"]))
     print(parseInstructions(["ADDI R1 , R1 ,100", "ADDI R0,R2,-12 ", "ADDI R1, R0, -19"]))
     print(parseInstructions(["ADD R1 , R1 ,R0", "SUB.D F0,F2,F22 ", "MULT.D F1, F0, F9"]))
+    print(parseOptions(["BTBEntries=16", " RASEntries = 4"]))
 
 
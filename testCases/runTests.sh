@@ -3,7 +3,7 @@ set -o pipefail
 # Runs all test cases
 echo "Running test suite..."
 
-NUMTESTS=11
+NUMTESTS=12
 TESTSPASSED=0
 
 echo "Simple test 1..."
@@ -189,6 +189,23 @@ else
 fi
 echo
 
+echo "Complex test 8..."
+python3 ../Tomasulo.py complex8.txt >/dev/null 2>&1
+RESULT="$(diff complex8_expected.txt complex8_output.txt | wc -l)"
+if [[ $? -ne 0 ]]
+then
+	echo "FAIL"
+	echo "INCOMPLETE TEST"
+elif [[ $RESULT -ne 0 ]]
+then
+	echo "FAIL"
+	echo $RESULT
+else
+	echo "PASS"
+	TESTSPASSED=$((TESTSPASSED+1))
+fi
+echo
+
 printf "Tests passed: %d / %d (%d %%)" "$TESTSPASSED" "$NUMTESTS" "$((100*TESTSPASSED/NUMTESTS))"
 echo
 